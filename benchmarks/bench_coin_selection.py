@@ -0,0 +1,32 @@
+"""
+Coin selection over large synthetic UTXO sets (wallet with many small and a few large outputs).
+
+    python -m benchmarks.bench_coin_selection
+"""
+import numpy as np
+
+from bitcoinpy.base.coin_selection import UtxoTable, select_coins, INPUT_VSIZES
+from bitcoinpy.base.script_type import ScriptType
+
+
+def synthetic_table(size: int, seed: int = 0) -> UtxoTable:
+    rng = np.random.default_rng(seed)
+    # log-uniform amounts between 1k sat and 10 BTC
+    amounts = (10 ** rng.uniform(3, 9, size)).astype(np.int64)
+    txids = rng.integers(0, 256, (size, 32), dtype=np.uint8)
+    vsizes = rng.choice([INPUT_VSIZES[ScriptType.P2WPKH], INPUT_VSIZES[ScriptType.P2TR], INPUT_VSIZES[ScriptType.P2PKH]], size)
+    return UtxoTable(txids, np.arange(size) % 4, amounts, vsizes)
+
+
+def main():
+    print("{:>8} {:>12} {:>8} {:>14} {:>7} {:>10} {:>10}".format("utxos", "target", "rate", "algorithm", "inputs", "waste", "ms"))
+    for size in [10000, 200000, 500000]:
+        table = synthetic_table(size)
+        for target, fee_rate in [(50000, 2), (3 * 10 ** 7, 15), (5 * 10 ** 9, 40)]:
+            result = select_coins(table, target, fee_rate, seed=1)
+            print("{:>8} {:>12} {:>8} {:>14} {:>7} {:>10} {:>10.1f}".format(
+                size, target, fee_rate, result.algorithm, len(result.indices), result.waste, result.elapsed_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Reproducible BitcoinClient throughput against FakeBitcoind serving the mainnet block fixtures
+(verbose getblock, ~200 KB of JSON each) with 2 ms latency and 4 rpc threads, from 1, 4 and 8 client threads.
+
+    python -m benchmarks.bench_fake_bitcoind
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bitcoinpy.client import BitcoinClient, ConnectionPool
+from bitcoinpy.test_data.fake_bitcoind import FakeBitcoind
+
+
+def main():
+    calls = 300
+    print("{:>8} {:>10} {:>10} {:>14}".format("threads", "ms", "calls/s", "max in flight"))
+    for threads in [1, 4, 8]:
+        with FakeBitcoind(latency=0.002, max_concurrency=4) as server, ConnectionPool(pool_size=threads) as pool:
+            cli = BitcoinClient(server.url, "admin", "0000", pool=pool)
+            heights = [server.chain.start_height + i % 3 for i in range(calls)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as executor:
+                blocks = list(executor.map(cli.get_block_by_height, heights))
+            elapsed = time.perf_counter() - start
+            assert [block["height"] for block in blocks] == heights
+            print("{:>8} {:>10.1f} {:>10.1f} {:>14}".format(threads, elapsed * 1000, calls / elapsed, server.max_in_flight))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Cost of RPC instrumentation: 2000 getblockhash calls against a local stand-in server without and with it,
+and the cost of a single Instrumentation.record().
+
+    python -m benchmarks.bench_instrumentation
+"""
+import time
+
+from bitcoinpy.client import BitcoinClient
+from bitcoinpy.instrumentation import Instrumentation
+from bitcoinpy.test_data.rpc_stub import RpcStubServer
+
+
+def main():
+    count = 2000
+    with RpcStubServer(tip=count) as server:
+        for label, instrumentation in [("disabled", None), ("enabled", Instrumentation())]:
+            with BitcoinClient(server.url, "admin", "0000", instrumentation=instrumentation) as cli:
+                start = time.perf_counter()
+                for height in range(count):
+                    cli.get_block_hash_by_height(height)
+                elapsed = time.perf_counter() - start
+            print("{:>10} {:>8.1f} us/call".format(label, elapsed / count * 10 ** 6))
+
+    instrumentation = Instrumentation()
+    start = time.perf_counter()
+    for i in range(100000):
+        instrumentation.record("getblockhash", 0.5, 80, 120)
+    print("{:>10} {:>8.2f} us/call".format("record()", (time.perf_counter() - start) / 100000 * 10 ** 6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Memory of parsed transaction outputs: TxOut objects (with scripts) vs OutputTable columns,
+and time to reopen the saved table memory-mapped.
+
+    python -m benchmarks.bench_output_table
+"""
+import gc
+import tempfile
+import time
+import tracemalloc
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.output_table import OutputTable
+from bitcoinpy.base.script_type import ScriptType
+from bitcoinpy.test_data.synthetic import build_chain
+
+
+def main():
+    raw_blocks = build_chain(20, 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    tx_outs = [tx_out for raw in raw_blocks for tx in Block.iter_raw_transactions(raw) for tx_out in tx.tx_outs]
+    for tx_out in tx_outs:
+        tx_out.script_pubkey.cmds  # analytics touch the script
+    objects_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tx_outs
+
+    table = OutputTable.from_blocks(raw_blocks)
+    print("outputs: {}".format(len(table)))
+    print("TxOut objects: {:>10.1f} MB (with their transactions)".format(objects_bytes / 2 ** 20))
+    print("OutputTable:   {:>10.1f} MB".format(table.nbytes / 2 ** 20))
+
+    with tempfile.TemporaryDirectory() as directory:
+        table.save(directory)
+        start = time.perf_counter()
+        loaded = OutputTable.load(directory)
+        reopen = time.perf_counter() - start
+        start = time.perf_counter()
+        total = loaded.total(loaded.mask_type(ScriptType.P2WPKH) & loaded.mask_amount(min_amount=15000))
+        query = time.perf_counter() - start
+        print("reopen (mmap): {:>10.2f} ms".format(reopen * 1000))
+        print("filter + sum:  {:>10.2f} ms ({} BTC)".format(query * 1000, total))
+        del loaded
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Fetch and parse 300 synthetic blocks from a local stand-in JSON-RPC server with 5 ms latency per request:
+sequential get_block_by_height + Block.from_raw vs BlockPipeline (fetch threads, parsing in them or in processes).
+Parsing in processes pays off with several cpus; unpickling Blocks in the consumer is part of its cost.
+
+    python -m benchmarks.bench_pipeline
+"""
+import time
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.client import BitcoinClient
+from bitcoinpy.pipeline import BlockPipeline
+from bitcoinpy.test_data.rpc_stub import RpcStubServer
+from bitcoinpy.test_data.synthetic import build_chain
+
+
+def main():
+    count = 300
+    raw_blocks = build_chain(count, 100)
+    with RpcStubServer(raw_blocks=raw_blocks, latency=0.005) as server, BitcoinClient(server.url, "admin", "0000") as cli:
+        start = time.perf_counter()
+        for height in range(count):
+            Block.from_raw(bytes.fromhex(cli.get_block_by_height(height, verbose=0)), height)
+        print("{:>12} {:>10.1f} ms".format("sequential", (time.perf_counter() - start) * 1000))
+
+        # parse_workers=0 parses in the fetch threads; None uses a process per cpu
+        for parse_workers in [0, None]:
+            pipeline = BlockPipeline(cli, batch_size=10, fetch_workers=4, parse_workers=parse_workers)
+            start = time.perf_counter()
+            for _ in pipeline.iter_blocks(0, count):
+                pass
+            print("{:>12} {:>10.1f} ms  {}".format("pipeline", (time.perf_counter() - start) * 1000, pipeline.stats))
+
+
+if __name__ == "__main__":
+    main()
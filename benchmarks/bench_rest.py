@@ -0,0 +1,39 @@
+"""
+Fetch and parse 100 synthetic blocks (1000 transactions each) from a local stand-in server:
+JSON-RPC getblock (verbosity 0, hex in JSON) vs the binary REST endpoint.
+
+    python -m benchmarks.bench_rest
+"""
+import time
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.client import BitcoinClient
+from bitcoinpy.rest_client import RestClient
+from bitcoinpy.test_data.rpc_stub import RpcStubServer
+from bitcoinpy.test_data.synthetic import build_chain
+
+
+def main():
+    count = 100
+    raw_blocks = build_chain(count, 1000)
+    size = sum(len(raw) for raw in raw_blocks)
+    with RpcStubServer(raw_blocks=raw_blocks) as server:
+        block_hashes = server.chain.hashes
+        print("{:>10} {:>12} {:>12} {:>10}".format("mode", "fetch ms", "total ms", "MB/s"))
+        for mode in ["rpc", "rest"]:
+            fetched, parsed = 0.0, 0.0
+            with BitcoinClient(server.url, "admin", "0000") as cli, RestClient(server.url) as rest:
+                for height, block_hash in enumerate(block_hashes):
+                    start = time.perf_counter()
+                    if mode == "rpc":
+                        raw = bytes.fromhex(cli.get_block_by_hash(block_hash, verbose=0))
+                    else:
+                        raw = rest.get_raw_block(block_hash)
+                    fetched += time.perf_counter() - start
+                    Block.from_raw(raw, height)
+                    parsed += time.perf_counter() - start
+            print("{:>10} {:>12.1f} {:>12.1f} {:>10.1f}".format(mode, fetched * 1000, parsed * 1000, size / fetched / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
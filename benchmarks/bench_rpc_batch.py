@@ -0,0 +1,29 @@
+"""
+Range fetch of block hashes and headers against a local stand-in JSON-RPC server:
+one call per item (getblockhash then getblockheader) vs batched JSON-RPC.
+
+    python -m benchmarks.bench_rpc_batch
+"""
+import time
+
+from bitcoinpy.client import BitcoinClient
+from bitcoinpy.test_data.rpc_stub import RpcStubServer
+
+
+def main():
+    count = 2000
+    print("{:>24} {:>10} {:>12}".format("mode", "ms", "round trips"))
+    for mode in ["sequential", "batch"]:
+        with RpcStubServer(tip=count) as server, BitcoinClient(server.url, "admin", "0000") as cli:
+            start = time.perf_counter()
+            if mode == "sequential":
+                headers = [cli.get_block_header_by_height(height) for height in range(count)]
+            else:
+                headers = cli.get_headers(range(count))
+            elapsed = time.perf_counter() - start
+            assert len(headers) == count
+            print("{:>24} {:>10.1f} {:>12}".format(mode, elapsed * 1000, server.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Fetch the same 200 raw blocks three times from a local stand-in JSON-RPC server (2 ms latency per request):
+without cache, then with RpcCache cold, warm (memory) and reopened (disk only);
+one request per block, then batched by get_blocks (the cold cache writes each batch in one transaction).
+
+    python -m benchmarks.bench_rpc_cache
+"""
+import os
+import tempfile
+import time
+
+from bitcoinpy.client import BitcoinClient
+from bitcoinpy.rpc_cache import RpcCache
+from bitcoinpy.test_data.rpc_stub import RpcStubServer
+from bitcoinpy.test_data.synthetic import build_chain
+
+
+def fetch(cli: BitcoinClient, count: int) -> float:
+    start = time.perf_counter()
+    for height in range(count):
+        cli.get_block_by_height(height, verbose=0)
+    return (time.perf_counter() - start) * 1000
+
+
+def fetch_batched(cli: BitcoinClient, count: int) -> float:
+    start = time.perf_counter()
+    cli.get_blocks(range(count), verbose=0, chunk_size=20)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    count = 200
+    # 6 blocks stay below the reorg depth
+    raw_blocks = build_chain(count + 6, 100)
+    for mode, run in [("single", fetch), ("batched", fetch_batched)]:
+        with tempfile.TemporaryDirectory() as directory, RpcStubServer(raw_blocks=raw_blocks, latency=0.002) as server:
+            path = os.path.join(directory, "cache.sqlite")
+            print("{:>8} {:>12} {:>10.1f} ms".format(mode, "no cache", run(BitcoinClient(server.url, "admin", "0000"), count)))
+            with RpcCache(path) as cache:
+                cli = BitcoinClient(server.url, "admin", "0000", cache=cache)
+                print("{:>8} {:>12} {:>10.1f} ms".format(mode, "cold", run(cli, count)))
+                print("{:>8} {:>12} {:>10.1f} ms".format(mode, "memory", run(cli, count)))
+            with RpcCache(path) as cache:
+                cli = BitcoinClient(server.url, "admin", "0000", cache=cache)
+                print("{:>8} {:>12} {:>10.1f} ms".format(mode, "disk", run(cli, count)))
+    print(cache.stats.snapshot(), "raw bytes:", sum(len(raw) for raw in raw_blocks[:count]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+getblockhash round trips against a local stand-in JSON-RPC server:
+module-level requests.post (new connection per call, previous implementation) vs pooled keep-alive sessions.
+
+    python -m benchmarks.bench_rpc_pool
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from bitcoinpy.client import BitcoinClient, ConnectionPool
+from bitcoinpy.test_data.rpc_stub import RpcStubServer
+
+
+def post_per_call(url: str, height: int) -> str:
+    """ previous implementation of BasicClient._request """
+    payload = {"jsonrpc": "1.0", "method": "getblockhash", "params": [height]}
+    return requests.post(url, json=payload, auth=HTTPBasicAuth("admin", "0000")).json()["result"]
+
+
+def run(func, calls: int, threads: int) -> float:
+    start = time.perf_counter()
+    if threads == 1:
+        for height in range(calls):
+            func(height)
+    else:
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(func, range(calls)))
+    return time.perf_counter() - start
+
+
+def main():
+    calls = 2000
+    print("{:>8} {:>22} {:>12} {:>12}".format("threads", "mode", "calls/sec", "connections"))
+    for threads in [1, 8]:
+        for mode in ["requests.post", "pooled"]:
+            with RpcStubServer(tip=calls) as server:
+                if mode == "pooled":
+                    with ConnectionPool(pool_size=threads) as pool:
+                        cli = BitcoinClient(server.url, "admin", "0000", pool=pool)
+                        elapsed = run(cli.get_block_hash_by_height, calls, threads)
+                else:
+                    elapsed = run(lambda height: post_per_call(server.url, height), calls, threads)
+                print("{:>8} {:>22} {:>12.0f} {:>12}".format(threads, mode, calls / elapsed, server.connections))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Per-block parse time and memory with lazily tokenized scripts,
+compared with tokenizing every scriptSig/scriptPubKey at parse time (previous behaviour).
+
+    python -m benchmarks.bench_script
+"""
+import gc
+import time
+import tracemalloc
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.test_data.synthetic import build_chain
+
+
+def tokenize_all(block: Block):
+    for tx in block.transactions:
+        for tx_in in tx.tx_ins:
+            _ = tx_in.script_sig.cmds
+        for tx_out in tx.tx_outs:
+            _ = tx_out.script_pubkey.cmds
+
+
+def parse(raw_block: bytes, eager: bool) -> Block:
+    block = Block.from_raw(raw_block)
+    if eager:
+        tokenize_all(block)
+    return block
+
+
+def measure(raw_block: bytes, eager: bool, repeat: int = 5) -> tuple:
+    elapsed = float("inf")
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parse(raw_block, eager)
+            elapsed = min(elapsed, time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    block = parse(raw_block, eager)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del block
+    return elapsed, retained
+
+
+def main():
+    print("{:>8} {:>8} {:>10} {:>12} {:>12}".format("txs", "segwit", "mode", "parse (ms)", "memory (KB)"))
+    for segwit in [False, True]:
+        raw_block = build_chain(1, 3000, segwit=segwit)[0]
+        for mode, eager in [("eager", True), ("lazy", False)]:
+            elapsed, retained = measure(raw_block, eager)
+            print("{:>8} {:>8} {:>10} {:>12.1f} {:>12.0f}".format(3000, str(segwit), mode, elapsed * 1000, retained / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Serialization of transactions with thousands of inputs:
+repeated "bytes +=" concatenation (previous implementation) vs single pre-sized buffer.
+
+    python -m benchmarks.bench_serialize
+"""
+import time
+
+from bitcoinpy.base.transaction import Transaction
+from bitcoinpy.test_data.synthetic import spend_tx
+from bitcoinpy.utils.varint import encode_varint
+
+
+def concat_serialize(tx: Transaction) -> bytes:
+    """ previous implementation of serialize_legacy """
+    result = tx.version.to_bytes(4, 'little')
+    result += encode_varint(len(tx.tx_ins))
+    for tx_in in tx.tx_ins:
+        item = tx_in.prev_tx[::-1]
+        item += tx_in.prev_index.to_bytes(4, 'little')
+        script = b''
+        for cmd in tx_in.script_sig.cmds:
+            script += cmd.to_bytes(1, 'little') if type(cmd) == int else len(cmd).to_bytes(1, 'little') + cmd
+        item += encode_varint(len(script)) + script
+        item += tx_in.sequence.to_bytes(4, 'little')
+        result += item
+    result += encode_varint(len(tx.tx_outs))
+    for tx_out in tx.tx_outs:
+        script = b''
+        for cmd in tx_out.script_pubkey.cmds:
+            script += cmd.to_bytes(1, 'little') if type(cmd) == int else len(cmd).to_bytes(1, 'little') + cmd
+        result += tx_out.amount.to_bytes(8, 'little') + encode_varint(len(script)) + script
+    result += tx.lock_time.to_bytes(4, 'little')
+    return result
+
+
+def best_of(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print("{:>8} {:>12} {:>14} {:>14}".format("inputs", "bytes", "concat (ms)", "buffer (ms)"))
+    for num_inputs in [1000, 2000, 5000, 10000, 20000]:
+        tx = spend_tx(num_inputs, num_inputs=num_inputs, num_outputs=num_inputs // 10, segwit=False)
+        assert concat_serialize(tx) == tx.serialize_legacy()
+        concat = best_of(lambda: concat_serialize(tx))
+        buffer = best_of(lambda: tx.serialize_legacy())
+        print("{:>8} {:>12} {:>14.2f} {:>14.2f}".format(num_inputs, tx.serialized_size(), concat * 1000, buffer * 1000))
+
+
+if __name__ == "__main__":
+    main()
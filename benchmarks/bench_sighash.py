@@ -0,0 +1,110 @@
+"""
+Signature digests of every input of a consolidation transaction:
+per-input recomputation of the shared hashes (previous implementation) vs per-transaction precomputation.
+The sign + attach loop sets each input's witness or scriptSig right after its digest, which must keep the precomputed parts;
+the digest stands for the signature, since ECDSA/Schnorr signing costs the same per input either way.
+
+    python -m benchmarks.bench_sighash
+"""
+import time
+
+from bitcoinpy.base.sighash import SIGHASH_ALL, legacy_sighash, bip143_sighash, bip341_sighash
+from bitcoinpy.base.script import Script
+from bitcoinpy.base.transaction import Transaction, TxOut
+from bitcoinpy.crypto.hashes import hash256
+from bitcoinpy.test_data.synthetic import spend_tx, p2pkh_script
+from bitcoinpy.utils.varint import encode_varint
+
+
+def naive_legacy_sighash(tx: Transaction, index: int, script_code: bytes, hash_type: int) -> bytes:
+    """ previous implementation (SIGHASH_ALL path) """
+    result = tx.version.to_bytes(4, 'little')
+    result += encode_varint(len(tx.tx_ins))
+    for i, tx_in in enumerate(tx.tx_ins):
+        result += tx_in.prev_tx[::-1] + tx_in.prev_index.to_bytes(4, 'little')
+        result += encode_varint(len(script_code)) + script_code if i == index else b'\x00'
+        result += tx_in.sequence.to_bytes(4, 'little')
+    result += encode_varint(len(tx.tx_outs))
+    for tx_out in tx.tx_outs:
+        result += tx_out.serialize()
+    result += tx.lock_time.to_bytes(4, 'little') + hash_type.to_bytes(4, 'little')
+    return hash256(result)
+
+
+def naive_bip143_sighash(tx: Transaction, index: int, script_code: bytes, amount: int, hash_type: int) -> bytes:
+    """ previous implementation (SIGHASH_ALL path) """
+    hash_prevouts = hash256(b''.join(t.prev_tx[::-1] + t.prev_index.to_bytes(4, 'little') for t in tx.tx_ins))
+    hash_sequence = hash256(b''.join(t.sequence.to_bytes(4, 'little') for t in tx.tx_ins))
+    hash_outputs = hash256(b''.join(t.serialize() for t in tx.tx_outs))
+    tx_in = tx.tx_ins[index]
+    result = tx.version.to_bytes(4, 'little') + hash_prevouts + hash_sequence
+    result += tx_in.prev_tx[::-1] + tx_in.prev_index.to_bytes(4, 'little')
+    result += encode_varint(len(script_code)) + script_code
+    result += amount.to_bytes(8, 'little') + tx_in.sequence.to_bytes(4, 'little')
+    result += hash_outputs + tx.lock_time.to_bytes(4, 'little') + hash_type.to_bytes(4, 'little')
+    return hash256(result)
+
+
+def all_inputs(tx: Transaction, digest) -> list:
+    tx.invalidate_cache()  # every run starts without precomputed parts
+    return [digest(i) for i in range(len(tx.tx_ins))]
+
+
+def sign_and_attach(tx: Transaction, digest, attach):
+    tx.invalidate_cache()
+    for i in range(len(tx.tx_ins)):
+        attach(tx.tx_ins[i], digest(i))
+
+
+def attach_witness(tx_in, signature: bytes):
+    tx_in.witness = [signature + b'\x01', b'\x02' * 33]
+
+
+def attach_script_sig(tx_in, signature: bytes):
+    tx_in.script_sig = Script([signature + b'\x01', b'\x02' * 33])
+
+
+def timed(func) -> tuple:
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    script_code = p2pkh_script(b'\x11' * 20).raw_serialize()
+    amount = 100000
+    print("{:>8} {:>10} {:>16} {:>16}".format("inputs", "sighash", "naive (ms)", "cached (ms)"))
+    for num_inputs in [100, 500, 1000]:
+        tx = spend_tx(num_inputs, num_inputs=num_inputs, num_outputs=2)
+
+        naive, naive_time = timed(lambda: all_inputs(tx, lambda i: naive_bip143_sighash(tx, i, script_code, amount, SIGHASH_ALL)))
+        cached, cached_time = timed(lambda: all_inputs(tx, lambda i: bip143_sighash(tx, i, script_code, amount, SIGHASH_ALL)))
+        assert naive == cached
+        print("{:>8} {:>10} {:>16.2f} {:>16.2f}".format(num_inputs, "bip143", naive_time * 1000, cached_time * 1000))
+
+        naive, naive_time = timed(lambda: all_inputs(tx, lambda i: naive_legacy_sighash(tx, i, script_code, SIGHASH_ALL)))
+        cached, cached_time = timed(lambda: all_inputs(tx, lambda i: legacy_sighash(tx, i, script_code, SIGHASH_ALL)))
+        assert naive == cached
+        print("{:>8} {:>10} {:>16.2f} {:>16.2f}".format(num_inputs, "legacy", naive_time * 1000, cached_time * 1000))
+
+        spent = [TxOut(amount, p2pkh_script(bytes([i % 256]) * 20)) for i in range(num_inputs)]
+        _, cached_time = timed(lambda: all_inputs(tx, lambda i: bip341_sighash(tx, i, spent)))
+        print("{:>8} {:>10} {:>16} {:>16.2f}".format(num_inputs, "bip341", "-", cached_time * 1000))
+
+    print()
+    print("{:>8} {:>10} {:>20}".format("inputs", "sighash", "sign + attach (ms)"))
+    for num_inputs in [500, 1000, 2000]:
+        tx = spend_tx(num_inputs, num_inputs=num_inputs, num_outputs=2)
+        spent = [TxOut(amount, p2pkh_script(bytes([i % 256]) * 20)) for i in range(num_inputs)]
+        loops = [
+            ("bip143", lambda i: bip143_sighash(tx, i, script_code, amount, SIGHASH_ALL), attach_witness),
+            ("legacy", lambda i: legacy_sighash(tx, i, script_code, SIGHASH_ALL), attach_script_sig),
+            ("bip341", lambda i: bip341_sighash(tx, i, spent), attach_witness),
+        ]
+        for name, digest, attach in loops:
+            _, elapsed = timed(lambda: sign_and_attach(tx, digest, attach))
+            print("{:>8} {:>10} {:>20.2f}".format(num_inputs, name, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+TestNode request cost: bitcoin-cli process per call (use_cli=True, previous behaviour) vs direct JSON-RPC over a pooled connection.
+Each round is the helper sequence of a typical regtest test step: setup_wallet, mine a block to the coinbase address,
+read the balance, the block count and the coinbase address info (8 requests, one of them answered with a wallet error).
+
+    python -m benchmarks.bench_test_node <bitcoin binaries dir>   # against a running regtest node (TestNode.up())
+    python -m benchmarks.bench_test_node                          # stand-ins: FakeBitcoind replaying canned results and a python bitcoin-cli
+
+The stand-in cli is a python script which sends the request on a new connection like bitcoin-cli does;
+its interpreter startup stands for bitcoin-cli's own.
+"""
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+
+from bitcoinpy.regtest.test_node import TestNode
+from bitcoinpy.test_data.fake_bitcoind import ChainData, FakeBitcoind
+
+
+STAND_IN_CLI = """#!{python}
+import base64, json, sys, urllib.request
+
+def param(arg):
+    try:
+        return json.loads(arg)
+    except ValueError:
+        return arg
+
+request = urllib.request.Request("http://127.0.0.1:{port}", json.dumps({{"method": sys.argv[5], "params": [param(arg) for arg in sys.argv[6:]]}}).encode())
+request.add_header("Authorization", "Basic " + base64.b64encode(b"admin:0000").decode())
+response = json.loads(urllib.request.urlopen(request).read())
+if response["error"] is not None:
+    print("error code: {{}}\\nerror message:\\n{{}}".format(response["error"]["code"], response["error"]["message"]))
+else:
+    result = response["result"]
+    print(result if isinstance(result, str) else json.dumps(result, indent=2))
+"""
+
+ADDRESS = "bcrt1qsn9rrqturgndtprum52j40qjqq2rjtex8quamf"
+
+# results of the round on a node with the "default" wallet loaded
+CANNED = [
+    ("listwalletdir", [], {"wallets": [{"name": "default"}]}, None),
+    ("loadwallet", ["default"], None, {"code": -35, "message": "Wallet \"default\" is already loaded."}),
+    ("listwallets", [], ["default"], None),
+    ("getaddressesbylabel", ["coinbase"], {ADDRESS: {"purpose": "receive"}}, None),
+    ("generatetoaddress", [1, ADDRESS], ["00" * 32], None),
+    ("getbalance", [], 50.0, None),
+    ("getaddressinfo", [ADDRESS], {"address": ADDRESS, "ismine": True, "labels": ["coinbase"]}, None),
+]
+
+
+def round_trip(node: TestNode):
+    node.setup_wallet("default")
+    node.make_block_and_rewarding_to(1)
+    node.get_balance()
+    node.get_block_count()
+    node.get_address_info(node.coinbase_addr)
+
+
+def run(node: TestNode, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        round_trip(node)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    rounds = 30
+    if len(sys.argv) > 1:
+        for use_cli in [True, False]:
+            with TestNode(sys.argv[1], use_cli=use_cli) as node:
+                print("{:>8} {:>8.2f} ms/round".format("cli" if use_cli else "rpc", run(node, rounds)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        cassette = os.path.join(directory, "calls.jsonl")
+        with open(cassette, "w") as f:
+            for method, params, result, error in CANNED:
+                f.write(json.dumps({"method": method, "params": params, "result": result, "error": error}) + "\n")
+        with FakeBitcoind(ChainData.made_up(100), cassette=cassette) as server:
+            cli_path = os.path.join(directory, "bitcoin-cli")
+            with open(cli_path, "w") as f:
+                f.write(STAND_IN_CLI.format(python=sys.executable, port=server.server_address[1]))
+            os.chmod(cli_path, os.stat(cli_path).st_mode | stat.S_IEXEC)
+            for use_cli in [True, False]:
+                with TestNode(directory, server.server_address[1], use_cli=use_cli) as node:
+                    requests = server.requests
+                    elapsed = run(node, rounds)
+                    calls = (server.requests - requests) // rounds
+                    print("{:>8} {:>8.2f} ms/round ({} calls)".format("cli" if use_cli else "rpc", elapsed, calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+UTXO set rebuild throughput on a synthetic chain where every transaction spends two earlier outputs and creates three,
+with the whole set in memory vs a small cache spilling to sqlite.
+
+    python -m benchmarks.bench_utxo_set
+"""
+import os
+import tempfile
+
+from bitcoinpy.base.transaction import Transaction, TxIn, TxOut
+from bitcoinpy.base.utxo_set import UtxoSet
+from bitcoinpy.crypto.hashes import hash256
+from bitcoinpy.test_data.synthetic import build_raw_block, coinbase_tx, p2wpkh_script
+
+
+def spending_chain(num_blocks: int, txs_per_block: int) -> list:
+    raw_blocks = list()
+    prev_hash = b"\x00" * 32
+    spendable = list()
+    for height in range(num_blocks):
+        txs = [coinbase_tx(height)]
+        created = list()
+        for i in range(txs_per_block):
+            if len(spendable) >= 2:
+                tx_ins = [TxIn(tx_id, vout) for tx_id, vout in (spendable.pop(), spendable.pop())]
+            else:
+                tx_ins = [TxIn(hash256(height.to_bytes(4, "little") + i.to_bytes(4, "little")), 0)]
+            outs = [TxOut(1000, p2wpkh_script(hash256(bytes([j]) + tx_ins[0].prev_tx)[:20])) for j in range(3)]
+            tx = Transaction(tx_ins, outs, 2, 0)
+            txs.append(tx)
+            created += [(tx.tx_id, j) for j in range(3)]
+        spendable = created + spendable
+        raw = build_raw_block(txs, prev_hash)
+        raw_blocks.append(raw)
+        prev_hash = hash256(raw[:80])[::-1]
+    return raw_blocks
+
+
+def main():
+    raw_blocks = spending_chain(200, 250)
+    with tempfile.TemporaryDirectory() as directory:
+        for name, budget in [("memory", 2 ** 30), ("spill 1MB", 2 ** 20)]:
+            path = os.path.join(directory, name + ".sqlite")
+            # the first blocks spend made-up outpoints
+            with UtxoSet(path, memory_budget=budget, strict=False) as utxo_set:
+                utxo_set.apply_raw_blocks(raw_blocks, checkpoint_interval=50)
+                print("{:>10}: {:>8.0f} tx/sec, {} utxos, {} flushes, {} missing".format(
+                    name, utxo_set.tx_per_sec, len(utxo_set), utxo_set.flushes, utxo_set.missing))
+
+
+if __name__ == "__main__":
+    main()
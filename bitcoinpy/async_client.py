@@ -0,0 +1,342 @@
+import asyncio
+import base64
+import json
+from typing import Iterable, Union
+from urllib.parse import urlsplit
+from unittest import TestCase
+
+from bitcoinpy.exceptions import RpcError
+
+
+class _HttpConnection:
+    """ one keep-alive HTTP/1.1 connection on asyncio streams (Content-Length or chunked responses) """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+        # whether any of the current response arrived: the server then ran the request
+        self.response_started = False
+
+    @classmethod
+    async def open(cls, host: str, port: int):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def close(self):
+        self.writer.close()
+
+    async def post(self, host: str, path: str, body: bytes, headers: dict) -> tuple:
+        """ return (status, reason, body, keep_alive) """
+        self.response_started = False
+        head = ["POST {} HTTP/1.1".format(path), "Host: {}".format(host), "Content-Type: application/json",
+                "Content-Length: {}".format(len(body))]
+        head += ["{}: {}".format(name, value) for name, value in headers.items()]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        self.response_started = True
+        _, status, reason = status_line.decode().rstrip("\r\n").split(" ", 2)
+        response_headers = dict()
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, value = line.decode().split(":", 1)
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                data += await self.reader.readexactly(size)
+                await self.reader.readline()
+            data = bytes(data)
+        else:
+            data = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+        return int(status), reason, data, keep_alive
+
+
+class AsyncBasicClient:
+    def __init__(self, url: str, rpc_id: str, rpc_pw: str, wallet_name: str = None,
+                 max_concurrency: int = 10, timeout: float = 60, connect_timeout: float = 5):
+        """
+        max_concurrency: requests in flight at once, which also bounds the open connections
+        timeout: seconds for a whole request; connect_timeout: seconds to open a connection
+        """
+        parsed = urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        if parsed.scheme != "http":
+            raise Exception("Expected http url, but {}".format(url))
+        self.basic_path = parsed.path or "/"
+        self.multi_wallet_path = parsed.path + "/wallet/"
+        token = base64.b64encode("{}:{}".format(rpc_id, rpc_pw).encode()).decode()
+        self._headers = {"Authorization": "Basic " + token}
+        # used by wallet-specific-requests
+        self.wallet_name = wallet_name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        # created lazily: they bind to the running event loop
+        self._semaphore = None
+        # idle connections, most recently used last
+        self._idle = list()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        while self._idle:
+            self._idle.pop().close()
+
+    async def basic_request(self, method_name: str, params: list) -> Union[dict, str, list]:
+        """ Send rpc request to bitcoin-core without sending-wallet option. """
+        return await self._request(self.basic_path, method_name, params)
+
+    async def wallet_specific_request(self, method_name: str, params: list) -> Union[dict, str, list]:
+        """ Send rpc request to bitcoin-core with sending-wallet option """
+        return await self._request(self.multi_wallet_path + self.wallet_name, method_name, params)
+
+    async def batch_request(self, calls: list, chunk_size: int = 500, raise_on_error: bool = True, wallet: bool = False) -> list:
+        """ same as BasicClient.batch_request; chunks are sent concurrently """
+        path = self.multi_wallet_path + self.wallet_name if wallet else self.basic_path
+
+        async def send(chunk: list) -> list:
+            payload = [{"jsonrpc": "1.0", "id": i, "method": method, "params": params} for i, (method, params) in enumerate(chunk)]
+            chunk_results = [None] * len(chunk)
+            answered = [False] * len(chunk)
+            # error of a response without a usable id, e.g. "id": null for a batch item bitcoind could not parse
+            unmatched = {"code": -32603, "message": "No response to the call in the batch"}
+            # responses are matched by id; their order is not guaranteed
+            for item in await self._post(path, payload, "batch"):
+                i = item.get("id")
+                if type(i) != int or not 0 <= i < len(chunk):
+                    unmatched = item.get("error") or {"code": -32603, "message": "Response without the id of a call"}
+                    continue
+                answered[i] = True
+                error = item.get("error")
+                if error is None:
+                    chunk_results[i] = item["result"]
+                else:
+                    chunk_results[i] = RpcError(error["code"], error["message"], chunk[i][0])
+            for i in range(len(chunk)):
+                if not answered[i]:
+                    chunk_results[i] = RpcError(unmatched["code"], unmatched["message"], chunk[i][0])
+            return chunk_results
+
+        chunks = await asyncio.gather(*[send(calls[start:start + chunk_size]) for start in range(0, len(calls), chunk_size)])
+        results = [result for chunk_results in chunks for result in chunk_results]
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, RpcError):
+                    raise result
+        return results
+
+    async def _acquire(self) -> _HttpConnection:
+        if self._idle:
+            connection = self._idle.pop()
+            connection.reused = True
+            return connection
+        return await asyncio.wait_for(_HttpConnection.open(self.host, self.port), self.connect_timeout)
+
+    async def _send(self, path: str, body: bytes) -> tuple:
+        """
+        a reused connection may have been closed by the server meanwhile: retry once on a new one,
+        unless part of the response arrived, which means the call ran (e.g. sendrawtransaction)
+        """
+        connection = await self._acquire()
+        try:
+            status, reason, data, keep_alive = await asyncio.wait_for(connection.post(self.host, path, body, self._headers), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            connection.close()
+            if not connection.reused or connection.response_started:
+                raise
+            connection = await asyncio.wait_for(_HttpConnection.open(self.host, self.port), self.connect_timeout)
+            try:
+                status, reason, data, keep_alive = await asyncio.wait_for(connection.post(self.host, path, body, self._headers), self.timeout)
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            # timeout or cancellation leaves the connection mid-response
+            connection.close()
+            raise
+        if keep_alive:
+            self._idle.append(connection)
+        else:
+            connection.close()
+        return status, reason, data
+
+    async def _post(self, path: str, payload: Union[dict, list], method_name: str) -> Union[dict, list]:
+        """ send payload with at most max_concurrency requests in flight; non-200 responses raise RpcError """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            status, reason, data = await self._send(path, json.dumps(payload).encode())
+        if status == 200:
+            return json.loads(data)
+        try:
+            error = json.loads(data)["error"]
+        except (ValueError, TypeError, KeyError):
+            # e.g. 401 has no body
+            raise RpcError(status, reason, method_name)
+        raise RpcError(error["code"], error["message"], method_name)
+
+    async def _request(self, path: str, method_name: str, params: list) -> Union[dict, str, list]:
+        """ Build and send a rpc request to bitcoin core """
+        payload = {"jsonrpc": "1.0", "method": method_name, "params": params}
+        return (await self._post(path, payload, method_name))["result"]
+
+
+class AsyncBitcoinClient(AsyncBasicClient):
+    """ coroutine version of BitcoinClient """
+    def __init__(self, url: str, rpc_id: str, rpc_pw: str, wallet_name: str = None,
+                 max_concurrency: int = 10, timeout: float = 60, connect_timeout: float = 5):
+        super().__init__(url, rpc_id, rpc_pw, wallet_name, max_concurrency, timeout, connect_timeout)
+
+    async def get_latest_block_hash(self) -> str:
+        return await self.basic_request("getbestblockhash", list())
+
+    async def get_block_hash_by_height(self, height: int) -> str:
+        return await self.basic_request("getblockhash", [height])
+
+    async def get_block_by_hash(self, block_hash: str, verbose: int = 1) -> dict:
+        return await self.basic_request("getblock", [block_hash, verbose])
+
+    async def get_block_header_by_hash(self, block_hash: str, verbose: bool = False) -> dict:
+        return await self.basic_request("getblockheader", [block_hash, verbose])
+
+    async def get_latest_height(self) -> int:
+        block_hash = await self.get_latest_block_hash()
+        block = await self.get_block_by_hash(block_hash)
+        return block["height"]
+
+    async def get_block_by_height(self, height: int, verbose: int = 1) -> dict:
+        block_hash = await self.get_block_hash_by_height(height)
+        return await self.get_block_by_hash(block_hash, verbose)
+
+    async def get_block_header_by_height(self, height: int, verbose: bool = False):
+        block_hash = await self.get_block_hash_by_height(height)
+        return await self.get_block_header_by_hash(block_hash, verbose)
+
+    async def get_block_hashes(self, heights: Iterable[int], chunk_size: int = 500) -> list:
+        return await self.batch_request([("getblockhash", [height]) for height in heights], chunk_size)
+
+    async def get_headers(self, heights: Iterable[int], verbose: bool = False, chunk_size: int = 500) -> list:
+        block_hashes = await self.get_block_hashes(heights, chunk_size)
+        return await self.batch_request([("getblockheader", [block_hash, verbose]) for block_hash in block_hashes], chunk_size)
+
+    async def get_blocks(self, heights: Iterable[int], verbose: int = 1, chunk_size: int = 50) -> list:
+        block_hashes = await self.get_block_hashes(heights)
+        return await self.batch_request([("getblock", [block_hash, verbose]) for block_hash in block_hashes], chunk_size)
+
+
+class AsyncBitcoinClientTest(TestCase):
+    def test_requests(self):
+        from bitcoinpy.test_data.rpc_stub import AsyncRpcStubServer, stub_block_hash
+
+        async def run():
+            async with AsyncRpcStubServer(tip=300) as server, AsyncBitcoinClient(server.url, "admin", "0000") as cli:
+                for height in range(20):
+                    self.assertEqual(await cli.get_block_hash_by_height(height), stub_block_hash(height))
+                self.assertEqual(server.connections, 1)
+                self.assertEqual(await cli.get_latest_height(), 300)
+                self.assertEqual(await cli.get_block_header_by_height(7, True), {"hash": stub_block_hash(7), "height": 7})
+
+                hashes = await cli.get_block_hashes(range(250), chunk_size=100)
+                self.assertEqual(hashes, [stub_block_hash(h) for h in range(250)])
+                results = await cli.batch_request([("getblockcount", []), ("getnothing", [])], raise_on_error=False)
+                self.assertEqual(results[0], 300)
+                self.assertEqual(results[1].code, -32601)
+
+                async def without_id(path, payload, method_name):
+                    return [{"result": None, "error": {"code": -32600, "message": "Invalid Request object"}, "id": None}]
+                cli._post = without_id
+                results = await cli.batch_request([("getblockcount", [])], raise_on_error=False)
+                self.assertEqual((results[0].code, results[0].method), (-32600, "getblockcount"))
+                del cli._post
+
+                with self.assertRaises(RpcError) as context:
+                    await cli.get_block_hash_by_height(301)
+                self.assertEqual(context.exception.code, -8)
+                async with AsyncBitcoinClient(server.url, "admin", "wrong") as wrong:
+                    with self.assertRaises(RpcError) as context:
+                        await wrong.get_latest_block_hash()
+                    self.assertEqual(context.exception.code, 401)
+        asyncio.run(run())
+
+    def test_concurrency_limit(self):
+        from bitcoinpy.test_data.rpc_stub import AsyncRpcStubServer, stub_block_hash
+
+        async def run():
+            async with AsyncRpcStubServer(latency=0.01) as server, AsyncBitcoinClient(server.url, "admin", "0000", max_concurrency=4) as cli:
+                hashes = await asyncio.gather(*[cli.get_block_hash_by_height(h) for h in range(100)])
+                self.assertEqual(list(hashes), [stub_block_hash(h) for h in range(100)])
+                self.assertEqual(server.max_in_flight, 4)
+                self.assertEqual(server.connections, 4)
+        asyncio.run(run())
+
+    def test_timeout(self):
+        from bitcoinpy.test_data.rpc_stub import AsyncRpcStubServer
+
+        async def run():
+            async with AsyncRpcStubServer(latency=0.5) as server, AsyncBitcoinClient(server.url, "admin", "0000", timeout=0.05) as cli:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await cli.get_latest_block_hash()
+                # the timed out connection is not reused
+                self.assertEqual(cli._idle, [])
+                server.latency = 0
+                self.assertEqual(await cli.get_block_hash_by_height(0), (await cli.get_block_hashes([0]))[0])
+        asyncio.run(run())
+
+    def test_retry_only_before_response(self):
+        async def run():
+            methods = list()
+
+            async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+                try:
+                    while True:
+                        head = await reader.readuntil(b"\r\n\r\n")
+                        length = int(head.lower().split(b"content-length: ")[1].split(b"\r\n")[0])
+                        methods.append(json.loads(await reader.readexactly(length))["method"])
+                        result = json.dumps({"result": len(methods), "error": None, "id": None}).encode()
+                        response = "HTTP/1.1 200 OK\r\nContent-Length: {}\r\n\r\n".format(len(result)).encode() + result
+                        if len(methods) == 2:
+                            # part of the response, then the connection drops
+                            writer.write(response[:-5])
+                            await writer.drain()
+                            return
+                        writer.write(response)
+                        await writer.drain()
+                        if len(methods) == 3:
+                            return  # closes the kept-alive connection
+                except asyncio.IncompleteReadError:
+                    pass
+                finally:
+                    writer.close()
+
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            url = "http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+            async with server, AsyncBitcoinClient(url, "admin", "0000") as cli:
+                self.assertEqual(await cli.basic_request("getblockcount", []), 1)
+                # the node ran it: not sent again
+                with self.assertRaises(asyncio.IncompleteReadError):
+                    await cli.basic_request("sendrawtransaction", ["00"])
+                self.assertEqual(methods, ["getblockcount", "sendrawtransaction"])
+
+                self.assertEqual(await cli.basic_request("getblockcount", []), 3)
+                await asyncio.sleep(0.05)
+                # closed while idle: nothing of the response arrived, so it is sent again on a new connection
+                self.assertEqual(await cli.basic_request("sendrawtransaction", ["00"]), 4)
+                self.assertEqual(methods, ["getblockcount", "sendrawtransaction", "getblockcount", "sendrawtransaction"])
+        asyncio.run(run())
@@ -0,0 +1,331 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Union
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+from bitcoinpy.client import BasicClient, BitcoinClient
+from bitcoinpy.exceptions import RpcError
+from bitcoinpy.instrumentation import Instrumentation
+
+# import for test below
+from unittest import TestCase
+
+
+# calls without side effects: retried on another endpoint after any failure, e.g. a read timeout
+READ_ONLY_METHODS = frozenset([
+    "getbestblockhash", "getblock", "getblockchaininfo", "getblockcount", "getblockfilter", "getblockhash", "getblockheader",
+    "getblockstats", "getchaintips", "getdifficulty", "getmempoolancestors", "getmempooldescendants", "getmempoolentry",
+    "getmempoolinfo", "getrawmempool", "gettxout", "gettxoutproof", "gettxoutsetinfo", "getrawtransaction",
+    "decoderawtransaction", "decodescript", "estimatesmartfee", "getnetworkinfo", "getpeerinfo", "getconnectioncount",
+    "getindexinfo", "getdescriptorinfo", "validateaddress", "testmempoolaccept", "uptime",
+    "getbalance", "getbalances", "getwalletinfo", "gettransaction", "listunspent", "listtransactions", "listsinceblock",
+])
+
+
+class Endpoint:
+    """ one bitcoind replica with its own connection pool, load and health state """
+    def __init__(self, url: str, rpc_id: str, rpc_pw: str, timeout: Union[float, tuple], window: int = 1000):
+        self.url = url
+        self.client = BasicClient(url, rpc_id, rpc_pw, timeout=timeout)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        # consecutive failures (errors or slow responses); reset by a success
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.ewma_ms = 0.0
+        self.latencies = deque(maxlen=window)
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def record(self, elapsed_ms: float):
+        self.latencies.append(elapsed_ms)
+        self.ewma_ms = elapsed_ms if self.requests == 1 else 0.8 * self.ewma_ms + 0.2 * elapsed_ms
+
+    def stats(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+        return {"url": self.url, "requests": self.requests, "errors": self.errors, "outstanding": self.outstanding,
+                "ejected": self.is_ejected(time.monotonic()), "ejections": self.ejections, "ewma_ms": self.ewma_ms,
+                "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99)}
+
+
+class BalancedBitcoinClient(BitcoinClient):
+    """
+    BitcoinClient over several replicas (instrumented as one client): each request goes to the healthy endpoint with the fewest requests
+    in flight (ties to the lower average latency) and is retried once elsewhere if the node fails before running it
+    (connection refused or connect timeout, HTTP 503), or after any failure if every call is in READ_ONLY_METHODS:
+    a read timeout may leave e.g. sendrawtransaction run on the first node.
+    Transport errors, HTTP 5xx without a JSON-RPC error and responses slower than slow_ms count as failures;
+    max_failures in a row eject the endpoint for eject_seconds, doubled on every ejection up to max_eject_seconds.
+    An endpoint whose ejection expired answers a getblockcount health check before taking requests again.
+    Inside pinned(), requests of the thread stick to one endpoint so that reads see the same tip.
+    """
+    def __init__(self, endpoints: list, wallet_name: str = None, timeout: Union[float, tuple] = (5, 60),
+                 slow_ms: float = None, max_failures: int = 3, eject_seconds: float = 1.0, max_eject_seconds: float = 60.0,
+                 retries: int = 1, instrumentation: Instrumentation = None):
+        """ endpoints: (url, rpc_id, rpc_pw) """
+        if not endpoints:
+            raise Exception("Expected at least one endpoint, but none")
+        super().__init__(endpoints[0][0], endpoints[0][1], endpoints[0][2], wallet_name, timeout=timeout, instrumentation=instrumentation)
+        self.endpoints = [Endpoint(url, rpc_id, rpc_pw, timeout) for url, rpc_id, rpc_pw in endpoints]
+        self.slow_ms = slow_ms
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def close(self):
+        super().close()
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+    def endpoint_stats(self) -> list:
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+    @contextmanager
+    def pinned(self):
+        """ requests of this thread go to the endpoint of the first one; its failures are raised, not retried elsewhere """
+        outer = getattr(self._local, "pin", None)
+        self._local.pin = outer if outer is not None else False
+        try:
+            yield self
+        finally:
+            self._local.pin = outer
+
+    def _eject(self, endpoint: Endpoint, now: float):
+        endpoint.ejections += 1
+        backoff = min(self.eject_seconds * 2 ** (endpoint.ejections - 1), self.max_eject_seconds)
+        endpoint.ejected_until = now + backoff
+
+    def _probe(self, endpoint: Endpoint) -> bool:
+        """ health check of an endpoint whose ejection expired; another failure ejects it again """
+        try:
+            endpoint.client.basic_request("getblockcount", list())
+        except (requests.RequestException, RpcError):
+            with self._lock:
+                self._eject(endpoint, time.monotonic())
+            return False
+        with self._lock:
+            endpoint.failures = 0
+            endpoint.ejected_until = 0.0
+        return True
+
+    def check_health(self) -> list:
+        """ probe every endpoint; return the healthy ones """
+        return [endpoint for endpoint in self.endpoints if self._probe(endpoint)]
+
+    def _choose(self, excluded: list) -> Endpoint:
+        """ excluded: endpoints already tried for the request; at least one endpoint is not """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                candidates = [endpoint for endpoint in self.endpoints if endpoint not in excluded]
+                healthy = [endpoint for endpoint in candidates if not endpoint.is_ejected(now)]
+                if not healthy:
+                    # all ejected: fail open to the one readmitted first
+                    return min(candidates, key=lambda endpoint: endpoint.ejected_until)
+                chosen = min(healthy, key=lambda endpoint: (endpoint.outstanding, endpoint.ewma_ms))
+                # expired ejection: still counts failures
+                recovering = chosen.failures >= self.max_failures
+            if not recovering or self._probe(chosen):
+                return chosen
+
+    def _is_failure(self, error: Exception) -> bool:
+        """ node trouble rather than an error answer of the call """
+        return not isinstance(error, RpcError) or error.code >= 500
+
+    @staticmethod
+    def _not_sent(error: Exception) -> bool:
+        """
+        the connection was never established (refused or connect timeout), so the node did not see the request.
+        Other connection errors, e.g. the node dropping the connection after reading the request, may follow a run
+        """
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        return isinstance(error, requests.ConnectionError) and bool(error.args) \
+            and isinstance(getattr(error.args[0], "reason", None), ConnectTimeoutError)
+
+    def _retry_safe(self, error: Exception, method_name: str, body: bytes) -> bool:
+        """ whether the failed request surely did not run on the node, or running it again is harmless """
+        if self._not_sent(error) or isinstance(error, RpcError) and error.code == 503:
+            return True
+        if method_name == "batch":
+            return all(call["method"] in READ_ONLY_METHODS for call in json.loads(body))
+        return method_name in READ_ONLY_METHODS
+
+    def _account(self, endpoint: Endpoint, elapsed_ms: float, error: Exception, failed: bool):
+        with self._lock:
+            endpoint.record(elapsed_ms)
+            if error is not None:
+                endpoint.errors += 1
+            if failed or (self.slow_ms is not None and elapsed_ms > self.slow_ms):
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    self._eject(endpoint, time.monotonic())
+            elif error is None:
+                endpoint.failures = 0
+
+    def _send(self, url: str, body: bytes, method_name: str) -> requests.Response:
+        # e.g. "/wallet/<name>" of wallet requests
+        path = url[len(self.basic_url):]
+        pin = getattr(self._local, "pin", None)
+        tried = list()
+        while True:
+            endpoint = pin if pin else self._choose(tried)
+            with self._lock:
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+            start = time.perf_counter()
+            resp, error = None, None
+            try:
+                resp = endpoint.client._send(endpoint.url + path, body, method_name)
+            except (requests.RequestException, RpcError) as e:
+                error = e
+            finally:
+                with self._lock:
+                    endpoint.outstanding -= 1
+            failed = error is not None and self._is_failure(error)
+            self._account(endpoint, (time.perf_counter() - start) * 1000, error, failed)
+
+            if pin is False and not failed:
+                self._local.pin = pin = endpoint
+            if error is None:
+                return resp
+            tried.append(endpoint)
+            if not failed or pin or len(tried) > self.retries or len(tried) == len(self.endpoints):
+                raise error
+            if not self._retry_safe(error, method_name, body):
+                raise error
+
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BalancedBitcoinClientTest(TestCase):
+    def test_least_outstanding(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        with RpcStubServer() as fast, RpcStubServer(latency=0.05) as slow:
+            with BalancedBitcoinClient([(fast.url, "admin", "0000"), (slow.url, "admin", "0000")]) as cli:
+                with ThreadPoolExecutor(4) as executor:
+                    hashes = list(executor.map(cli.get_block_hash_by_height, range(200)))
+                self.assertEqual(hashes, [stub_block_hash(h) for h in range(200)])
+                stats = cli.endpoint_stats()
+                self.assertEqual(stats[0]["requests"] + stats[1]["requests"], 200)
+                self.assertGreater(stats[0]["requests"], 4 * stats[1]["requests"])
+                self.assertGreater(stats[1]["p50_ms"], stats[0]["p50_ms"])
+                self.assertEqual(stats[0]["outstanding"] + stats[1]["outstanding"], 0)
+
+    def test_eject_and_readmit(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        down_url = "http://127.0.0.1:{}".format(_free_port())
+        with RpcStubServer() as server:
+            endpoints = [(down_url, "admin", "0000"), (server.url, "admin", "0000")]
+            with BalancedBitcoinClient(endpoints, max_failures=1, eject_seconds=0.2, timeout=1) as cli:
+                for height in range(20):
+                    # failures are retried on the other endpoint
+                    self.assertEqual(cli.get_block_hash_by_height(height), stub_block_hash(height))
+                down, up = cli.endpoint_stats()
+                self.assertTrue(down["ejected"])
+                self.assertEqual(down["errors"], 1)
+                self.assertEqual(up["requests"], 20)
+
+                # call errors are raised without ejecting
+                with self.assertRaises(RpcError):
+                    cli.get_block_hash_by_height(5000)
+                self.assertFalse(cli.endpoint_stats()[1]["ejected"])
+
+                # the expired ejection fails its health check and backs off longer
+                time.sleep(0.25)
+                self.assertEqual(cli.check_health(), [cli.endpoints[1]])
+                self.assertEqual(cli.endpoint_stats()[0]["ejections"], 2)
+                self.assertGreater(cli.endpoints[0].ejected_until - time.monotonic(), 0.25)
+
+    def test_read_timeout_retried_only_for_read_only_calls(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        with RpcStubServer(latency=0.5) as slow, RpcStubServer() as fast:
+            endpoints = [(slow.url, "admin", "0000"), (fast.url, "admin", "0000")]
+            # both idle: the first endpoint is chosen
+            with BalancedBitcoinClient(endpoints, timeout=(1, 0.2)) as cli:
+                with self.assertRaises(requests.ReadTimeout):
+                    cli.basic_request("sendrawtransaction", ["00"])
+                self.assertEqual(fast.requests, 0)
+            with BalancedBitcoinClient(endpoints, timeout=(1, 0.2)) as cli:
+                self.assertEqual(cli.get_block_hash_by_height(1), stub_block_hash(1))
+                self.assertEqual(fast.requests, 1)
+
+    def test_dropped_connection_retried_only_for_read_only_calls(self):
+        import socket
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        received = list()
+
+        def read_and_drop(listener):
+            # read each request, then close the connection without answering
+            while True:
+                try:
+                    conn, _ = listener.accept()
+                except OSError:
+                    return
+                with conn:
+                    data = b""
+                    while b"\r\n\r\n" not in data:
+                        data += conn.recv(65536)
+                    head, body = data.split(b"\r\n\r\n", 1)
+                    length = int([line for line in head.split(b"\r\n") if line.lower().startswith(b"content-length:")][0].split(b":")[1])
+                    while len(body) < length:
+                        body += conn.recv(65536)
+                    received.append(json.loads(body)["method"])
+
+        with socket.socket() as listener, RpcStubServer() as server:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            threading.Thread(target=read_and_drop, args=(listener,), daemon=True).start()
+            dropping_url = "http://127.0.0.1:{}".format(listener.getsockname()[1])
+            endpoints = [(dropping_url, "admin", "0000"), (server.url, "admin", "0000")]
+            # both idle: the first endpoint is chosen
+            with BalancedBitcoinClient(endpoints) as cli:
+                with self.assertRaises(requests.ConnectionError):
+                    cli.basic_request("sendrawtransaction", ["00"])
+                self.assertEqual(received, ["sendrawtransaction"])
+                self.assertEqual(server.requests, 0)
+            with BalancedBitcoinClient(endpoints) as cli:
+                self.assertEqual(cli.get_block_hash_by_height(1), stub_block_hash(1))
+                self.assertEqual(server.requests, 1)
+
+        # a refused connection never reached the node: retried whatever the method
+        down_url = "http://127.0.0.1:{}".format(_free_port())
+        with RpcStubServer() as server:
+            with BalancedBitcoinClient([(down_url, "admin", "0000"), (server.url, "admin", "0000")]) as cli:
+                with self.assertRaises(RpcError) as context:
+                    cli.basic_request("sendrawtransaction", ["00"])
+                self.assertEqual(context.exception.code, -32601)
+                self.assertEqual(server.requests, 1)
+
+    def test_pinned(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer
+        with RpcStubServer(tip=100) as first, RpcStubServer(tip=101) as second:
+            with BalancedBitcoinClient([(first.url, "admin", "0000"), (second.url, "admin", "0000")]) as cli:
+                for _ in range(10):
+                    with cli.pinned():
+                        tip = cli.get_latest_height()
+                        self.assertEqual(cli.basic_request("getblockcount", []), tip)
+                        self.assertEqual(cli.get_block_by_height(tip)["height"], tip)
+                self.assertGreater(min(stats["requests"] for stats in cli.endpoint_stats()), 0)
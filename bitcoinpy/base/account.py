@@ -17,6 +17,8 @@ class AddrType(Enum):
     LEGACY = "legacy"
     BECH32 = "bech32"
     P2SH_SEGWIT = "p2sh-segwit"
+    P2SH = "p2sh"  # hash is the script hash
+    BECH32M = "bech32m"  # witness v1 (taproot); hash is the witness program
 
 
 # TODO move constant to constant.py
@@ -100,36 +102,45 @@ class BTCAccount:
 
     @classmethod
     def from_address(cls, address: str):
-        if address[0] == "1":
-            addr_type = AddrType.LEGACY
-            network = NetType.MAIN_NET
-        elif address[0] == "n" or address[0] == "m":
-            addr_type = AddrType.LEGACY
-            network = NetType.TEST_NET
-        elif address[:2] == "bc" and address[:4] != "bcrt":
-            addr_type = AddrType.BECH32
+        if address[:4] == "bcrt":
+            hrp = "bcrt"
+            network = NetType.REG_TEST
+        elif address[:2] == "bc":
+            hrp = "bc"
             network = NetType.MAIN_NET
         elif address[:2] == "tb":
-            addr_type = AddrType.BECH32
+            hrp = "tb"
             network = NetType.TEST_NET
-        elif address[:4] == "bcrt":
-            addr_type = AddrType.BECH32
-            network = NetType.REG_TEST
         else:
+            hrp = None
+
+        if hrp is not None:
+            witver, witprog = bech32_decode(hrp, address)
+            if witver is None:
+                raise Exception("Invalid address")
+            if witver == 0:
+                addr_type = AddrType.BECH32
+            elif witver == 1:
+                addr_type = AddrType.BECH32M
+            else:
+                raise Exception("Not supported witness version: {}".format(witver))
+            return cls(hash160=bytes(witprog), addr_type=addr_type, network_type=network)
+
+        if address[0] not in "1mn32":
             raise Exception("Invalid or not supported address")
-
-        if addr_type == AddrType.LEGACY:
-            h160 = decode_base58_checksum(address)[1:]
-            # h160 = b58decode_check(address)[1:]
-        elif addr_type == AddrType.BECH32:
-            if network == NetType.REG_TEST: hrp = "bcrt"
-            elif network == NetType.TEST_NET: hrp = "tb"
-            elif network == NetType.MAIN_NET: hrp = "bc"
-            else: raise Exception("Invalid address")
-            _, witprog = bech32_decode(hrp, address)
-            h160 = bytes(witprog)
+        decoded = decode_base58_checksum(address)
+        # h160 = b58decode_check(address)[1:]
+        version, h160 = decoded[0], decoded[1:]
+        if version == 0x00:
+            addr_type, network = AddrType.LEGACY, NetType.MAIN_NET
+        elif version == 0x6f:
+            addr_type, network = AddrType.LEGACY, NetType.TEST_NET
+        elif version == 0x05:
+            addr_type, network = AddrType.P2SH, NetType.MAIN_NET
+        elif version == 0xc4:
+            addr_type, network = AddrType.P2SH, NetType.TEST_NET
         else:
-            raise Exception("Not supported addr type")
+            raise Exception("Invalid address version: {}".format(version))
 
         return cls(hash160=h160, addr_type=addr_type, network_type=network)
 
@@ -178,14 +189,22 @@ class BTCAccount:
             # self._address = base58.b58encode_check(version + self.hash).decode()
             return self._address
 
-        if self.addr_type == AddrType.BECH32:
+        if self.addr_type == AddrType.P2SH:
+            if self.network_type == NetType.MAIN_NET: version: bytes = b'\x05'
+            else: version: bytes = b'\xc4'
+
+            self._address = encode_base58_checksum(version + self.hash)
+            return self._address
+
+        if self.addr_type == AddrType.BECH32 or self.addr_type == AddrType.BECH32M:
             # determine hrp
             if self.network_type == NetType.MAIN_NET: hrp = "bc"
             elif self.network_type == NetType.TEST_NET: hrp = "tb"
             else: hrp = "bcrt"
-            # bech32 encode
+            # bech32 (witness v0) or bech32m (witness v1) encode
+            witver = 0 if self.addr_type == AddrType.BECH32 else 1
             wit_prog = [int(item) for item in self.hash]
-            self._address = bech32_encode(hrp, 0, wit_prog)
+            self._address = bech32_encode(hrp, witver, wit_prog)
             return self._address
 
     @property
@@ -0,0 +1,289 @@
+import hashlib
+import sqlite3
+from collections import namedtuple
+from io import BytesIO
+from typing import Iterator
+
+from bitcoinpy.base.account import NetType, DEFAULT_NETWORK_TYPE
+from bitcoinpy.base.amount import BTCAmount
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.header import Header
+from bitcoinpy.base.script_type import script_pubkey_from_address, script_pubkey_to_address
+
+# import for test below
+from unittest import TestCase
+
+
+HistoryItem = namedtuple("HistoryItem", ["height", "tx_id", "delta"])
+UnspentItem = namedtuple("UnspentItem", ["height", "tx_id", "vout", "value"])
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS scripts (scripthash BLOB PRIMARY KEY, script BLOB NOT NULL) WITHOUT ROWID",
+    # position: index of the transaction in its block
+    "CREATE TABLE IF NOT EXISTS funding (tx_id BLOB, vout INTEGER, scripthash BLOB NOT NULL, height INTEGER NOT NULL, "
+    "position INTEGER NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (tx_id, vout)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS spending (prev_tx_id BLOB, prev_vout INTEGER, scripthash BLOB NOT NULL, height INTEGER NOT NULL, "
+    "position INTEGER NOT NULL, tx_id BLOB NOT NULL, vin INTEGER NOT NULL, value INTEGER NOT NULL, "
+    "PRIMARY KEY (prev_tx_id, prev_vout)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS funding_scripthash ON funding (scripthash, height, position)",
+    "CREATE INDEX IF NOT EXISTS spending_scripthash ON spending (scripthash, height, position)",
+    "CREATE INDEX IF NOT EXISTS funding_height ON funding (height)",
+    "CREATE INDEX IF NOT EXISTS spending_height ON spending (height)",
+    "CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, hash BLOB NOT NULL)",
+]
+
+
+def scripthash(script_pubkey: bytes) -> bytes:
+    return hashlib.sha256(script_pubkey).digest()
+
+
+def electrum_scripthash(script_pubkey: bytes) -> str:
+    """ scripthash of the Electrum protocol: sha256 of scriptPubKey as reversed hex """
+    return scripthash(script_pubkey)[::-1].hex()
+
+
+class AddressIndex:
+    """
+    Funding (outputs) and spending (inputs) records per scriptPubKey, keyed by its sha256 (scripthash).
+    Rows are buffered and written in batches; blocks can be added incrementally and rolled back from a height (reorg).
+    Spends of outputs created before the first indexed block are not recorded.
+    """
+    def __init__(self, path: str = ":memory:", network_type: NetType = DEFAULT_NETWORK_TYPE, batch_size: int = 50000):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.network_type = network_type
+        self.batch_size = batch_size
+
+        self._scripts = dict()
+        self._funding = list()
+        self._spending = list()
+        self._blocks = list()
+        # (tx_id, vout) -> (scripthash, value) of buffered funding rows, for spends within the batch
+        self._pending = dict()
+        row = self.db.execute("SELECT MAX(height) FROM blocks").fetchone()
+        self.height: int = -1 if row[0] is None else row[0]
+        self.unknown_spends = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def _funded_output(self, tx_id: bytes, vout: int):
+        funded = self._pending.get((tx_id, vout))
+        if funded is None:
+            funded = self.db.execute("SELECT scripthash, value FROM funding WHERE tx_id = ? AND vout = ?", (tx_id, vout)).fetchone()
+        return funded
+
+    def index_transactions(self, transactions: Iterator, height: int, block_hash: bytes):
+        for position, tx in enumerate(transactions):
+            tx_id = tx.tx_id
+            if not tx.is_coinbase():
+                for vin, tx_in in enumerate(tx.tx_ins):
+                    funded = self._funded_output(tx_in.prev_tx, tx_in.prev_index)
+                    if funded is None:
+                        self.unknown_spends += 1
+                        continue
+                    self._spending.append((tx_in.prev_tx, tx_in.prev_index, funded[0], height, position, tx_id, vin, funded[1]))
+            for vout, tx_out in enumerate(tx.tx_outs):
+                script = tx_out.script_pubkey.raw_serialize()
+                if script[:1] == b"\x6a":
+                    continue  # OP_RETURN
+                key = scripthash(script)
+                self._scripts[key] = script
+                self._funding.append((tx_id, vout, key, height, position, tx_out.amount))
+                self._pending[(tx_id, vout)] = (key, tx_out.amount)
+        self._blocks.append((height, block_hash))
+        self.height = height
+        if len(self._funding) + len(self._spending) >= self.batch_size:
+            self.flush()
+
+    def index_block(self, block: Block):
+        self.index_transactions(block.transactions, block.height, block.hash.bytes_as_be)
+
+    def index_raw_block(self, raw_block: bytes, height: int):
+        header = Header.parse_from_bytes_io(BytesIO(raw_block[:80]))
+        self.index_transactions(Block.iter_raw_transactions(raw_block), height, header.hash.bytes_as_be)
+
+    def index_raw_blocks(self, raw_blocks: Iterator[bytes], start_height: int = 0):
+        """ index blocks above the indexed height; earlier ones are skipped """
+        for height, raw_block in enumerate(raw_blocks, start_height):
+            if height > self.height:
+                self.index_raw_block(raw_block, height)
+        self.flush()
+
+    def flush(self):
+        if not self._blocks:
+            return
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO scripts (scripthash, script) VALUES (?, ?)", self._scripts.items())
+            self.db.executemany("INSERT OR REPLACE INTO funding (tx_id, vout, scripthash, height, position, value) VALUES (?, ?, ?, ?, ?, ?)", self._funding)
+            self.db.executemany(
+                "INSERT OR REPLACE INTO spending (prev_tx_id, prev_vout, scripthash, height, position, tx_id, vin, value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._spending)
+            self.db.executemany("INSERT OR REPLACE INTO blocks (height, hash) VALUES (?, ?)", self._blocks)
+        self._scripts.clear()
+        self._funding.clear()
+        self._spending.clear()
+        self._blocks.clear()
+        self._pending.clear()
+
+    def rollback(self, height: int):
+        """ remove blocks from height on (e.g. disconnected by a reorg) """
+        self.flush()
+        with self.db:
+            for table in ["funding", "spending", "blocks"]:
+                self.db.execute("DELETE FROM {} WHERE height >= ?".format(table), (height,))
+        self.height = min(self.height, height - 1)
+
+    def block_hash(self, height: int) -> bytes:
+        self.flush()
+        row = self.db.execute("SELECT hash FROM blocks WHERE height = ?", (height,)).fetchone()
+        return None if row is None else row[0]
+
+    # queries by scripthash (sha256 of scriptPubKey)
+
+    def _key(self, address: str) -> bytes:
+        return scripthash(script_pubkey_from_address(address))
+
+    def history_by_scripthash(self, key: bytes) -> list:
+        """ per transaction net value change, in block order """
+        self.flush()
+        rows = self.db.execute(
+            "SELECT height, tx_id, SUM(delta) FROM ("
+            "SELECT height, position, tx_id, value AS delta FROM funding WHERE scripthash = ? "
+            "UNION ALL SELECT height, position, tx_id, -value AS delta FROM spending WHERE scripthash = ?"
+            ") GROUP BY height, position, tx_id ORDER BY height, position", (key, key)).fetchall()
+        return [HistoryItem(height, tx_id, BTCAmount(delta)) for height, tx_id, delta in rows]
+
+    def balance_by_scripthash(self, key: bytes) -> BTCAmount:
+        self.flush()
+        funded = self.db.execute("SELECT COALESCE(SUM(value), 0) FROM funding WHERE scripthash = ?", (key,)).fetchone()[0]
+        spent = self.db.execute("SELECT COALESCE(SUM(value), 0) FROM spending WHERE scripthash = ?", (key,)).fetchone()[0]
+        return BTCAmount(funded - spent)
+
+    def unspent_by_scripthash(self, key: bytes) -> list:
+        self.flush()
+        rows = self.db.execute(
+            "SELECT f.height, f.tx_id, f.vout, f.value FROM funding f LEFT JOIN spending s "
+            "ON s.prev_tx_id = f.tx_id AND s.prev_vout = f.vout WHERE f.scripthash = ? AND s.prev_tx_id IS NULL "
+            "ORDER BY f.height, f.position, f.vout", (key,)).fetchall()
+        return [UnspentItem(height, tx_id, vout, BTCAmount(value)) for height, tx_id, vout, value in rows]
+
+    def script_of(self, key: bytes) -> bytes:
+        self.flush()
+        row = self.db.execute("SELECT script FROM scripts WHERE scripthash = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    # queries by Electrum scripthash (reversed hex)
+
+    def history_by_electrum(self, electrum_hash: str) -> list:
+        return self.history_by_scripthash(bytes.fromhex(electrum_hash)[::-1])
+
+    def balance_by_electrum(self, electrum_hash: str) -> BTCAmount:
+        return self.balance_by_scripthash(bytes.fromhex(electrum_hash)[::-1])
+
+    # queries by address (decoded by BTCAccount.from_address)
+
+    def history(self, address: str) -> list:
+        return self.history_by_scripthash(self._key(address))
+
+    def balance(self, address: str) -> BTCAmount:
+        return self.balance_by_scripthash(self._key(address))
+
+    def unspent(self, address: str) -> list:
+        return self.unspent_by_scripthash(self._key(address))
+
+    def address_of(self, key: bytes) -> str:
+        script = self.script_of(key)
+        return None if script is None else script_pubkey_to_address(script, self.network_type)
+
+
+class AddressIndexTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from bitcoinpy.base.script import Script
+        from bitcoinpy.base.transaction import Transaction, TxIn, TxOut
+        from bitcoinpy.crypto.hashes import hash256
+        from bitcoinpy.test_data.synthetic import build_raw_block, coinbase_tx
+
+        cls.address_a = "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"
+        cls.address_b = "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"
+        script_a = Script(raw=script_pubkey_from_address(cls.address_a))
+        script_b = Script(raw=script_pubkey_from_address(cls.address_b))
+
+        cb0 = coinbase_tx(0)
+        cb0.tx_outs[0].script_pubkey = script_a
+        # pays 30 BTC to b with 19.9 BTC change to a, then a sends 19.8 BTC to b
+        tx1 = Transaction([TxIn(cb0.tx_id, 0)], [TxOut(30 * 10 ** 8, script_b), TxOut(1990000000, script_a)], 2, 0)
+        tx2 = Transaction([TxIn(tx1.tx_id, 1)], [TxOut(1980000000, script_b)], 2, 0)
+        cls.tx_ids = [cb0.tx_id, tx1.tx_id, tx2.tx_id]
+
+        cls.raw_blocks = list()
+        prev_hash = b"\x00" * 32
+        for txs in [[cb0], [coinbase_tx(1), tx1], [coinbase_tx(2), tx2]]:
+            raw = build_raw_block(txs, prev_hash)
+            cls.raw_blocks.append(raw)
+            prev_hash = hash256(raw[:80])[::-1]
+
+    def test_electrum_scripthash(self):
+        script = script_pubkey_from_address("1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa")
+        self.assertEqual(electrum_scripthash(script), "8b01df4e368ea28f8dc0423bcf7a4923e3a12d307c875e47a0cfbf90b5c39161")
+
+    def test_history_and_balance(self):
+        with AddressIndex(batch_size=1) as index:
+            index.index_raw_blocks(self.raw_blocks)
+            history = index.history(self.address_a)
+            self.assertEqual([(item.height, item.tx_id) for item in history], [(0, self.tx_ids[0]), (1, self.tx_ids[1]), (2, self.tx_ids[2])])
+            self.assertEqual([item.delta.to_sat for item in history], [50 * 10 ** 8, -10 ** 7 - 30 * 10 ** 8, -1990000000])
+            self.assertEqual(index.balance(self.address_a), BTCAmount(0))
+            self.assertEqual(index.balance(self.address_b), BTCAmount(4980000000))
+            self.assertEqual([item.value.to_sat for item in index.unspent(self.address_b)], [30 * 10 ** 8, 1980000000])
+
+            electrum = electrum_scripthash(script_pubkey_from_address(self.address_b))
+            self.assertEqual(index.balance_by_electrum(electrum), BTCAmount(4980000000))
+            self.assertEqual(index.address_of(bytes.fromhex(electrum)[::-1]), self.address_b)
+
+    def test_history_in_block_order(self):
+        from bitcoinpy.base.script import Script
+        from bitcoinpy.base.transaction import Transaction, TxIn, TxOut
+        from bitcoinpy.test_data.synthetic import build_raw_block, coinbase_tx
+        script_a = Script(raw=script_pubkey_from_address(self.address_a))
+        txs = [Transaction([TxIn(bytes([i]) * 32, 0)], [TxOut(1000 + i, script_a)], 2, 0) for i in range(1, 9)]
+        tx_ids = [tx.tx_id for tx in txs]
+        self.assertNotEqual(tx_ids, sorted(tx_ids))
+
+        with AddressIndex() as index:
+            index.index_raw_block(build_raw_block([coinbase_tx(0)] + txs), 0)
+            self.assertEqual([item.tx_id for item in index.history(self.address_a)], tx_ids)
+            self.assertEqual([item.tx_id for item in index.unspent(self.address_a)], tx_ids)
+
+    def test_incremental_and_rollback(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.sqlite")
+            with AddressIndex(path) as index:
+                index.index_raw_blocks(self.raw_blocks[:2])
+            with AddressIndex(path) as index:
+                self.assertEqual(index.height, 1)
+                self.assertEqual(index.balance(self.address_a), BTCAmount(1990000000))
+                # the spend in block 2 refers to an output written by the previous session
+                index.index_raw_blocks(self.raw_blocks)
+                self.assertEqual(index.balance(self.address_a), BTCAmount(0))
+                self.assertEqual(index.unknown_spends, 0)
+
+                index.rollback(2)
+                self.assertEqual(index.height, 1)
+                self.assertEqual(index.balance(self.address_a), BTCAmount(1990000000))
+                self.assertEqual(index.balance(self.address_b), BTCAmount(30 * 10 ** 8))
+                self.assertIsNone(index.block_hash(2))
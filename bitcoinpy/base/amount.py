@@ -1,53 +1,126 @@
-from decimal import Decimal, getcontext
-from typing import Union
+from decimal import Context, Decimal
+from typing import Iterable, Union
 from unittest import TestCase
 
+import numpy as np
+
+
+# private context: construction never depends on or changes the (thread) global decimal context
+_DECIMAL_CONTEXT = Context(prec=28)
+MAX_MONEY = 21000000 * 10 ** 8
+
 
 class BTCAmount:
+    __slots__ = ("sat_amount",)
     EXCHANGE = 10 ** 8
 
     def __init__(self, amount: Union[float, str, int]):
-        # Set decimal package config
-        getcontext().prec = 8
-        if isinstance(amount, str):
+        if type(amount) is int:
+            # amount is considered to be in "satoshi"
+            self.sat_amount = amount
+        elif isinstance(amount, str):
             try:
                 # case: string involving int
                 self.sat_amount = int(amount)
             except ValueError:
                 # case: string involving float
-                self.sat_amount = int(Decimal(amount) * BTCAmount.EXCHANGE)
-        elif isinstance(amount, float) or isinstance(amount, str):
-            # amount is considered to be in "satoshi"
-            self.sat_amount = int(Decimal(amount) * BTCAmount.EXCHANGE)
-        elif isinstance(amount, int):
-            # amount is considered to be in "btc"
-            self.sat_amount = amount
+                self.sat_amount = BTCAmount._btc_to_sat(amount)
+        elif isinstance(amount, float):
+            # amount is considered to be in "btc"; repr is the shortest string reading back as the same float
+            self.sat_amount = BTCAmount._btc_to_sat(repr(amount))
+        elif isinstance(amount, (int, np.integer)):
+            self.sat_amount = int(amount)
         else:
             raise Exception("Not allowed amount type: {}".format(type(amount)))
 
+    @staticmethod
+    def _btc_to_sat(btc: str) -> int:
+        return int(_DECIMAL_CONTEXT.multiply(Decimal(btc), BTCAmount.EXCHANGE))
+
+    @classmethod
+    def _from_sat(cls, sat_amount: int):
+        """ skip type dispatch of __init__ for results of arithmetic """
+        obj = object.__new__(cls)
+        obj.sat_amount = sat_amount
+        return obj
+
+    @classmethod
+    def from_btc(cls, amount: Union[float, str, int, Decimal]):
+        """ amount in "btc" whatever its type (e.g. "amount" of RPC results) """
+        if isinstance(amount, float):
+            amount = repr(amount)
+        return cls._from_sat(BTCAmount._btc_to_sat(str(amount)))
+
+    @staticmethod
+    def _sat_of(other) -> int:
+        if type(other) is BTCAmount:
+            return other.sat_amount
+        if type(other) is int:
+            return other
+        return NotImplemented
+
     def __add__(self, other):
-        return BTCAmount(self.sat_amount + other.sat_amount)
+        sat = BTCAmount._sat_of(other)
+        if sat is NotImplemented:
+            return NotImplemented
+        return BTCAmount._from_sat(self.sat_amount + sat)
+
+    # sum() starts from int 0
+    __radd__ = __add__
 
     def __sub__(self, other):
-        return BTCAmount(self.sat_amount - other.sat_amount)
+        sat = BTCAmount._sat_of(other)
+        if sat is NotImplemented:
+            return NotImplemented
+        return BTCAmount._from_sat(self.sat_amount - sat)
+
+    def __rsub__(self, other):
+        sat = BTCAmount._sat_of(other)
+        if sat is NotImplemented:
+            return NotImplemented
+        return BTCAmount._from_sat(sat - self.sat_amount)
+
+    def __neg__(self):
+        return BTCAmount._from_sat(-self.sat_amount)
+
+    def __abs__(self):
+        return BTCAmount._from_sat(abs(self.sat_amount))
 
     def __gt__(self, other):
         return self.sat_amount > other.sat_amount
 
+    def __ge__(self, other):
+        return self.sat_amount >= other.sat_amount
+
     def __lt__(self, other):
         return self.sat_amount < other.sat_amount
 
+    def __le__(self, other):
+        return self.sat_amount <= other.sat_amount
+
     def __eq__(self, other):
+        if not isinstance(other, BTCAmount):
+            return NotImplemented
         return self.sat_amount == other.sat_amount
 
+    def __hash__(self):
+        return hash(self.sat_amount)
+
+    def __bool__(self):
+        return self.sat_amount != 0
+
+    def __int__(self):
+        return self.sat_amount
+
     def __str__(self):
-        pre_dot = self.sat_amount // BTCAmount.EXCHANGE
-        sur_dot = "{}".format(str(self.sat_amount % BTCAmount.EXCHANGE).zfill(8))
-        return "{}.{}".format(pre_dot, sur_dot)
+        return self.to_btc
+
+    def __repr__(self):
+        return "BTCAmount({})".format(self.sat_amount)
 
     def scalar_mul(self, scalar: int):
         """ multiplication between BTCAmount and Integer"""
-        return BTCAmount(self.sat_amount * scalar)
+        return BTCAmount._from_sat(self.sat_amount * scalar)
 
     def to_fixed_size_bytes(self, length: int, byteorder: str):
         return self.sat_amount.to_bytes(length, byteorder)
@@ -58,9 +131,101 @@ class BTCAmount:
 
     @property
     def to_btc(self) -> str:
-        pre_dot = self.sat_amount // BTCAmount.EXCHANGE
-        sur_dot = "{}".format(str(self.sat_amount % BTCAmount.EXCHANGE).zfill(8))
-        return "{}.{}".format(pre_dot, sur_dot)
+        sat_amount = abs(self.sat_amount)
+        pre_dot = sat_amount // BTCAmount.EXCHANGE
+        sur_dot = "{}".format(str(sat_amount % BTCAmount.EXCHANGE).zfill(8))
+        return "{}{}.{}".format("-" if self.sat_amount < 0 else "", pre_dot, sur_dot)
+
+
+class BTCAmountArray:
+    """
+    Satoshi amounts in a numpy int64 array for summing and filtering many values at once.
+    Operations which could leave int64 raise OverflowError instead of wrapping around.
+    """
+    __slots__ = ("sats",)
+
+    def __init__(self, amounts: Union[np.ndarray, Iterable] = ()):
+        if isinstance(amounts, np.ndarray):
+            if amounts.dtype != np.int64:
+                if not np.issubdtype(amounts.dtype, np.integer):
+                    raise Exception("Not allowed amount dtype: {}".format(amounts.dtype))
+                if amounts.size and (amounts.max() > np.iinfo(np.int64).max):
+                    raise OverflowError("amount out of int64 range")
+            self.sats = amounts.astype(np.int64, copy=False)
+        else:
+            # python ints beyond int64 raise OverflowError here
+            self.sats = np.array([amount.sat_amount if isinstance(amount, BTCAmount) else amount for amount in amounts], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.sats)
+
+    def __iter__(self):
+        for sat in self.sats.tolist():
+            yield BTCAmount._from_sat(sat)
+
+    def __getitem__(self, item):
+        """ index gives BTCAmount; slice, mask or index array gives BTCAmountArray """
+        result = self.sats[item]
+        if isinstance(result, np.ndarray):
+            return BTCAmountArray(result)
+        return BTCAmount._from_sat(int(result))
+
+    @staticmethod
+    def _sats_of(other):
+        if isinstance(other, BTCAmountArray):
+            return other.sats
+        if isinstance(other, BTCAmount):
+            return other.sat_amount
+        return other
+
+    def __add__(self, other):
+        other = BTCAmountArray._sats_of(other)
+        result = self.sats + other
+        # overflow iff both operands have the same sign and the result has the other one
+        if np.any((self.sats ^ result) & (other ^ result) < 0):
+            raise OverflowError("amount sum out of int64 range")
+        return BTCAmountArray(result)
+
+    def __sub__(self, other):
+        other = BTCAmountArray._sats_of(other)
+        result = self.sats - other
+        if np.any((self.sats ^ other) & (self.sats ^ result) < 0):
+            raise OverflowError("amount difference out of int64 range")
+        return BTCAmountArray(result)
+
+    def __lt__(self, other):
+        return self.sats < BTCAmountArray._sats_of(other)
+
+    def __le__(self, other):
+        return self.sats <= BTCAmountArray._sats_of(other)
+
+    def __gt__(self, other):
+        return self.sats > BTCAmountArray._sats_of(other)
+
+    def __ge__(self, other):
+        return self.sats >= BTCAmountArray._sats_of(other)
+
+    def sum(self) -> BTCAmount:
+        if len(self.sats) == 0:
+            return BTCAmount._from_sat(0)
+        # int64 accumulation is exact if no partial sum can leave the range
+        bound = max(int(self.sats.max()), -int(self.sats.min()))
+        if bound * len(self.sats) <= np.iinfo(np.int64).max:
+            return BTCAmount._from_sat(int(self.sats.sum()))
+        return BTCAmount._from_sat(sum(self.sats.tolist()))
+
+    def filter(self, min_amount: Union[BTCAmount, int] = None, max_amount: Union[BTCAmount, int] = None):
+        """ amounts in [min_amount, max_amount] """
+        mask = np.ones(len(self.sats), dtype=bool)
+        if min_amount is not None:
+            mask &= self.sats >= BTCAmountArray._sats_of(min_amount)
+        if max_amount is not None:
+            mask &= self.sats <= BTCAmountArray._sats_of(max_amount)
+        return BTCAmountArray(self.sats[mask])
+
+    def in_money_range(self) -> bool:
+        """ every value in [0, MAX_MONEY] as required for transaction outputs """
+        return bool(np.all((self.sats >= 0) & (self.sats <= MAX_MONEY)))
 
 
 class BTCAmountTest(TestCase):
@@ -72,3 +237,34 @@ class BTCAmountTest(TestCase):
         actual = dot_one + dot_one + dot_one - dot_three
 
         self.assertEqual(expected, actual)
+
+    def test_precision_and_context(self):
+        from decimal import getcontext
+        prec = getcontext().prec
+        self.assertEqual(BTCAmount("20999999.99999999").to_sat, 2099999999999999)
+        self.assertEqual(BTCAmount(1.23456789).to_sat, 123456789)
+        self.assertEqual(BTCAmount.from_btc(50).to_sat, 50 * 10 ** 8)
+        self.assertEqual(getcontext().prec, prec)
+
+        self.assertEqual(sum([BTCAmount(1), BTCAmount(2)]), BTCAmount(3))
+        self.assertEqual(str(BTCAmount(-150000000)), "-1.50000000")
+        self.assertEqual(len({BTCAmount(5), BTCAmount(5)}), 1)
+        self.assertNotEqual(BTCAmount(5), 5)
+        with self.assertRaises(AttributeError):
+            BTCAmount(1).btc = 1
+
+    def test_amount_array(self):
+        amounts = BTCAmountArray([BTCAmount(1000), 2000, 3000])
+        self.assertEqual(amounts.sum(), BTCAmount(6000))
+        self.assertEqual(list(amounts.filter(min_amount=BTCAmount(1500))), [BTCAmount(2000), BTCAmount(3000)])
+        self.assertEqual(amounts[amounts > 1500].sum(), BTCAmount(5000))
+        self.assertEqual(amounts[0], BTCAmount(1000))
+        self.assertTrue(amounts.in_money_range())
+
+        big = BTCAmountArray(np.array([2 ** 62, 2 ** 62, 2 ** 62], dtype=np.int64))
+        self.assertEqual(big.sum().to_sat, 3 * 2 ** 62)
+        with self.assertRaises(OverflowError):
+            big + big
+        with self.assertRaises(OverflowError):
+            BTCAmountArray([2 ** 63])
+        self.assertFalse(big.in_money_range())
@@ -1,8 +1,11 @@
-from typing import Union
+from io import BytesIO
+from typing import Union, Iterator
 
 from bitcoinpy.base.bytes import BTCBytes
-from header import Header
-from merkle_tree import BTCMerkleTree
+from bitcoinpy.base.header import Header
+from bitcoinpy.base.merkle_tree import BTCMerkleTree
+from bitcoinpy.base.transaction import Transaction
+from bitcoinpy.utils.varint import read_varint, varint_size, write_varint_into
 
 # import for test below
 import os
@@ -11,10 +14,12 @@ from unittest import TestCase
 
 
 class Block(Header):
-    def __init__(self, tx_ids: list, version: bytes, prev_hash: bytes, merkle_root: bytes, _time: bytes, bits: bytes, nonce: bytes, height: int = 0):
+    def __init__(self, tx_ids: list, version: bytes, prev_hash: bytes, merkle_root: bytes, _time: bytes, bits: bytes, nonce: bytes, height: int = 0, transactions: list = None):
         """ all delivered bytes have big endian form """
         super().__init__(version, prev_hash, merkle_root, _time, bits, nonce, height)
         self.tx_ids = [BTCBytes.from_big_hex(tx) for tx in tx_ids]
+        # parsed transactions; only available when the block is built from raw bytes
+        self.transactions = transactions
         self.merkle_prover = BTCMerkleTree.from_big_endian_hex_list(tx_ids)
 
         if super().merkle_root != self.merkle_prover.root:
@@ -32,6 +37,66 @@ class Block(Header):
         height = int(block_dict["height"])
         return cls(tx_ids, version, prev_hash, mr, timestamp, bits, nonce, height)
 
+    @classmethod
+    def from_raw(cls, raw_block: bytes, height: int = 0):
+        """ parse serialized block (getblock verbosity 0): 80-byte header followed by all transactions """
+        s = BytesIO(raw_block)
+        header = Header.parse_from_bytes_io(s)
+        tx_num: int = read_varint(s)
+        transactions = [Transaction.parse_from_bytes_io(s) for _ in range(tx_num)]
+        return cls.from_header_and_transactions(header, transactions, height)
+
+    @classmethod
+    def from_header_and_transactions(cls, header: Header, transactions: list, height: int = 0):
+        tx_ids = [tx.tx_id.hex() for tx in transactions]
+        return cls(
+            tx_ids,
+            header.version.bytes_as_be,
+            header.prev_hash.bytes_as_be,
+            header.merkle_root.bytes_as_be,
+            header.time.to_bytes(4, "big"),
+            header.bits.to_bytes(4, "big"),
+            header.nonce.to_bytes(4, "big"),
+            height,
+            transactions
+        )
+
+    @classmethod
+    def from_raw_hex(cls, raw_block_hex: str, height: int = 0):
+        if raw_block_hex.startswith("0x"):
+            raw_block_hex = raw_block_hex[2:]
+        return cls.from_raw(bytes.fromhex(raw_block_hex), height)
+
+    @staticmethod
+    def iter_raw_transactions(raw_block: bytes) -> Iterator[Transaction]:
+        """
+        Yield transactions of a serialized block one at a time.
+        Only the transaction currently yielded is kept alive, so the whole block is never materialized.
+        """
+        s = BytesIO(raw_block)
+        s.seek(80)  # skip header; use Header.parse_from_bytes_io() for it
+        tx_num: int = read_varint(s)
+        for _ in range(tx_num):
+            yield Transaction.parse_from_bytes_io(s)
+
+    def serialized_size(self) -> int:
+        """ size of the header and all transactions """
+        if self.transactions is None:
+            raise Exception("Block has no parsed transactions")
+        size = 80 + varint_size(len(self.transactions))
+        for tx in self.transactions:
+            size += tx.serialized_size()
+        return size
+
+    def raw_serialize(self) -> bytes:
+        """ serialize header and transactions (same as getblock verbosity 0) into a single pre-sized buffer """
+        result = bytearray(self.serialized_size())
+        result[:80] = self.serialize()
+        offset = write_varint_into(result, 80, len(self.transactions))
+        for tx in self.transactions:
+            offset = tx.serialize_into(result, offset)
+        return bytes(result)
+
     @property
     def txs(self):
         return self.tx_ids
@@ -58,6 +123,21 @@ class Block(Header):
 
 
 class BitcoinBlockTest(TestCase):
+    genesis_raw = "0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c0101000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000"
+
+    def test_block_from_raw(self):
+        block = Block.from_raw_hex(BitcoinBlockTest.genesis_raw)
+        self.assertEqual(block.hash.hex_as_be, "0x000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f")
+        self.assertEqual(len(block.transactions), 1)
+        self.assertEqual(block.get_tx_by_index(0).hex_as_be, "0x4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b")
+        self.assertEqual(block.transactions[0].tx_outs[0].amount, 50 * 10**8)
+        self.assertEqual(block.raw_serialize().hex(), BitcoinBlockTest.genesis_raw)
+
+    def test_iter_raw_transactions(self):
+        raw = bytes.fromhex(BitcoinBlockTest.genesis_raw)
+        tx_ids = [tx.tx_id.hex() for tx in Block.iter_raw_transactions(raw)]
+        self.assertEqual(tx_ids, ["4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b"])
+
     def test_block_constructor(self):
         block_path = "../test_data/blocks/mainnet_684032.json"
         with open(block_path) as json_data:
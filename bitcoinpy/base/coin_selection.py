@@ -0,0 +1,337 @@
+import time
+from collections import namedtuple
+from typing import Union
+
+import numpy as np
+
+from bitcoinpy.base.amount import BTCAmount
+from bitcoinpy.base.script_type import ScriptType, script_type_of
+from bitcoinpy.base.tx_builder import INPUT_SIZE_ESTIMATES
+
+# import for test below
+from unittest import TestCase
+
+
+# vsize of a signed input by script type; wallet P2SH outputs are assumed to be P2SH-P2WPKH
+INPUT_VSIZES = {script_type: (4 * (36 + 1 + script_sig + 4) + witness + 3) // 4 for script_type, (script_sig, witness) in INPUT_SIZE_ESTIMATES.items()}
+INPUT_VSIZES[ScriptType.P2SH] = (4 * (36 + 1 + 23 + 4) + 108 + 3) // 4
+DEFAULT_INPUT_VSIZE = INPUT_VSIZES[ScriptType.P2PKH]
+
+CHANGE_OUTPUT_VSIZE = 31  # P2WPKH output
+CHANGE_SPEND_VSIZE = INPUT_VSIZES[ScriptType.P2WPKH]
+TX_OVERHEAD_VSIZE = 11  # version, counts, lock time and (rounded) segwit marker
+DUST_THRESHOLD = 294  # of P2WPKH change
+
+SelectionResult = namedtuple("SelectionResult", ["algorithm", "indices", "selected_value", "fee", "change", "waste", "elapsed_ms"])
+SelectionResult.__doc__ = """
+indices: rows of the UtxoTable, selected_value/fee/change: BTCAmount (change is None for changeless result),
+waste: satoshi as in bitcoind (input fees above long term rate plus change cost or excess), elapsed_ms: total selection time
+"""
+
+
+def _fees(vsizes: np.ndarray, fee_rate: float) -> np.ndarray:
+    """ fee of each input in satoshi, rounded up """
+    return np.ceil(vsizes * fee_rate).astype(np.int64)
+
+
+class UtxoTable:
+    """
+    Columnar UTXO set: txid ((n, 32) uint8 array, big endian), vout, amount (int64 satoshi) and estimated input vsize.
+    Effective value (amount minus fee of spending) is derived per fee rate with one vectorized operation.
+    """
+    def __init__(self, txids: np.ndarray, vouts: np.ndarray, amounts: np.ndarray, input_vsizes: np.ndarray = None):
+        if not isinstance(txids, np.ndarray):
+            txids = np.frombuffer(b"".join(txids), dtype=np.uint8).reshape(-1, 32)
+        self.txids = txids
+        self.vouts = np.asarray(vouts, dtype=np.uint32)
+        self.amounts = np.asarray(amounts, dtype=np.int64)
+        if input_vsizes is None:
+            input_vsizes = np.full(len(self.amounts), DEFAULT_INPUT_VSIZE)
+        self.input_vsizes = np.asarray(input_vsizes, dtype=np.int64)
+        if not (len(self.txids) == len(self.vouts) == len(self.amounts) == len(self.input_vsizes)):
+            raise Exception("Columns of different length")
+        self._effective = (None, None)
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @classmethod
+    def from_listunspent(cls, utxos: list):
+        """ from "listunspent" RPC result; input size is estimated from scriptPubKey """
+        txids = [bytes.fromhex(utxo["txid"]) for utxo in utxos]
+        vouts = [utxo["vout"] for utxo in utxos]
+        amounts = [BTCAmount.from_btc(utxo["amount"]).to_sat for utxo in utxos]
+        vsizes = list()
+        for utxo in utxos:
+            script_type = script_type_of(bytes.fromhex(utxo.get("scriptPubKey", "")))
+            vsizes.append(INPUT_VSIZES.get(script_type, DEFAULT_INPUT_VSIZE))
+        return cls(txids, vouts, amounts, vsizes)
+
+    def effective_values(self, fee_rate: float) -> np.ndarray:
+        """ amount - fee of spending at fee_rate (sat/vB); the last result is kept """
+        if self._effective[0] != fee_rate:
+            self._effective = (fee_rate, self.amounts - _fees(self.input_vsizes, fee_rate))
+        return self._effective[1]
+
+    def outpoints(self, indices) -> list:
+        """ list of (txid hex, vout) """
+        return [(self.txids[i].tobytes().hex(), int(self.vouts[i])) for i in indices]
+
+    @property
+    def total(self) -> BTCAmount:
+        return BTCAmount(int(self.amounts.sum()))
+
+
+def _descending_positive(effective: np.ndarray) -> np.ndarray:
+    """ indices of the positive effective values, largest first (ties in index order) """
+    positive = np.nonzero(effective > 0)[0]
+    return positive[np.argsort(-effective[positive], kind="stable")]
+
+
+class _Budget:
+    def __init__(self, time_budget_ms: float):
+        self.deadline = time.perf_counter() + time_budget_ms / 1000
+
+    def exceeded(self) -> bool:
+        return time.perf_counter() > self.deadline
+
+
+def branch_and_bound(effective: np.ndarray, waste: np.ndarray, target: int, cost_of_change: int,
+                     max_tries: int = 100000, budget: _Budget = None, order: np.ndarray = None) -> Union[np.ndarray, None]:
+    """
+    Depth first search (bitcoind SelectCoinsBnB) for the changeless input set with
+    target <= effective value <= target + cost_of_change and the least waste.
+    waste: per input fee minus fee at long term rate; order: _descending_positive(effective) if already sorted.
+    return indices or None
+    """
+    order = _descending_positive(effective) if order is None else order
+    # values above the window can never be part of a solution
+    order = order[effective[order] <= target + cost_of_change]
+    values = effective[order].tolist()
+    wastes = waste[order].tolist()
+    if sum(values) < target:
+        return None
+
+    fee_rate_high = len(wastes) > 0 and wastes[0] > 0
+    curr_value, curr_waste, curr_available = 0, 0, sum(values)
+    selection = list()
+    best, best_waste = None, float("inf")
+    index = 0
+    for tries in range(max_tries):
+        if budget is not None and tries & 0x3ff == 0 and budget.exceeded():
+            break
+        backtrack = False
+        if curr_value + curr_available < target or curr_value > target + cost_of_change or (curr_waste > best_waste and fee_rate_high):
+            backtrack = True
+        elif curr_value >= target:
+            excess = curr_value - target
+            if curr_waste + excess <= best_waste:
+                best, best_waste = list(selection), curr_waste + excess
+            backtrack = True
+
+        if backtrack:
+            if not selection:
+                break
+            # give back the lookahead of omitted values, then omit the last included one
+            index -= 1
+            while index > selection[-1]:
+                curr_available += values[index]
+                index -= 1
+            curr_value -= values[index]
+            curr_waste -= wastes[index]
+            selection.pop()
+        else:
+            value = values[index]
+            curr_available -= value
+            # omitting a value equal to the previous omitted one leads to the same subtrees
+            if not selection or index - 1 == selection[-1] or value != values[index - 1] or wastes[index] != wastes[index - 1]:
+                selection.append(index)
+                curr_value += value
+                curr_waste += wastes[index]
+        index += 1
+
+    if best is None:
+        return None
+    return order[best]
+
+
+def knapsack(effective: np.ndarray, target: int, iterations: int = 1000, pool_limit: int = 5000,
+             budget: _Budget = None, seed: int = None, order: np.ndarray = None) -> Union[np.ndarray, None]:
+    """
+    Stochastic approximation of the smallest subset reaching target (bitcoind KnapsackSolver).
+    Random subsets are evaluated on the pool_limit largest values below target with cumulative sums.
+    order: _descending_positive(effective) if already sorted
+    """
+    order = _descending_positive(effective) if order is None else order
+    values = effective[order]
+    # values are descending: the larger ones, those equal to target, then the smaller ones
+    larger_end = int(np.searchsorted(-values, -target, side="left"))
+    smaller_start = int(np.searchsorted(-values, -target, side="right"))
+    if smaller_start > larger_end:
+        return order[larger_end:larger_end + 1]
+
+    lowest_larger = None
+    if larger_end:
+        # the first (lowest index) of the smallest larger value
+        lowest_larger = order[int(np.searchsorted(-values, -values[larger_end - 1], side="left"))]
+    if values[smaller_start:].sum() < target:
+        return None if lowest_larger is None else np.array([lowest_larger])
+
+    order = order[smaller_start:smaller_start + pool_limit]
+    pool = effective[order]
+    cumulative = np.cumsum(pool)
+    end = int(np.searchsorted(cumulative, target))
+    if end == len(pool):
+        # largest values of the pool do not suffice
+        return None if lowest_larger is None else positive[[lowest_larger]]
+    best_mask, best_total = np.arange(len(pool)) <= end, int(cumulative[end])
+
+    rng = np.random.default_rng(seed)
+    for _ in range(iterations):
+        if best_total == target or budget is not None and budget.exceeded():
+            break
+        mask = rng.random(len(pool)) < 0.5
+        cumulative = np.cumsum(np.where(mask, pool, 0))
+        end = int(np.searchsorted(cumulative, target))
+        if end < len(pool) and cumulative[end] < best_total:
+            best_total = int(cumulative[end])
+            best_mask = mask & (np.arange(len(pool)) <= end)
+
+    if lowest_larger is not None and best_total != target and effective[lowest_larger] <= best_total:
+        return np.array([lowest_larger])
+    return order[best_mask]
+
+
+def largest_first(effective: np.ndarray, target: int, order: np.ndarray = None) -> Union[np.ndarray, None]:
+    """ fewest inputs: take the largest effective values until target is reached """
+    order = _descending_positive(effective) if order is None else order
+    cumulative = np.cumsum(effective[order])
+    if len(cumulative) == 0 or cumulative[-1] < target:
+        return None
+    end = int(np.searchsorted(cumulative, target))
+    return order[:end + 1]
+
+
+def select_coins(table: UtxoTable, target: Union[BTCAmount, int], fee_rate: float, long_term_fee_rate: float = 10,
+                 base_vsize: int = TX_OVERHEAD_VSIZE + CHANGE_OUTPUT_VSIZE, time_budget_ms: float = 200, max_tries: int = 100000,
+                 seed: int = None) -> Union[SelectionResult, None]:
+    """
+    Select UTXOs paying target (sum of outputs) plus fee of a transaction of base_vsize without inputs at fee_rate (sat/vB).
+    Branch and bound is tried first for a changeless result; knapsack and largest first results (with change) compete on waste.
+    time_budget_ms bounds the searches; it is a soft limit, since the one sort of the effective values before them
+    is not interrupted (about 70 ms for 500k UTXOs). return None if the table cannot fund the target
+    """
+    start = time.perf_counter()
+    budget = _Budget(time_budget_ms)
+    # branch and bound gets half of the time, the rest is left for knapsack
+    bnb_budget = _Budget(time_budget_ms / 2)
+    target = target.to_sat if isinstance(target, BTCAmount) else target
+    selection_target = target + int(np.ceil(base_vsize * fee_rate))
+    change_fee = int(np.ceil(CHANGE_OUTPUT_VSIZE * fee_rate))
+    cost_of_change = change_fee + int(np.ceil(CHANGE_SPEND_VSIZE * long_term_fee_rate))
+    min_change = max(DUST_THRESHOLD, int(np.ceil(CHANGE_SPEND_VSIZE * long_term_fee_rate)) + 1)
+
+    effective = table.effective_values(fee_rate)
+    waste = _fees(table.input_vsizes, fee_rate) - _fees(table.input_vsizes, long_term_fee_rate)
+
+    # sorted once for the three algorithms
+    order = _descending_positive(effective)
+    candidates = list()
+    selected = branch_and_bound(effective, waste, selection_target, cost_of_change, max_tries, bnb_budget, order)
+    if selected is not None:
+        candidates.append(("bnb", selected))
+    change_target = selection_target + change_fee + min_change
+    selected = knapsack(effective, change_target, budget=budget, seed=seed, order=order)
+    if selected is not None:
+        candidates.append(("knapsack", selected))
+    selected = largest_first(effective, change_target, order)
+    if selected is None:
+        # not enough for change, but possibly enough without
+        selected = largest_first(effective, selection_target, order)
+    if selected is not None:
+        candidates.append(("largest_first", selected))
+    if not candidates:
+        return None
+
+    best = None
+    for algorithm, indices in candidates:
+        excess = int(effective[indices].sum()) - selection_target
+        change = None
+        selection_waste = int(waste[indices].sum())
+        if excess >= change_fee + min_change:
+            change = excess - change_fee
+            selection_waste += cost_of_change
+        else:
+            selection_waste += excess
+        if best is None or selection_waste < best[3]:
+            best = (algorithm, indices, change, selection_waste)
+
+    algorithm, indices, change, selection_waste = best
+    selected_value = int(table.amounts[indices].sum())
+    fee = selected_value - target - (change or 0)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    change = None if change is None else BTCAmount(change)
+    return SelectionResult(algorithm, indices, BTCAmount(selected_value), BTCAmount(fee), change, selection_waste, elapsed_ms)
+
+
+class CoinSelectionTest(TestCase):
+    @staticmethod
+    def _table(amounts: list, vsize: int = 68) -> UtxoTable:
+        txids = [i.to_bytes(32, "big") for i in range(len(amounts))]
+        return UtxoTable(txids, list(range(len(amounts))), amounts, [vsize] * len(amounts))
+
+    def test_branch_and_bound_exact(self):
+        # with zero fee effective values equal amounts
+        table = self._table([1000, 2000, 3000, 4000, 5000])
+        effective = table.effective_values(0)
+        waste = np.zeros(len(table), dtype=np.int64)
+        selected = branch_and_bound(effective, waste, 6000, 0)
+        self.assertEqual(int(effective[selected].sum()), 6000)
+        self.assertIsNone(branch_and_bound(effective, waste, 15001, 0))
+        self.assertIsNone(branch_and_bound(effective, waste, 500, 0))
+
+    def test_select_changeless(self):
+        amounts = [10 ** 5 * (i + 1) for i in range(50)]
+        table = self._table(amounts)
+        fee_rate = 1
+        target = 10 ** 6 - 68 * 2 - 42  # two inputs of 500k and the fixed part pay it exactly
+        result = select_coins(table, BTCAmount(target), fee_rate, long_term_fee_rate=fee_rate, seed=1)
+        self.assertEqual(result.algorithm, "bnb")
+        self.assertIsNone(result.change)
+        total_vsize = 42 + 68 * len(result.indices)
+        self.assertGreaterEqual(result.fee.to_sat, total_vsize * fee_rate)
+        self.assertEqual(result.selected_value.to_sat, target + result.fee.to_sat)
+
+    def test_select_with_change(self):
+        rng = np.random.default_rng(7)
+        amounts = rng.integers(10 ** 4, 10 ** 8, 20000)
+        table = self._table(amounts.tolist())
+        result = select_coins(table, BTCAmount("1.23456789"), 5, seed=1)
+        self.assertIsNotNone(result)
+        selected = result.selected_value.to_sat
+        change = 0 if result.change is None else result.change.to_sat
+        self.assertEqual(selected - change - result.fee.to_sat, 123456789)
+        self.assertGreaterEqual(result.fee.to_sat, (53 + 68 * len(result.indices)) * 5 - 31 * 5)
+        self.assertEqual(len(set(table.outpoints(result.indices))), len(result.indices))
+
+        self.assertIsNone(select_coins(table, table.total, 5))
+
+    def test_from_listunspent(self):
+        utxos = [
+            {"txid": "11" * 32, "vout": 0, "amount": 50.0, "scriptPubKey": "0014" + "00" * 20},
+            {"txid": "22" * 31 + "00", "vout": 1, "amount": "0.00012345", "scriptPubKey": "76a914" + "00" * 20 + "88ac"},
+        ]
+        table = UtxoTable.from_listunspent(utxos)
+        self.assertEqual(table.amounts.tolist(), [50 * 10 ** 8, 12345])
+        self.assertEqual(table.input_vsizes.tolist(), [INPUT_VSIZES[ScriptType.P2WPKH], INPUT_VSIZES[ScriptType.P2PKH]])
+        self.assertEqual(table.outpoints([1]), [("22" * 31 + "00", 1)])
+
+    def test_time_budget(self):
+        rng = np.random.default_rng(0)
+        amounts = (10 ** rng.uniform(3, 9, 100000)).astype(np.int64)
+        table = UtxoTable(np.zeros((len(amounts), 32), dtype=np.uint8), np.zeros(len(amounts)), amounts)
+        for time_budget_ms in [20, 50]:
+            result = select_coins(table, 5 * 10 ** 9, 40, time_budget_ms=time_budget_ms, seed=1)
+            self.assertIsNotNone(result)
+            # soft limit: the sort of the table and the final comparison come on top of the searches
+            self.assertLess(result.elapsed_ms, time_budget_ms * 1.5 + 20)
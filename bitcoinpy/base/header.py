@@ -24,13 +24,18 @@ class Header:
     @classmethod
     def from_raw_str(cls, header_str: str):
         s = BytesIO(bytes.fromhex(header_str))
+        return cls.parse_from_bytes_io(s)
+
+    @classmethod
+    def parse_from_bytes_io(cls, s: BytesIO, height: int = 0):
+        """ read 80-byte serialized header (little endian fields) from the stream """
         version = s.read(4)
         prev_hash = s.read(32)
         mr = s.read(32)
         timestamp = s.read(4)
         bits = s.read(4)
         nonce = s.read(4)
-        return cls(version[::-1], prev_hash[::-1], mr[::-1], timestamp[::-1], bits[::-1], nonce[::-1])
+        return cls(version[::-1], prev_hash[::-1], mr[::-1], timestamp[::-1], bits[::-1], nonce[::-1], height)
 
     @classmethod
     def from_dict(cls, header_dict: dict):
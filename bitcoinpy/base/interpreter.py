@@ -0,0 +1,679 @@
+import hashlib
+import os
+from collections import OrderedDict
+from enum import Enum
+from typing import Union
+
+from bitcoinpy.base.opcodes import OP_CODE_NAMES
+from bitcoinpy.base.script import Script
+from bitcoinpy.base.script_type import ScriptType, classify_script_pubkey
+from bitcoinpy.base.sighash import SIGHASH_ALL, legacy_sighash, bip143_sighash
+from bitcoinpy.base.transaction import Transaction, TxIn, TxOut
+from bitcoinpy.crypto.hashes import hash160, hash256, sha256
+from bitcoinpy.crypto.secp256k1 import BitcoinPoint, Signature, PrivateKey
+
+# import for test below
+from unittest import TestCase
+
+
+LOCKTIME_THRESHOLD = 500000000
+SEQUENCE_DISABLE_FLAG = 1 << 31
+SEQUENCE_TYPE_FLAG = 1 << 22
+SEQUENCE_MASK = 0x0000ffff
+
+MAX_SCRIPT_SIZE = 10000
+MAX_SCRIPT_ELEMENT_SIZE = 520
+MAX_STACK_SIZE = 1000
+MAX_OPS_PER_SCRIPT = 201
+MAX_PUBKEYS_PER_MULTISIG = 20
+
+
+class SigVersion(Enum):
+    BASE = 0
+    WITNESS_V0 = 1
+
+
+class ScriptError(Exception):
+    pass
+
+
+class UnsupportedScriptError(Exception):
+    """ raised for spends this interpreter cannot validate (taproot), instead of a result differing from bitcoind """
+    pass
+
+
+def encode_num(num: int) -> bytes:
+    """ minimal little endian sign-magnitude encoding of script numbers """
+    if num == 0:
+        return b''
+    abs_num = abs(num)
+    result = bytearray()
+    while abs_num:
+        result.append(abs_num & 0xff)
+        abs_num >>= 8
+    if result[-1] & 0x80:
+        result.append(0x80 if num < 0 else 0x00)
+    elif num < 0:
+        result[-1] |= 0x80
+    return bytes(result)
+
+
+def decode_num(element: bytes, max_size: int = 4) -> int:
+    if len(element) > max_size:
+        raise ScriptError("Script number overflow")
+    if element == b'':
+        return 0
+    big_endian = element[::-1]
+    negative = big_endian[0] & 0x80
+    result = big_endian[0] & 0x7f
+    for c in big_endian[1:]:
+        result = (result << 8) + c
+    return -result if negative else result
+
+
+def cast_to_bool(element: bytes) -> bool:
+    for i, c in enumerate(element):
+        if c != 0:
+            # negative zero is false
+            return not (i == len(element) - 1 and c == 0x80)
+    return False
+
+
+class SignatureCache:
+    """
+    Bounded cache of valid signatures keyed by (sighash, pubkey, signature),
+    so transactions validated once (e.g. in mempool) skip EC verification when seen again (e.g. in a block).
+    """
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._salt = os.urandom(32)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, sighash: bytes, pubkey: bytes, sig: bytes) -> bytes:
+        return hashlib.sha256(self._salt + sighash + pubkey + sig).digest()
+
+    def contains(self, sighash: bytes, pubkey: bytes, sig: bytes) -> bool:
+        key = self._key(sighash, pubkey, sig)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, sighash: bytes, pubkey: bytes, sig: bytes):
+        self._entries[self._key(sighash, pubkey, sig)] = None
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+
+class TransactionSignatureChecker:
+    """ signature, lock time and sequence checks of one input of a transaction """
+    def __init__(self, tx: Transaction, index: int, amount: int = 0, cache: SignatureCache = None):
+        self.tx = tx
+        self.index = index
+        self.amount = amount
+        self.cache = cache
+
+    def sighash(self, script_code: bytes, hash_type: int, sig_version: SigVersion) -> bytes:
+        if sig_version == SigVersion.WITNESS_V0:
+            return bip143_sighash(self.tx, self.index, script_code, self.amount, hash_type)
+        return legacy_sighash(self.tx, self.index, script_code, hash_type)
+
+    def check_sig(self, sig: bytes, pubkey: bytes, script_code: bytes, sig_version: SigVersion) -> bool:
+        if len(sig) == 0:
+            return False
+        hash_type = sig[-1]
+        der = sig[:-1]
+        sighash = self.sighash(script_code, hash_type, sig_version)
+        if self.cache is not None and self.cache.contains(sighash, pubkey, der):
+            return True
+
+        try:
+            point = BitcoinPoint.parse_sec(pubkey)
+            signature = Signature.parse(der)
+        except (SyntaxError, ValueError, IndexError):
+            return False
+        valid = point.verify(int.from_bytes(sighash, 'big'), signature)
+        if valid and self.cache is not None:
+            self.cache.add(sighash, pubkey, der)
+        return valid
+
+    def check_lock_time(self, lock_time: int) -> bool:
+        tx_lock_time = self.tx.lock_time
+        if (tx_lock_time < LOCKTIME_THRESHOLD) != (lock_time < LOCKTIME_THRESHOLD):
+            return False
+        if lock_time > tx_lock_time:
+            return False
+        return self.tx.tx_ins[self.index].sequence != 0xffffffff
+
+    def check_sequence(self, sequence: int) -> bool:
+        tx_sequence = self.tx.tx_ins[self.index].sequence
+        if self.tx.version < 2 or tx_sequence & SEQUENCE_DISABLE_FLAG:
+            return False
+        mask = SEQUENCE_TYPE_FLAG | SEQUENCE_MASK
+        tx_sequence &= mask
+        sequence &= mask
+        if (tx_sequence < SEQUENCE_TYPE_FLAG) != (sequence < SEQUENCE_TYPE_FLAG):
+            return False
+        return sequence <= tx_sequence
+
+
+def _serialize_cmds(cmds: list) -> bytes:
+    return Script(cmds).raw_serialize() if len(cmds) > 0 else b''
+
+
+def _push(data: bytes) -> bytes:
+    """ push of data as bitcoind's CScript() << data encodes it """
+    return Script._push_prefix(len(data)) + data
+
+
+def find_and_delete(script_code: bytes, pattern: bytes) -> bytes:
+    """ bitcoind's FindAndDelete: remove every op of script_code equal to pattern, matching on op boundaries only """
+    ends = list()
+    Script.tokenize(script_code, ends)
+    result = bytearray()
+    start = 0
+    for end in ends:
+        if script_code[start:end] != pattern:
+            result += script_code[start:end]
+        start = end
+    return bytes(result)
+
+
+def _legacy_script_code(script_code: bytes, sigs: list) -> bytes:
+    """ scriptCode signed by legacy sighash: without the signatures and OP_CODESEPARATORs """
+    for sig in sigs:
+        script_code = find_and_delete(script_code, _push(sig))
+    return find_and_delete(script_code, b'\xab')
+
+
+def eval_script(script: Union[bytes, list], stack: list, checker: TransactionSignatureChecker, sig_version: SigVersion) -> bool:
+    """
+    execute a raw script (or cmds, serialized first) on the stack; return False (or raise ScriptError) when the script fails.
+    Signatures are checked against the raw bytes after the last OP_CODESEPARATOR, so non-minimal pushes sign as they are.
+    """
+    raw = script if isinstance(script, bytes) else _serialize_cmds(script)
+    if len(raw) > MAX_SCRIPT_SIZE:
+        raise ScriptError("Script size limit exceeded")
+    ends = list()
+    cmds = Script.tokenize(raw, ends)
+    alt_stack = list()
+    exec_stack = list()  # branch conditions of the nested IF
+    code_separator = 0  # byte offset
+    op_count = 0
+
+    def pop():
+        if len(stack) < 1:
+            raise ScriptError("Stack underflow")
+        return stack.pop()
+
+    def need(n: int):
+        if len(stack) < n:
+            raise ScriptError("Stack underflow")
+
+    for pc, cmd in enumerate(cmds):
+        executing = all(exec_stack)
+        if type(cmd) != int:
+            if len(cmd) > MAX_SCRIPT_ELEMENT_SIZE:
+                raise ScriptError("Push size limit exceeded")
+            if executing:
+                stack.append(cmd)
+                if len(stack) + len(alt_stack) > MAX_STACK_SIZE:
+                    raise ScriptError("Stack size limit exceeded")
+            continue
+
+        name = OP_CODE_NAMES.get(cmd)
+        if cmd > 96:
+            op_count += 1
+            if op_count > MAX_OPS_PER_SCRIPT:
+                raise ScriptError("Op count limit exceeded")
+        if name is None and cmd > 0x4e:
+            # OP_VERIF, OP_VERNOTIF, OP_CAT and the other disabled op codes fail even in an unexecuted branch
+            if 101 <= cmd <= 102 or 126 <= cmd <= 129 or 131 <= cmd <= 134 or 141 <= cmd <= 142 or 149 <= cmd <= 153:
+                raise ScriptError("Disabled op code: {}".format(cmd))
+
+        if name in ("OP_IF", "OP_NOTIF"):
+            value = False
+            if executing:
+                value = cast_to_bool(pop())
+                if name == "OP_NOTIF":
+                    value = not value
+            exec_stack.append(value)
+            continue
+        if name == "OP_ELSE":
+            if len(exec_stack) == 0:
+                raise ScriptError("Unbalanced conditional")
+            exec_stack[-1] = not exec_stack[-1]
+            continue
+        if name == "OP_ENDIF":
+            if len(exec_stack) == 0:
+                raise ScriptError("Unbalanced conditional")
+            exec_stack.pop()
+            continue
+        if not executing:
+            continue
+
+        if name == "OP_0":
+            stack.append(b'')
+        elif name == "OP_1NEGATE":
+            stack.append(encode_num(-1))
+        elif 0x51 <= cmd <= 0x60:
+            stack.append(encode_num(cmd - 0x50))
+        elif name is None:
+            raise ScriptError("Bad op code: {}".format(cmd))
+        elif name in ("OP_NOP", "OP_NOP1", "OP_NOP4", "OP_NOP5", "OP_NOP6", "OP_NOP7", "OP_NOP8", "OP_NOP9", "OP_NOP10"):
+            pass
+        elif name == "OP_CHECKLOCKTIMEVERIFY":
+            need(1)
+            lock_time = decode_num(stack[-1], 5)
+            if lock_time < 0 or not checker.check_lock_time(lock_time):
+                return False
+        elif name == "OP_CHECKSEQUENCEVERIFY":
+            need(1)
+            sequence = decode_num(stack[-1], 5)
+            if sequence < 0:
+                return False
+            if not sequence & SEQUENCE_DISABLE_FLAG and not checker.check_sequence(sequence):
+                return False
+        elif name == "OP_VERIFY":
+            if not cast_to_bool(pop()):
+                return False
+        elif name == "OP_RETURN":
+            return False
+        elif name == "OP_TOALTSTACK":
+            alt_stack.append(pop())
+        elif name == "OP_FROMALTSTACK":
+            if len(alt_stack) < 1:
+                raise ScriptError("Alt stack underflow")
+            stack.append(alt_stack.pop())
+        elif name == "OP_2DROP":
+            need(2)
+            del stack[-2:]
+        elif name == "OP_2DUP":
+            need(2)
+            stack.extend(stack[-2:])
+        elif name == "OP_3DUP":
+            need(3)
+            stack.extend(stack[-3:])
+        elif name == "OP_2OVER":
+            need(4)
+            stack.extend(stack[-4:-2])
+        elif name == "OP_2ROT":
+            need(6)
+            stack.extend(stack[-6:-4])
+            del stack[-8:-6]
+        elif name == "OP_2SWAP":
+            need(4)
+            stack[-4:] = stack[-2:] + stack[-4:-2]
+        elif name == "OP_IFDUP":
+            need(1)
+            if cast_to_bool(stack[-1]):
+                stack.append(stack[-1])
+        elif name == "OP_DEPTH":
+            stack.append(encode_num(len(stack)))
+        elif name == "OP_DROP":
+            pop()
+        elif name == "OP_DUP":
+            need(1)
+            stack.append(stack[-1])
+        elif name == "OP_NIP":
+            need(2)
+            del stack[-2]
+        elif name == "OP_OVER":
+            need(2)
+            stack.append(stack[-2])
+        elif name in ("OP_PICK", "OP_ROLL"):
+            n = decode_num(pop())
+            if n < 0 or n >= len(stack):
+                raise ScriptError("Invalid stack operation")
+            item = stack[-n - 1]
+            if name == "OP_ROLL":
+                del stack[-n - 1]
+            stack.append(item)
+        elif name == "OP_ROT":
+            need(3)
+            stack.append(stack.pop(-3))
+        elif name == "OP_SWAP":
+            need(2)
+            stack[-2], stack[-1] = stack[-1], stack[-2]
+        elif name == "OP_TUCK":
+            need(2)
+            stack.insert(-2, stack[-1])
+        elif name == "OP_SIZE":
+            need(1)
+            stack.append(encode_num(len(stack[-1])))
+        elif name in ("OP_EQUAL", "OP_EQUALVERIFY"):
+            equal = pop() == pop()
+            if name == "OP_EQUALVERIFY":
+                if not equal:
+                    return False
+            else:
+                stack.append(encode_num(1) if equal else b'')
+        elif name in ("OP_1ADD", "OP_1SUB", "OP_NEGATE", "OP_ABS", "OP_NOT", "OP_0NOTEQUAL"):
+            a = decode_num(pop())
+            result = {
+                "OP_1ADD": lambda: a + 1,
+                "OP_1SUB": lambda: a - 1,
+                "OP_NEGATE": lambda: -a,
+                "OP_ABS": lambda: abs(a),
+                "OP_NOT": lambda: int(a == 0),
+                "OP_0NOTEQUAL": lambda: int(a != 0),
+            }[name]()
+            stack.append(encode_num(result))
+        elif name in ("OP_ADD", "OP_SUB", "OP_BOOLAND", "OP_BOOLOR", "OP_NUMEQUAL", "OP_NUMEQUALVERIFY",
+                      "OP_NUMNOTEQUAL", "OP_LESSTHAN", "OP_GREATERTHAN", "OP_LESSTHANOREQUAL",
+                      "OP_GREATERTHANOREQUAL", "OP_MIN", "OP_MAX"):
+            b = decode_num(pop())
+            a = decode_num(pop())
+            result = {
+                "OP_ADD": lambda: a + b,
+                "OP_SUB": lambda: a - b,
+                "OP_BOOLAND": lambda: int(a != 0 and b != 0),
+                "OP_BOOLOR": lambda: int(a != 0 or b != 0),
+                "OP_NUMEQUAL": lambda: int(a == b),
+                "OP_NUMEQUALVERIFY": lambda: int(a == b),
+                "OP_NUMNOTEQUAL": lambda: int(a != b),
+                "OP_LESSTHAN": lambda: int(a < b),
+                "OP_GREATERTHAN": lambda: int(a > b),
+                "OP_LESSTHANOREQUAL": lambda: int(a <= b),
+                "OP_GREATERTHANOREQUAL": lambda: int(a >= b),
+                "OP_MIN": lambda: min(a, b),
+                "OP_MAX": lambda: max(a, b),
+            }[name]()
+            if name == "OP_NUMEQUALVERIFY":
+                if not result:
+                    return False
+            else:
+                stack.append(encode_num(result))
+        elif name == "OP_WITHIN":
+            maximum = decode_num(pop())
+            minimum = decode_num(pop())
+            x = decode_num(pop())
+            stack.append(encode_num(int(minimum <= x < maximum)))
+        elif name == "OP_RIPEMD160":
+            stack.append(hashlib.new('ripemd160', pop()).digest())
+        elif name == "OP_SHA1":
+            stack.append(hashlib.sha1(pop()).digest())
+        elif name == "OP_SHA256":
+            stack.append(sha256(pop()))
+        elif name == "OP_HASH160":
+            stack.append(hash160(pop()))
+        elif name == "OP_HASH256":
+            stack.append(hash256(pop()))
+        elif name == "OP_CODESEPARATOR":
+            code_separator = ends[pc]
+        elif name in ("OP_CHECKSIG", "OP_CHECKSIGVERIFY"):
+            pubkey = pop()
+            sig = pop()
+            script_code = raw[code_separator:]
+            if sig_version == SigVersion.BASE:
+                script_code = _legacy_script_code(script_code, [sig])
+            valid = checker.check_sig(sig, pubkey, script_code, sig_version)
+            if name == "OP_CHECKSIGVERIFY":
+                if not valid:
+                    return False
+            else:
+                stack.append(encode_num(1) if valid else b'')
+        elif name in ("OP_CHECKMULTISIG", "OP_CHECKMULTISIGVERIFY"):
+            n = decode_num(pop())
+            if n < 0 or n > MAX_PUBKEYS_PER_MULTISIG:
+                raise ScriptError("Invalid pubkey count")
+            op_count += n
+            if op_count > MAX_OPS_PER_SCRIPT:
+                raise ScriptError("Op count limit exceeded")
+            need(n)
+            pubkeys = [stack.pop() for _ in range(n)]
+            m = decode_num(pop())
+            if m < 0 or m > n:
+                raise ScriptError("Invalid signature count")
+            need(m + 1)
+            sigs = [stack.pop() for _ in range(m)]
+            stack.pop()  # extra item consumed by the off-by-one bug
+            script_code = raw[code_separator:]
+            if sig_version == SigVersion.BASE:
+                script_code = _legacy_script_code(script_code, sigs)
+
+            # signatures must match pubkeys in order
+            valid = True
+            key_pos = 0
+            for sig in sigs:
+                while key_pos < len(pubkeys) and not checker.check_sig(sig, pubkeys[key_pos], script_code, sig_version):
+                    key_pos += 1
+                if key_pos == len(pubkeys):
+                    valid = False
+                    break
+                key_pos += 1
+            if name == "OP_CHECKMULTISIGVERIFY":
+                if not valid:
+                    return False
+            else:
+                stack.append(encode_num(1) if valid else b'')
+        else:
+            raise ScriptError("Not supported op code: {}".format(name))
+
+        if len(stack) + len(alt_stack) > MAX_STACK_SIZE:
+            raise ScriptError("Stack size limit exceeded")
+
+    if len(exec_stack) != 0:
+        raise ScriptError("Unbalanced conditional")
+    return True
+
+
+def _is_push_only(cmds: list) -> bool:
+    for cmd in cmds:
+        if type(cmd) == int and cmd > 0x60:
+            return False
+    return True
+
+
+def _verify_witness_program(witness: list, version: int, program: bytes, checker: TransactionSignatureChecker, is_p2sh: bool) -> bool:
+    stack = [b'' if item == 0 else item for item in witness]
+    if version == 1 and len(program) == 32 and not is_p2sh:
+        raise UnsupportedScriptError("Expected a witness v0 or unknown witness program, but taproot")
+    if version != 0:
+        # reserved for soft fork upgrades: anyone can spend, as in bitcoind
+        return True
+    if len(program) == 20:
+        # P2WPKH: implied P2PKH script
+        if len(stack) != 2:
+            return False
+        script = bytes([0x76, 0xa9, 0x14]) + program + bytes([0x88, 0xac])
+    elif len(program) == 32:
+        # P2WSH: last witness item is the script
+        if len(stack) == 0:
+            return False
+        script = stack.pop()
+        if sha256(script) != program:
+            return False
+    else:
+        return False
+
+    if any(len(item) > MAX_SCRIPT_ELEMENT_SIZE for item in stack):
+        raise ScriptError("Push size limit exceeded")
+    if not eval_script(script, stack, checker, SigVersion.WITNESS_V0):
+        return False
+    return len(stack) == 1 and cast_to_bool(stack[0])
+
+
+def _witness_program(raw: bytes):
+    """ (version, program) if raw is a version op code and one push of 2 to 40 bytes (BIP141), else (None, None) """
+    if 4 <= len(raw) <= 42 and (raw[0] == 0 or 0x51 <= raw[0] <= 0x60) and raw[1] == len(raw) - 2:
+        return (0 if raw[0] == 0 else raw[0] - 0x50), raw[2:]
+    return None, None
+
+
+def verify_input(tx: Transaction, index: int, script_pubkey: Script, amount: int = 0, cache: SignatureCache = None) -> bool:
+    """
+    verify legacy, P2SH and segwit v0 spending of the output (script_pubkey, amount) by input "index".
+    Unknown witness versions pass as in bitcoind; taproot spends raise UnsupportedScriptError
+    """
+    tx_in = tx.tx_ins[index]
+    checker = TransactionSignatureChecker(tx, index, amount, cache)
+    script_sig_raw = tx_in.script_sig.raw_serialize()
+    script_pubkey_raw = script_pubkey.raw_serialize()
+
+    try:
+        stack = list()
+        if not eval_script(script_sig_raw, stack, checker, SigVersion.BASE):
+            return False
+        stack_copy = list(stack)
+        if not eval_script(script_pubkey_raw, stack, checker, SigVersion.BASE):
+            return False
+        if len(stack) == 0 or not cast_to_bool(stack[-1]):
+            return False
+
+        version, program = _witness_program(script_pubkey_raw)
+        if version is not None:
+            if len(script_sig_raw) != 0:
+                return False  # witness spends require empty scriptSig
+            return _verify_witness_program(tx_in.witness, version, program, checker, False)
+
+        if classify_script_pubkey(script_pubkey_raw)[0] == ScriptType.P2SH:
+            if not _is_push_only(Script.tokenize(script_sig_raw)):
+                return False
+            redeem_script = stack_copy.pop()
+            if not eval_script(redeem_script, stack_copy, checker, SigVersion.BASE):
+                return False
+            if len(stack_copy) == 0 or not cast_to_bool(stack_copy[-1]):
+                return False
+
+            version, program = _witness_program(redeem_script)
+            if version is not None:
+                # P2SH-wrapped segwit: scriptSig must be exactly the push of the redeem script
+                if script_sig_raw != _push(redeem_script):
+                    return False
+                return _verify_witness_program(tx_in.witness, version, program, checker, True)
+
+        if len(tx_in.witness) != 0:
+            return False  # unexpected witness
+        return True
+    except (ScriptError, SyntaxError):
+        return False
+
+
+class InterpreterTest(TestCase):
+    # signed example of BIP143 (input 0: P2PK, input 1: P2WPKH)
+    tx_hex = "01000000000102fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f00000000494830450221008b9d1dc26ba6a9cb62127b02742fa9d754cd3bebf337f7a55d114c8e5cdd30be022040529b194ba3f9281a99f2b1c0a19c0489bc22ede944ccf4ecbab4cc618ef3ed01eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac000247304402203609e17b84f6a7d30c80bfa610b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c4518331561406f90300e8f3358f51928d43c212a8caed02de67eebee0121025476c2e83188368da1ff3e292e7acafcdb3566bb0ad253f62fc70f07aeee635711000000"
+    prevouts = [
+        ("2103c9f4836b9a4f77fc0d81f7bcb01b7f1b35916864b9476c241ce9fc198bd25432ac", 625000000),
+        ("00141d0f172a0ecb48aee1be1f2687d2963ae33f71a1", 600000000),
+    ]
+
+    def test_script_numbers(self):
+        for num in [0, 1, -1, 127, 128, -128, 255, 256, -32768, 2**31 - 1]:
+            self.assertEqual(decode_num(encode_num(num), 5), num)
+        self.assertFalse(cast_to_bool(b'\x00\x80'))
+
+    def test_eval_arithmetic_and_branches(self):
+        # 2 3 OP_ADD 5 OP_EQUAL OP_IF 7 OP_ELSE 8 OP_ENDIF
+        cmds = [0x52, 0x53, 0x93, 0x55, 0x87, 0x63, 0x57, 0x67, 0x58, 0x68]
+        stack = list()
+        self.assertTrue(eval_script(cmds, stack, None, SigVersion.BASE))
+        self.assertEqual(stack, [encode_num(7)])
+        self.assertFalse(eval_script([0x6a], list(), None, SigVersion.BASE))
+
+    def test_verify_signed_inputs_with_cache(self):
+        tx = Transaction.parse_from_hex(InterpreterTest.tx_hex)
+        cache = SignatureCache(max_entries=10)
+        for index, (script_hex, amount) in enumerate(InterpreterTest.prevouts):
+            script_pubkey = Script(raw=bytes.fromhex(script_hex))
+            self.assertTrue(verify_input(tx, index, script_pubkey, amount, cache))
+        self.assertEqual(cache.stats()["hits"], 0)
+        self.assertEqual(len(cache), 2)
+
+        # re-validation is served by the cache
+        for index, (script_hex, amount) in enumerate(InterpreterTest.prevouts):
+            self.assertTrue(verify_input(tx, index, Script(raw=bytes.fromhex(script_hex)), amount, cache))
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.hit_rate, 0.5)
+
+        # wrong amount changes BIP143 sighash
+        script_pubkey = Script(raw=bytes.fromhex(InterpreterTest.prevouts[1][0]))
+        self.assertFalse(verify_input(tx, 1, script_pubkey, 600000001, cache))
+
+    def test_sign_and_verify_p2pkh(self):
+        key = PrivateKey(0xb17c01)
+        pubkey = key.point.sec(True)
+        script_pubkey = Script([0x76, 0xa9, hash160(pubkey), 0x88, 0xac])
+        tx = Transaction([TxIn(b"\x11" * 32, 0)], [TxOut(4000, Script([0x00, b"\x22" * 20]))], 1, 0)
+
+        checker = TransactionSignatureChecker(tx, 0)
+        sighash = checker.sighash(script_pubkey.raw_serialize(), SIGHASH_ALL, SigVersion.BASE)
+        sig = key.sign(int.from_bytes(sighash, 'big')).der() + bytes([SIGHASH_ALL])
+        tx.tx_ins[0].script_sig = Script([sig, pubkey])
+        self.assertTrue(verify_input(tx, 0, script_pubkey))
+
+        tx.tx_outs[0].amount = 5000  # signed outputs changed
+        self.assertFalse(verify_input(tx, 0, script_pubkey))
+
+    def _sign_legacy(self, key: PrivateKey, tx: Transaction, script_code: bytes) -> bytes:
+        sighash = TransactionSignatureChecker(tx, 0).sighash(script_code, SIGHASH_ALL, SigVersion.BASE)
+        return key.sign(int.from_bytes(sighash, 'big')).der() + bytes([SIGHASH_ALL])
+
+    def test_raw_script_code_and_find_and_delete(self):
+        key = PrivateKey(0xb17c02)
+        pubkey = key.point.sec(True)
+        tx = Transaction([TxIn(b"\x11" * 32, 0)], [TxOut(4000, Script([0x00, b"\x22" * 20]))], 1, 0)
+
+        # non-minimal OP_PUSHDATA1 push of the hash: the signed scriptCode keeps it as it is
+        script_pubkey_raw = bytes([0x76, 0xa9, 0x4c, 0x14]) + hash160(pubkey) + bytes([0x88, 0xac])
+        sig = self._sign_legacy(key, tx, script_pubkey_raw)
+        tx.tx_ins[0].script_sig = Script([sig, pubkey])
+        self.assertTrue(verify_input(tx, 0, Script(raw=script_pubkey_raw)))
+
+        # the signature pushed by the scriptPubKey itself is removed from the scriptCode
+        script_code = bytes([0x75]) + _push(pubkey) + bytes([0xac])
+        sig = self._sign_legacy(key, tx, script_code)
+        tx.tx_ins[0].script_sig = Script([sig])
+        self.assertTrue(verify_input(tx, 0, Script(raw=_push(sig) + script_code)))
+        self.assertEqual(find_and_delete(_push(sig) + script_code + b'\xab', b'\xab'), _push(sig) + script_code)
+        # push data equal to the pattern is not an op boundary match
+        self.assertEqual(find_and_delete(_push(b'\xab'), b'\xab'), _push(b'\xab'))
+
+    def test_witness_versions(self):
+        tx = Transaction([TxIn(b"\x11" * 32, 0, witness=[b"\x01"])], [TxOut(4000, Script([0x00, b"\x22" * 20]))], 2, 0)
+        # unknown versions (and v1 of another length) are anyone-can-spend
+        self.assertTrue(verify_input(tx, 0, Script(raw=bytes([0x52, 0x02, 0xbe, 0xef]))))
+        self.assertTrue(verify_input(tx, 0, Script(raw=bytes([0x51, 0x02, 0xbe, 0xef]))))
+        # v0 of a wrong program length fails
+        self.assertFalse(verify_input(tx, 0, Script(raw=bytes([0x00, 0x02, 0xbe, 0xef]))))
+        with self.assertRaises(UnsupportedScriptError):
+            verify_input(tx, 0, Script(raw=bytes([0x51, 0x20]) + b"\x33" * 32))
+
+    def test_consensus_limits(self):
+        # OP_VERIF and OP_VERNOTIF fail even in an unexecuted branch: 0 OP_IF OP_VERIF OP_ENDIF 1
+        for op in [0x65, 0x66]:
+            with self.assertRaises(ScriptError):
+                eval_script(bytes([0x00, 0x63, op, 0x68, 0x51]), list(), None, SigVersion.BASE)
+        # pushes count towards the stack size
+        with self.assertRaises(ScriptError):
+            eval_script(bytes([0x01, 0x01]) * (MAX_STACK_SIZE + 1), list(), None, SigVersion.BASE)
+        self.assertTrue(eval_script(bytes([0x01, 0x01]) * MAX_STACK_SIZE, list(), None, SigVersion.BASE))
+        # script size
+        script = (bytes([0x4c, 0xff]) + b"\x01" * 255 + bytes([0x75])) * 39 + bytes([0x51])
+        self.assertGreater(len(script), MAX_SCRIPT_SIZE)
+        with self.assertRaises(ScriptError):
+            eval_script(script, list(), None, SigVersion.BASE)
+        self.assertTrue(eval_script(script[258:], list(), None, SigVersion.BASE))
+
+        # P2WSH witness items above 520 bytes fail, even if the script drops them
+        witness_script = bytes([0x75, 0x51])  # OP_DROP 1
+        script_pubkey = Script(raw=bytes([0x00, 0x20]) + sha256(witness_script))
+        tx = Transaction([TxIn(b"\x11" * 32, 0, witness=[b"\x01" * 520, witness_script])], [TxOut(4000, Script([0x00, b"\x22" * 20]))], 2, 0)
+        self.assertTrue(verify_input(tx, 0, script_pubkey))
+        tx.tx_ins[0].witness = [b"\x01" * 521, witness_script]
+        self.assertFalse(verify_input(tx, 0, script_pubkey))
@@ -19,7 +19,7 @@ class MerkleTree:
         if leaf_len < 1:
             self.depth: int = 0
         else:
-            self.depth = len(bin(len(leaves) - 1)[2:])  # num of layer:= (bit_len of n-1) + 1
+            self.depth = (leaf_len - 1).bit_length()  # num of layer:= (bit_len of n-1) + 1
 
         self.layers: list = list()
         # build tree
@@ -0,0 +1,231 @@
+import os
+from array import array
+from typing import Iterator, Union
+
+import numpy as np
+
+from bitcoinpy.base.amount import BTCAmount, BTCAmountArray
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.script import Script
+from bitcoinpy.base.script_type import ScriptType, classify_script_pubkey
+from bitcoinpy.base.transaction import TxOut
+
+# import for test below
+from unittest import TestCase
+
+
+COLUMNS = ["txids", "tx_heights", "tx_index", "vout", "amount", "script_type", "script_offsets", "script_blob"]
+
+
+class OutputTableBuilder:
+    """ flatten parsed transactions into growable typed arrays; to_table() converts them to numpy once """
+    def __init__(self):
+        self.txids = bytearray()
+        self.tx_heights = array("i")
+        self.tx_index = array("I")
+        self.vout = array("I")
+        self.amount = array("q")
+        self.script_type = array("B")
+        self.script_offsets = array("q", [0])
+        self.script_blob = bytearray()
+
+    def add_transactions(self, transactions: Iterator, height: int = -1):
+        for tx in transactions:
+            index = len(self.tx_heights)
+            self.txids += tx.tx_id
+            self.tx_heights.append(height)
+            for vout, tx_out in enumerate(tx.tx_outs):
+                raw = tx_out.script_pubkey.raw_serialize()
+                self.tx_index.append(index)
+                self.vout.append(vout)
+                self.amount.append(tx_out.amount)
+                self.script_type.append(classify_script_pubkey(raw)[0].value)
+                self.script_blob += raw
+                self.script_offsets.append(len(self.script_blob))
+        return self
+
+    def add_block(self, block: Block):
+        return self.add_transactions(block.transactions, block.height)
+
+    def add_raw_block(self, raw_block: bytes, height: int = -1):
+        """ transactions are parsed one at a time and dropped after flattening """
+        return self.add_transactions(Block.iter_raw_transactions(raw_block), height)
+
+    def to_table(self):
+        return OutputTable(
+            np.frombuffer(bytes(self.txids), dtype=np.uint8).reshape(-1, 32),
+            np.frombuffer(self.tx_heights, dtype=np.int32).copy(),
+            np.frombuffer(self.tx_index, dtype=np.uint32).copy(),
+            np.frombuffer(self.vout, dtype=np.uint32).copy(),
+            np.frombuffer(self.amount, dtype=np.int64).copy(),
+            np.frombuffer(self.script_type, dtype=np.uint8).copy(),
+            np.frombuffer(self.script_offsets, dtype=np.int64).copy(),
+            np.frombuffer(bytes(self.script_blob), dtype=np.uint8),
+        )
+
+
+class OutputTable:
+    """
+    Transaction outputs as columns: one row per output with the index of its transaction (txids as (n, 32) uint8, tx_heights),
+    vout, amount (satoshi), script type code (ScriptType.value) and the scriptPubKey at
+    script_blob[script_offsets[i]:script_offsets[i + 1]].
+    Columns are saved as .npy files and reopened memory-mapped.
+    """
+    def __init__(self, txids: np.ndarray, tx_heights: np.ndarray, tx_index: np.ndarray, vout: np.ndarray,
+                 amount: np.ndarray, script_type: np.ndarray, script_offsets: np.ndarray, script_blob: np.ndarray):
+        self.txids = txids
+        self.tx_heights = tx_heights
+        self.tx_index = tx_index
+        self.vout = vout
+        self.amount = amount
+        self.script_type = script_type
+        self.script_offsets = script_offsets
+        self.script_blob = script_blob
+
+    def __len__(self):
+        return len(self.vout)
+
+    @classmethod
+    def from_blocks(cls, blocks: Iterator):
+        """ blocks: Block or raw block bytes (height unknown) """
+        builder = OutputTableBuilder()
+        for block in blocks:
+            if isinstance(block, Block):
+                builder.add_block(block)
+            else:
+                builder.add_raw_block(block)
+        return builder.to_table()
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for column in COLUMNS:
+            np.save(os.path.join(directory, column + ".npy"), getattr(self, column))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        """ with mmap, columns are paged in on access instead of read at once """
+        mode = "r" if mmap else None
+        return cls(*[np.load(os.path.join(directory, column + ".npy"), mmap_mode=mode) for column in COLUMNS])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).nbytes for column in COLUMNS)
+
+    def script_lengths(self) -> np.ndarray:
+        return np.diff(self.script_offsets)
+
+    def script(self, i: int) -> bytes:
+        return self.script_blob[self.script_offsets[i]:self.script_offsets[i + 1]].tobytes()
+
+    def txid(self, i: int) -> bytes:
+        return self.txids[self.tx_index[i]].tobytes()
+
+    def tx_out(self, i: int) -> TxOut:
+        return TxOut(int(self.amount[i]), Script(raw=self.script(i)))
+
+    # vectorized filters; each returns a boolean mask over the rows
+
+    def mask_type(self, *script_types: ScriptType) -> np.ndarray:
+        return np.isin(self.script_type, [script_type.value for script_type in script_types])
+
+    def mask_amount(self, min_amount: Union[BTCAmount, int] = None, max_amount: Union[BTCAmount, int] = None) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        if min_amount is not None:
+            mask &= self.amount >= int(min_amount)
+        if max_amount is not None:
+            mask &= self.amount <= int(max_amount)
+        return mask
+
+    def mask_height(self, start: int, end: int) -> np.ndarray:
+        """ outputs of transactions in blocks [start, end) """
+        heights = self.tx_heights[self.tx_index]
+        return (heights >= start) & (heights < end)
+
+    def mask_script(self, raw: bytes, chunk_rows: int = 1 << 20) -> np.ndarray:
+        """
+        outputs paying exactly to the scriptPubKey.
+        Candidates of the same length are compared one byte position at a time, dropping mismatches as they go,
+        over chunks of chunk_rows so that temporaries stay bounded however many outputs share the length
+        """
+        mask = self.script_lengths() == len(raw)
+        candidates = np.nonzero(mask)[0]
+        for start in range(0, len(candidates), chunk_rows):
+            chunk = candidates[start:start + chunk_rows]
+            offsets = self.script_offsets[chunk]
+            for position, byte in enumerate(raw):
+                matched = self.script_blob[offsets + position] == byte
+                mask[chunk[~matched]] = False
+                chunk, offsets = chunk[matched], offsets[matched]
+                if len(chunk) == 0:
+                    break
+        return mask
+
+    def mask_txid(self, tx_id: bytes) -> np.ndarray:
+        matched = np.nonzero(np.all(self.txids == np.frombuffer(tx_id, dtype=np.uint8), axis=1))[0]
+        return np.isin(self.tx_index, matched)
+
+    def amounts(self, mask: np.ndarray = None) -> BTCAmountArray:
+        return BTCAmountArray(self.amount if mask is None else self.amount[mask])
+
+    def total(self, mask: np.ndarray = None) -> BTCAmount:
+        return self.amounts(mask).sum()
+
+    def type_counts(self) -> dict:
+        counts = np.bincount(self.script_type, minlength=len(ScriptType))
+        return {script_type: int(counts[script_type.value]) for script_type in ScriptType}
+
+    def iter_rows(self, mask: np.ndarray = None) -> Iterator[tuple]:
+        """ yield (tx_id, vout, amount, ScriptType, scriptPubKey) """
+        rows = range(len(self)) if mask is None else np.nonzero(mask)[0]
+        for i in rows:
+            yield self.txid(i), int(self.vout[i]), BTCAmount(int(self.amount[i])), ScriptType(int(self.script_type[i])), self.script(i)
+
+
+class OutputTableTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from bitcoinpy.test_data.synthetic import build_chain
+        cls.raw_blocks = build_chain(3, 20)
+        cls.blocks = [Block.from_raw(raw, height) for height, raw in enumerate(cls.raw_blocks)]
+
+    def test_flatten(self):
+        table = OutputTable.from_blocks(self.blocks)
+        expected = [(tx.tx_id, vout, tx_out) for block in self.blocks for tx in block.transactions for vout, tx_out in enumerate(tx.tx_outs)]
+        self.assertEqual(len(table), len(expected))
+        for i, (tx_id, vout, tx_out) in enumerate(expected):
+            self.assertEqual(table.txid(i), tx_id)
+            self.assertEqual(table.vout[i], vout)
+            self.assertEqual(table.tx_out(i).serialize(), tx_out.serialize())
+
+        # raw blocks give the same columns
+        from_raw = OutputTable.from_blocks(self.raw_blocks)
+        self.assertTrue(np.array_equal(from_raw.script_blob, table.script_blob))
+        self.assertTrue(np.array_equal(from_raw.amount, table.amount))
+
+    def test_save_and_filter(self):
+        import tempfile
+        table = OutputTable.from_blocks(self.blocks)
+        with tempfile.TemporaryDirectory() as directory:
+            table.save(directory)
+            loaded = OutputTable.load(directory)
+            self.assertIsInstance(loaded.amount, np.memmap)
+            for column in COLUMNS:
+                self.assertTrue(np.array_equal(getattr(loaded, column), getattr(table, column)))
+
+            counts = loaded.type_counts()
+            self.assertEqual(counts[ScriptType.P2PKH], 3)  # coinbase outputs
+            self.assertEqual(counts[ScriptType.P2WPKH], 3 * 19 * 2)
+
+            coinbase = loaded.mask_type(ScriptType.P2PKH)
+            self.assertEqual(loaded.total(coinbase), BTCAmount(3 * 50 * 10 ** 8))
+            self.assertEqual(int(loaded.mask_height(1, 2).sum()), 1 + 19 * 2)
+
+            script = loaded.script(5)
+            matched = np.nonzero(loaded.mask_script(script))[0]
+            self.assertEqual(matched.tolist(), [5])
+            self.assertTrue(np.array_equal(loaded.mask_script(script, chunk_rows=3), loaded.mask_script(script)))
+            self.assertEqual(int(loaded.mask_txid(loaded.txid(5)).sum()), 2)
+
+            rows = list(loaded.iter_rows(loaded.mask_amount(min_amount=BTCAmount(10 ** 8))))
+            self.assertEqual([row[3] for row in rows], [ScriptType.P2PKH] * 3)
+            del loaded, coinbase, rows
@@ -0,0 +1,166 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import shared_memory, resource_tracker
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.header import Header
+from bitcoinpy.base.transaction import Transaction
+from bitcoinpy.utils.varint import read_varint_at
+
+# import for test below
+from unittest import TestCase
+
+
+# compact form of a transaction which is cheap to send back from the workers
+TxSummary = namedtuple("TxSummary", ["tx_id", "size", "num_inputs", "num_outputs", "total_output"])
+
+
+def scan_tx_boundaries(raw_block: bytes, offset: int = 80) -> list:
+    """
+    Return (start, end) byte range of every transaction in a serialized block
+    by walking the length prefixes only; no objects are built.
+    """
+    tx_num, pos = read_varint_at(raw_block, offset)
+    ranges = list()
+    for _ in range(tx_num):
+        start = pos
+        pos += 4  # version
+        is_segwit = raw_block[pos] == 0 and raw_block[pos + 1] == 1
+        if is_segwit:
+            pos += 2  # marker and flag
+
+        num_inputs, pos = read_varint_at(raw_block, pos)
+        for _ in range(num_inputs):
+            script_len, pos = read_varint_at(raw_block, pos + 36)  # skip outpoint
+            pos += script_len + 4  # script and sequence
+
+        num_outputs, pos = read_varint_at(raw_block, pos)
+        for _ in range(num_outputs):
+            script_len, pos = read_varint_at(raw_block, pos + 8)  # skip amount
+            pos += script_len
+
+        if is_segwit:
+            for _ in range(num_inputs):
+                num_items, pos = read_varint_at(raw_block, pos)
+                for _ in range(num_items):
+                    item_len, pos = read_varint_at(raw_block, pos)
+                    pos += item_len
+
+        pos += 4  # lock time
+        if pos > len(raw_block):
+            raise Exception("Truncated block: transaction ends at {}, block size {}".format(pos, len(raw_block)))
+        ranges.append((start, pos))
+    return ranges
+
+
+def _attach(shm_name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError:
+        # python < 3.13: keep the worker's resource tracker from unlinking the parent's segment
+        shm = shared_memory.SharedMemory(name=shm_name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _summarize(tx: Transaction, size: int) -> TxSummary:
+    total_output = sum(tx_out.amount for tx_out in tx.tx_outs)
+    return TxSummary(tx.tx_id.hex(), size, len(tx.tx_ins), len(tx.tx_outs), total_output)
+
+
+def _parse_ranges(shm_name: str, ranges: list, summary: bool) -> list:
+    """ worker: parse the transactions located at the ranges of the shared block buffer """
+    shm = _attach(shm_name)
+    try:
+        result = list()
+        for start, end in ranges:
+            tx = Transaction.parse_from_bytes_io(BytesIO(bytes(shm.buf[start:end])))
+            result.append(_summarize(tx, end - start) if summary else tx)
+        return result
+    finally:
+        shm.close()
+
+
+class ParallelBlockParser:
+    """
+    Decode transactions of a single block on a process pool.
+    The raw block is copied once into shared memory; workers receive only byte ranges.
+    """
+    def __init__(self, processes: int = None, chunks_per_process: int = 4, min_parallel_txs: int = 256):
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        self.chunks_per_process = chunks_per_process
+        # blocks with fewer transactions are decoded in the calling process
+        self.min_parallel_txs = min_parallel_txs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def _chunks(self, ranges: list) -> list:
+        num_chunks = max(1, min(len(ranges), self.processes * self.chunks_per_process))
+        size = (len(ranges) + num_chunks - 1) // num_chunks
+        return [ranges[i:i + size] for i in range(0, len(ranges), size)]
+
+    def parse_transactions(self, raw_block: bytes, summary: bool = False) -> list:
+        """ return Transaction objects (or TxSummary when summary is True) in block order """
+        ranges = scan_tx_boundaries(raw_block)
+        if len(ranges) < self.min_parallel_txs:
+            result = list()
+            for start, end in ranges:
+                tx = Transaction.parse_from_bytes_io(BytesIO(raw_block[start:end]))
+                result.append(_summarize(tx, end - start) if summary else tx)
+            return result
+
+        shm = shared_memory.SharedMemory(create=True, size=len(raw_block))
+        try:
+            shm.buf[:len(raw_block)] = raw_block
+            chunks = self._chunks(ranges)
+            futures = [self.executor.submit(_parse_ranges, shm.name, chunk, summary) for chunk in chunks]
+            result = list()
+            for future in futures:
+                result += future.result()
+            return result
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def parse_block(self, raw_block: bytes, height: int = 0) -> Block:
+        header = Header.parse_from_bytes_io(BytesIO(raw_block[:80]))
+        transactions = self.parse_transactions(raw_block)
+        return Block.from_header_and_transactions(header, transactions, height)
+
+
+class ParallelBlockParserTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from bitcoinpy.test_data.synthetic import build_chain
+        cls.raw_legacy = build_chain(1, 300, segwit=False)[0]
+        cls.raw_segwit = build_chain(1, 600, segwit=True)[0]
+
+    def test_scan_tx_boundaries(self):
+        for raw in [self.raw_legacy, self.raw_segwit]:
+            expected = [tx.tx_id for tx in Block.iter_raw_transactions(raw)]
+            ranges = scan_tx_boundaries(raw)
+            self.assertEqual(ranges[-1][1], len(raw))
+            actual = [Transaction.parse_from_bytes_io(BytesIO(raw[a:b])).tx_id for a, b in ranges]
+            self.assertEqual(expected, actual)
+
+    def test_parallel_parse(self):
+        with ParallelBlockParser(processes=2, min_parallel_txs=1) as parser:
+            for raw in [self.raw_legacy, self.raw_segwit]:
+                expected = Block.from_raw(raw)
+                block = parser.parse_block(raw)
+                self.assertEqual(block.hash, expected.hash)
+                self.assertEqual([tx.tx_id for tx in block.transactions], [tx.tx_id for tx in expected.transactions])
+
+                summaries = parser.parse_transactions(raw, summary=True)
+                self.assertEqual([s.tx_id for s in summaries], [tx.tx_id.hex() for tx in expected.transactions])
+                self.assertEqual(summaries[1].total_output, sum(out.amount for out in expected.transactions[1].tx_outs))
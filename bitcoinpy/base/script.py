@@ -1,14 +1,50 @@
-from bitcoinpy.utils.varint import read_varint, encode_varint
+from bitcoinpy.utils.varint import read_varint, varint_size, write_varint_into
 from bitcoinpy.base.opcodes import OP_CODE_NAMES
 from io import BytesIO
+from typing import Union
+from unittest import TestCase
 
 
 class Script:
-    def __init__(self, cmds=None):
-        if cmds is None:
-            self.cmds = []
+    """
+    Script keeps the raw bytes it was parsed from and tokenizes them into "cmds" only on first access.
+    Serialization of a parsed script passes the raw bytes through.
+    Note> assign a new list to "cmds" to modify the script; in-place changes of a parsed script's cmds are not serialized.
+    """
+    def __init__(self, cmds=None, raw: bytes = None, coinbase: bool = False):
+        self._raw = raw
+        self._coinbase = coinbase
+        if raw is not None:
+            self._cmds = None  # tokenized lazily
+        elif cmds is None:
+            self._cmds = []
         else:
-            self.cmds = cmds
+            self._cmds = cmds
+
+    @property
+    def cmds(self) -> list:
+        if self._cmds is None:
+            if self._coinbase:
+                self._cmds = [-1, self._raw]
+            else:
+                self._cmds = Script.tokenize(self._raw)
+        return self._cmds
+
+    @cmds.setter
+    def cmds(self, cmds: list):
+        self._cmds = cmds
+        self._raw = None
+        self._coinbase = False
+
+    @property
+    def raw(self) -> Union[bytes, None]:
+        """ bytes the script was parsed from; None if it was built from cmds """
+        return self._raw
+
+    def is_coinbase(self) -> bool:
+        if self._raw is not None:
+            return self._coinbase
+        return len(self._cmds) > 0 and self._cmds[0] == -1
 
     def __repr__(self):
         result = []
@@ -26,76 +62,174 @@ class Script:
     def __add__(self, other):
         return Script(self.cmds + other.cmds)
 
-    @classmethod
-    def parse(cls, s):
-        length = read_varint(s)
+    @staticmethod
+    def tokenize(raw: bytes, ends: list = None) -> list:
+        """ split raw script into op codes (int) and pushed data (bytes); ends collects the end offset of each """
         cmds = []
+        length = len(raw)
         count = 0
         while count < length:
-            current = s.read(1)
+            current_byte = raw[count]
             count += 1
-            current_byte = current[0]
             if current_byte >= 1 and current_byte <= 75:
-                n = current_byte
-                cmds.append(s.read(n))
-                count += n
+                data_length = current_byte
             elif current_byte == 76:
-                data_length = int.from_bytes(s.read(1), 'little')
-                cmds.append(s.read(data_length))
-                count += data_length + 1
+                data_length = int.from_bytes(raw[count:count + 1], 'little')
+                count += 1
             elif current_byte == 77:
-                data_length = int.from_bytes(s.read(2), 'little')
-                cmds.append(s.read(data_length))
-                count += data_length + 2
+                data_length = int.from_bytes(raw[count:count + 2], 'little')
+                count += 2
+            elif current_byte == 78:
+                data_length = int.from_bytes(raw[count:count + 4], 'little')
+                count += 4
             else:
-                op_code = current_byte
-                cmds.append(op_code)
+                cmds.append(current_byte)
+                if ends is not None:
+                    ends.append(count)
+                continue
+            cmds.append(raw[count:count + data_length])
+            count += data_length
+            if ends is not None:
+                ends.append(count)
         if count != length:
             raise SyntaxError('parsing script failed')
-        return cls(cmds)
+        return cmds
+
+    @classmethod
+    def parse(cls, s):
+        length = read_varint(s)
+        raw = s.read(length)
+        if len(raw) != length:
+            raise SyntaxError('parsing script failed')
+        return cls(raw=raw)
 
     @classmethod
     def parse_coinbase(cls, s: BytesIO):
         length = read_varint(s)
-        cmd = s.read(length)
-        return cls([-1, cmd])
+        raw = s.read(length)
+        if len(raw) != length:
+            raise SyntaxError('parsing script failed')
+        return cls(raw=raw, coinbase=True)
 
-    def raw_serialize(self):
-        if self.cmds[0] == -1:
-            raise Exception("This is coinbase input. use \"raw_coinbase_serialize()\"")
+    @staticmethod
+    def _push_prefix(length: int) -> bytes:
+        if length <= 75:
+            return length.to_bytes(1, 'little')
+        elif length > 75 and length < 0x100:
+            return int(76).to_bytes(1, 'little') + length.to_bytes(1, 'little')
+        elif length >= 0x100 and length <= 520:
+            return int(77).to_bytes(1, 'little') + length.to_bytes(2, 'little')
+        else:
+            raise ValueError('too long an cmd')
 
-        result = b''
-        for cmd in self.cmds:
+    def raw_size(self) -> int:
+        """ size of the script without its length prefix """
+        if self._raw is not None:
+            return len(self._raw)
+        if len(self._cmds) == 0:
+            return 0
+        if self._cmds[0] == -1:
+            return len(self._cmds[1])
+
+        size = 0
+        for cmd in self._cmds:
             if type(cmd) == int:
-                result += cmd.to_bytes(1, 'little')
+                size += 1
             else:
                 length = len(cmd)
                 if length <= 75:
-                    result += length.to_bytes(1, 'little')
-                elif length > 75 and length < 0x100:
-                    result += int(76).to_bytes(1, 'little')
-                    result += length.to_bytes(1, 'little')
-                elif length >= 0x100 and length <= 520:
-                    result += int(77).to_bytes(1, 'little')
-                    result += length.to_bytes(2, 'little')
+                    size += 1 + length
+                elif length < 0x100:
+                    size += 2 + length
+                elif length <= 520:
+                    size += 3 + length
                 else:
-                    print(cmd)
                     raise ValueError('too long an cmd')
-                result += cmd
-        return result
+        return size
+
+    def serialized_size(self) -> int:
+        """ size of the script including its length prefix """
+        size = self.raw_size()
+        return varint_size(size) + size
+
+    def raw_serialize_into(self, buf: bytearray, offset: int) -> int:
+        """ write the script without length prefix into the buffer and return the next offset """
+        if self._raw is not None:
+            buf[offset:offset + len(self._raw)] = self._raw
+            return offset + len(self._raw)
+        if len(self._cmds) == 0:
+            return offset
+        if self._cmds[0] == -1:
+            cmd = self._cmds[1]
+            buf[offset:offset + len(cmd)] = cmd
+            return offset + len(cmd)
+
+        for cmd in self._cmds:
+            if type(cmd) == int:
+                buf[offset] = cmd
+                offset += 1
+            else:
+                prefix = Script._push_prefix(len(cmd))
+                buf[offset:offset + len(prefix)] = prefix
+                offset += len(prefix)
+                buf[offset:offset + len(cmd)] = cmd
+                offset += len(cmd)
+        return offset
+
+    def serialize_into(self, buf: bytearray, offset: int) -> int:
+        """ write the length-prefixed script into the buffer and return the next offset """
+        offset = write_varint_into(buf, offset, self.raw_size())
+        return self.raw_serialize_into(buf, offset)
+
+    def raw_serialize(self):
+        if self.is_coinbase():
+            raise Exception("This is coinbase input. use \"raw_coinbase_serialize()\"")
+        if self._raw is not None:
+            return self._raw
+
+        result = bytearray(self.raw_size())
+        self.raw_serialize_into(result, 0)
+        return bytes(result)
 
     def raw_coinbase_serialize(self):
-        if self.cmds[0] != -1:
+        if not self.is_coinbase():
             raise Exception("This is not coinbase input. use \"raw_serialize()\"")
-        return self.cmds[1]
+        if self._raw is not None:
+            return self._raw
+        return self._cmds[1]
 
     def serialize(self):
-        if len(self.cmds) == 0:
-            return b'\x00'
+        result = bytearray(self.serialized_size())
+        self.serialize_into(result, 0)
+        return bytes(result)
 
-        if self.cmds[0] == -1:
-            result = self.raw_coinbase_serialize()
-        else:
-            result = self.raw_serialize()
-        total = len(result)
-        return encode_varint(total) + result
+
+class ScriptTest(TestCase):
+    p2pkh_hex = "76a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac"
+
+    def test_lazy_tokenization(self):
+        raw = bytes.fromhex(ScriptTest.p2pkh_hex)
+        script = Script.parse(BytesIO(bytes([len(raw)]) + raw))
+        self.assertIsNone(script._cmds)
+        self.assertIs(script.raw_serialize(), script.raw)
+        self.assertEqual(script.serialize(), bytes([len(raw)]) + raw)
+
+        self.assertEqual(script.cmds, [0x76, 0xa9, raw[3:23], 0x88, 0xac])
+        self.assertEqual(str(script), "OP_DUP OP_HASH160 8280b37df378db99f66f85c95a783a76ac7a6d59 OP_EQUALVERIFY OP_CHECKSIG")
+
+        script.cmds = [0x6a]  # OP_RETURN
+        self.assertIsNone(script.raw)
+        self.assertEqual(script.serialize(), b"\x01\x6a")
+
+    def test_raw_passthrough(self):
+        # non-minimal push (OP_PUSHDATA1 for 3 bytes) is kept as parsed
+        raw = bytes.fromhex("4c03abcdef")
+        script = Script.parse(BytesIO(bytes([len(raw)]) + raw))
+        self.assertEqual(script.cmds, [bytes.fromhex("abcdef")])
+        self.assertEqual(script.raw_serialize(), raw)
+
+        # truncated push is kept as raw bytes and fails only when tokenized
+        script = Script.parse(BytesIO(bytes.fromhex("026a05")))
+        self.assertEqual(script.serialized_size(), 3)
+        with self.assertRaises(SyntaxError):
+            _ = script.cmds
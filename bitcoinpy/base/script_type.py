@@ -0,0 +1,175 @@
+from enum import Enum
+from typing import Iterator, Union
+
+from bitcoinpy.base.account import BTCAccount, AddrType, NetType, DEFAULT_NETWORK_TYPE
+
+# import for test below
+from unittest import TestCase
+
+
+class ScriptType(Enum):
+    """ scriptPubKey templates; values are stable and used as compact type codes """
+    NONSTANDARD = 0
+    P2PK = 1
+    P2PKH = 2
+    P2SH = 3
+    P2WPKH = 4
+    P2WSH = 5
+    P2TR = 6
+    MULTISIG = 7
+    NULL_DATA = 8  # OP_RETURN
+    WITNESS_UNKNOWN = 9  # future witness versions
+
+
+def classify_script_pubkey(raw: bytes) -> tuple:
+    """
+    Match raw scriptPubKey bytes (without length prefix) against the standard templates by length and byte pattern.
+    return (ScriptType, payload) where payload is
+        hash160 for P2PKH/P2SH, witness program for segwit types, public key for P2PK,
+        the script after OP_RETURN (push op codes included) for null data and the script itself for multisig and nonstandard.
+    """
+    length = len(raw)
+    if length == 25 and raw[0] == 0x76 and raw[1] == 0xa9 and raw[2] == 0x14 and raw[23] == 0x88 and raw[24] == 0xac:
+        return ScriptType.P2PKH, raw[3:23]
+    if length == 22 and raw[0] == 0x00 and raw[1] == 0x14:
+        return ScriptType.P2WPKH, raw[2:]
+    if length == 34 and raw[1] == 0x20:
+        if raw[0] == 0x00:
+            return ScriptType.P2WSH, raw[2:]
+        if raw[0] == 0x51:
+            return ScriptType.P2TR, raw[2:]
+    if length == 23 and raw[0] == 0xa9 and raw[1] == 0x14 and raw[22] == 0x87:
+        return ScriptType.P2SH, raw[2:22]
+    if length > 0 and raw[0] == 0x6a:
+        return ScriptType.NULL_DATA, raw[1:]
+    if 4 <= length <= 42 and 0x51 <= raw[0] <= 0x60 and raw[1] == length - 2:
+        return ScriptType.WITNESS_UNKNOWN, raw[2:]
+    if (length == 35 and raw[0] == 0x21 or length == 67 and raw[0] == 0x41) and raw[-1] == 0xac:
+        return ScriptType.P2PK, raw[1:-1]
+    if length >= 37 and raw[-1] == 0xae and _is_multisig(raw):
+        return ScriptType.MULTISIG, raw
+    return ScriptType.NONSTANDARD, raw
+
+
+def _is_multisig(raw: bytes) -> bool:
+    """ OP_m <pubkey>... OP_n OP_CHECKMULTISIG """
+    m, n = raw[0] - 0x50, raw[-2] - 0x50
+    if not (1 <= m <= 16 and 1 <= n <= 16 and m <= n):
+        return False
+    pos, keys = 1, 0
+    while pos < len(raw) - 2:
+        push = raw[pos]
+        if push != 0x21 and push != 0x41:
+            return False
+        pos += 1 + push
+        keys += 1
+    return pos == len(raw) - 2 and keys == n
+
+
+def script_type_of(raw: bytes) -> ScriptType:
+    return classify_script_pubkey(raw)[0]
+
+
+ADDRESS_TYPES = {
+    ScriptType.P2PKH: AddrType.LEGACY,
+    ScriptType.P2SH: AddrType.P2SH,
+    ScriptType.P2WPKH: AddrType.BECH32,
+    ScriptType.P2WSH: AddrType.BECH32,
+    ScriptType.P2TR: AddrType.BECH32M,
+}
+
+
+def address_from_template(script_type: ScriptType, payload: bytes, network_type: NetType = DEFAULT_NETWORK_TYPE) -> Union[str, None]:
+    """ encode classified script as an address through BTCAccount; None for types without address """
+    addr_type = ADDRESS_TYPES.get(script_type)
+    if addr_type is None:
+        return None
+    return BTCAccount.from_h160(payload, addr_type, network_type).address
+
+
+def script_pubkey_to_address(raw: bytes, network_type: NetType = DEFAULT_NETWORK_TYPE) -> Union[str, None]:
+    script_type, payload = classify_script_pubkey(raw)
+    return address_from_template(script_type, payload, network_type)
+
+
+def script_pubkey_from_template(script_type: ScriptType, payload: bytes) -> bytes:
+    """ inverse of classify_script_pubkey for the address types """
+    if script_type == ScriptType.P2PKH:
+        return b'\x76\xa9\x14' + payload + b'\x88\xac'
+    if script_type == ScriptType.P2SH:
+        return b'\xa9\x14' + payload + b'\x87'
+    if script_type == ScriptType.P2WPKH or script_type == ScriptType.P2WSH:
+        return b'\x00' + bytes([len(payload)]) + payload
+    if script_type == ScriptType.P2TR:
+        return b'\x51\x20' + payload
+    raise Exception("Not allowed script type: {}".format(script_type))
+
+
+def script_pubkey_from_address(address: str) -> bytes:
+    account = BTCAccount.from_address(address)
+    if account.addr_type == AddrType.LEGACY:
+        script_type = ScriptType.P2PKH
+    elif account.addr_type == AddrType.P2SH:
+        script_type = ScriptType.P2SH
+    elif account.addr_type == AddrType.BECH32:
+        script_type = ScriptType.P2WPKH if len(account.hash) == 20 else ScriptType.P2WSH
+    else:
+        script_type = ScriptType.P2TR
+    return script_pubkey_from_template(script_type, account.hash)
+
+
+def classify_outputs(transactions: list) -> Iterator[tuple]:
+    """ yield (tx_id, vout, ScriptType, payload) for every output of the transactions (e.g. Block.transactions) """
+    for tx in transactions:
+        tx_id = tx.tx_id
+        for vout, tx_out in enumerate(tx.tx_outs):
+            script_type, payload = classify_script_pubkey(tx_out.script_pubkey.raw_serialize())
+            yield tx_id, vout, script_type, payload
+
+
+def output_addresses(transactions: list, network_type: NetType = DEFAULT_NETWORK_TYPE) -> list:
+    """ return list of (tx_id, vout, ScriptType, address or None) of every output """
+    result = list()
+    for tx_id, vout, script_type, payload in classify_outputs(transactions):
+        result.append((tx_id, vout, script_type, address_from_template(script_type, payload, network_type)))
+    return result
+
+
+class ScriptTypeTest(TestCase):
+    vectors = [
+        ("76a91462e907b15cbf27d5425399ebf6f0fb50ebb88f1888ac", ScriptType.P2PKH, "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"),
+        ("a914748284390f9e263a4b766a75d0633c50426eb87587", ScriptType.P2SH, "3CK4fEwbMP7heJarmU4eqA3sMbVJyEnU3V"),
+        ("0014751e76e8199196d454941c45d1b3a323f1433bd6", ScriptType.P2WPKH, "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"),
+        ("00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262", ScriptType.P2WSH, "bc1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3qccfmv3"),
+        ("5120a60869f0dbcf1dc659c9cecbaf8050135ea9e8cdc487053f1dc6880949dc684c", ScriptType.P2TR, "bc1p5cyxnuxmeuwuvkwfem96lqzszd02n6xdcjrs20cac6yqjjwudpxqkedrcr"),
+    ]
+
+    def test_address_templates(self):
+        for script_hex, expected_type, expected_address in ScriptTypeTest.vectors:
+            raw = bytes.fromhex(script_hex)
+            self.assertEqual(script_type_of(raw), expected_type)
+            self.assertEqual(script_pubkey_to_address(raw), expected_address)
+
+            # payload round-trips through BTCAccount.from_address
+            account = BTCAccount.from_address(expected_address)
+            self.assertEqual(account.hash, classify_script_pubkey(raw)[1])
+            self.assertEqual(script_pubkey_from_address(expected_address), raw)
+
+    def test_other_templates(self):
+        pubkey = "02" + "11" * 32
+        multisig = bytes.fromhex("52" + "21" + pubkey + "21" + pubkey + "52ae")
+        self.assertEqual(script_type_of(multisig), ScriptType.MULTISIG)
+        self.assertEqual(script_type_of(bytes.fromhex("21" + pubkey + "ac")), ScriptType.P2PK)
+        self.assertEqual(classify_script_pubkey(bytes.fromhex("6a0401020304")), (ScriptType.NULL_DATA, bytes.fromhex("0401020304")))
+        self.assertEqual(script_type_of(bytes.fromhex("5202abcd")), ScriptType.WITNESS_UNKNOWN)
+        self.assertEqual(script_type_of(bytes.fromhex("51")), ScriptType.NONSTANDARD)
+        self.assertIsNone(script_pubkey_to_address(multisig))
+
+    def test_classify_outputs(self):
+        from bitcoinpy.base.block import Block
+        from bitcoinpy.test_data.synthetic import build_chain
+        block = Block.from_raw(build_chain(1, 5)[0])
+        result = output_addresses(block.transactions, NetType.REG_TEST)
+        self.assertEqual(len(result), 1 + 4 * 2)
+        self.assertEqual(result[0][2], ScriptType.P2PKH)
+        self.assertTrue(result[1][3].startswith("bcrt1q"))
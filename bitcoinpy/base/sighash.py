@@ -0,0 +1,262 @@
+"""
+Digests of one input of a transaction for legacy, BIP143 and BIP341 signatures.
+Parts shared by all inputs (hashPrevouts, hashSequence, hashOutputs and their taproot equivalents)
+are computed once and kept in the transaction cache (Transaction.cached), so signing or verifying
+N inputs costs O(N) instead of O(N^2); they are dropped when an outpoint, sequence or output changes,
+but kept while signatures (scriptSig, witness) are attached.
+"""
+import hashlib
+
+from bitcoinpy.base.transaction import Transaction, TxOut
+from bitcoinpy.crypto.hashes import hash256, sha256, tagged_hash
+from bitcoinpy.utils.varint import encode_varint
+
+# import for test below
+from bitcoinpy.base.script import Script
+from unittest import TestCase
+
+
+SIGHASH_DEFAULT = 0  # taproot only
+SIGHASH_ALL = 1
+SIGHASH_NONE = 2
+SIGHASH_SINGLE = 3
+SIGHASH_ANYONECANPAY = 0x80
+
+
+def _outpoint(tx_in) -> bytes:
+    return tx_in.prev_tx[::-1] + tx_in.prev_index.to_bytes(4, 'little')
+
+
+def _prevouts(tx: Transaction) -> bytes:
+    return tx.cached("sighash:prevouts", lambda: b''.join(_outpoint(tx_in) for tx_in in tx.tx_ins))
+
+
+def _sequences(tx: Transaction) -> bytes:
+    return tx.cached("sighash:sequences", lambda: b''.join(tx_in.sequence.to_bytes(4, 'little') for tx_in in tx.tx_ins))
+
+
+def _outputs(tx: Transaction) -> bytes:
+    return tx.cached("sighash:outputs", lambda: b''.join(tx_out.serialize() for tx_out in tx.tx_outs))
+
+
+def legacy_sighash(tx: Transaction, index: int, script_code: bytes, hash_type: int) -> bytes:
+    """ digest of the original (pre-segwit) algorithm; script_code is the raw script without length prefix """
+    base_type = hash_type & 0x1f
+    anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+    if base_type == SIGHASH_SINGLE and index >= len(tx.tx_outs):
+        return (1).to_bytes(32, 'little')  # historical "one" hash
+
+    # inputs with empty script and the outputs are serialized once per transaction
+    empty_inputs = tx.cached("sighash:legacy_inputs", lambda: [_outpoint(t) + b'\x00' + t.sequence.to_bytes(4, 'little') for t in tx.tx_ins])
+    current = _outpoint(tx.tx_ins[index]) + encode_varint(len(script_code)) + script_code + tx.tx_ins[index].sequence.to_bytes(4, 'little')
+
+    h = hashlib.sha256(tx.version.to_bytes(4, 'little'))
+    if anyone_can_pay:
+        h.update(encode_varint(1) + current)
+    else:
+        h.update(encode_varint(len(tx.tx_ins)))
+        zero_sequence = base_type in (SIGHASH_NONE, SIGHASH_SINGLE)
+        for i, serialized in enumerate(empty_inputs):
+            if i == index:
+                h.update(current)
+            elif zero_sequence:
+                h.update(serialized[:-4] + b'\x00' * 4)
+            else:
+                h.update(serialized)
+
+    if base_type == SIGHASH_NONE:
+        h.update(encode_varint(0))
+    elif base_type == SIGHASH_SINGLE:
+        h.update(encode_varint(index + 1) + (b'\xff' * 8 + b'\x00') * index + tx.tx_outs[index].serialize())
+    else:
+        h.update(encode_varint(len(tx.tx_outs)) + _outputs(tx))
+    h.update(tx.lock_time.to_bytes(4, 'little') + hash_type.to_bytes(4, 'little'))
+    return hashlib.sha256(h.digest()).digest()
+
+
+def bip143_hashes(tx: Transaction) -> tuple:
+    """ (hashPrevouts, hashSequence, hashOutputs) for SIGHASH_ALL """
+    return (
+        tx.cached("sighash:hash_prevouts", lambda: hash256(_prevouts(tx))),
+        tx.cached("sighash:hash_sequence", lambda: hash256(_sequences(tx))),
+        tx.cached("sighash:hash_outputs", lambda: hash256(_outputs(tx))),
+    )
+
+
+def bip143_sighash(tx: Transaction, index: int, script_code: bytes, amount: int, hash_type: int) -> bytes:
+    """ segwit v0 digest; script_code is the raw script without length prefix """
+    base_type = hash_type & 0x1f
+    anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+    hash_prevouts, hash_sequence, hash_outputs = b'\x00' * 32, b'\x00' * 32, b'\x00' * 32
+    all_prevouts, all_sequence, all_outputs = bip143_hashes(tx)
+    if not anyone_can_pay:
+        hash_prevouts = all_prevouts
+        if base_type != SIGHASH_SINGLE and base_type != SIGHASH_NONE:
+            hash_sequence = all_sequence
+    if base_type != SIGHASH_SINGLE and base_type != SIGHASH_NONE:
+        hash_outputs = all_outputs
+    elif base_type == SIGHASH_SINGLE and index < len(tx.tx_outs):
+        hash_outputs = hash256(tx.tx_outs[index].serialize())
+
+    tx_in = tx.tx_ins[index]
+    result = tx.version.to_bytes(4, 'little') + hash_prevouts + hash_sequence + _outpoint(tx_in)
+    result += encode_varint(len(script_code)) + script_code
+    result += amount.to_bytes(8, 'little') + tx_in.sequence.to_bytes(4, 'little')
+    result += hash_outputs + tx.lock_time.to_bytes(4, 'little') + hash_type.to_bytes(4, 'little')
+    return hash256(result)
+
+
+def bip341_hashes(tx: Transaction, spent_outputs: list) -> tuple:
+    """ (sha_prevouts, sha_amounts, sha_scriptpubkeys, sha_sequences, sha_outputs); spent_outputs are TxOut of every input """
+    if len(spent_outputs) != len(tx.tx_ins):
+        raise Exception("Expected {} spent outputs, but {}".format(len(tx.tx_ins), len(spent_outputs)))
+    # spent outputs are not part of the transaction; the hashes are reused while the list holds the same TxOut objects.
+    # A copy is compared, so that the list can be edited in place; replace a TxOut rather than changing it
+    cached = tx.cached("sighash:bip341", lambda: [None, None])
+    if cached[0] != spent_outputs:
+        cached[0] = list(spent_outputs)
+        cached[1] = (
+            sha256(_prevouts(tx)),
+            sha256(b''.join(out.amount.to_bytes(8, 'little') for out in spent_outputs)),
+            sha256(b''.join(out.script_pubkey.serialize() for out in spent_outputs)),
+            sha256(_sequences(tx)),
+            tx.cached("sighash:sha_outputs", lambda: sha256(_outputs(tx))),
+        )
+    return cached[1]
+
+
+def bip341_sighash(tx: Transaction, index: int, spent_outputs: list, hash_type: int = SIGHASH_DEFAULT,
+                   annex: bytes = None, leaf_hash: bytes = None, key_version: int = 0, codesep_pos: int = 0xffffffff) -> bytes:
+    """ taproot digest; key path spending if leaf_hash is None, script path spending otherwise """
+    if not (hash_type <= 0x03 or 0x81 <= hash_type <= 0x83):
+        raise Exception("Invalid hash type: {}".format(hash_type))
+    base_type = hash_type & 0x03
+    anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+    if base_type == SIGHASH_SINGLE and index >= len(tx.tx_outs):
+        raise Exception("SIGHASH_SINGLE without corresponding output")
+
+    sha_prevouts, sha_amounts, sha_scriptpubkeys, sha_sequences, sha_outputs = bip341_hashes(tx, spent_outputs)
+    msg = b'\x00' + bytes([hash_type])  # epoch
+    msg += tx.version.to_bytes(4, 'little') + tx.lock_time.to_bytes(4, 'little')
+    if not anyone_can_pay:
+        msg += sha_prevouts + sha_amounts + sha_scriptpubkeys + sha_sequences
+    if base_type != SIGHASH_NONE and base_type != SIGHASH_SINGLE:
+        msg += sha_outputs
+
+    ext_flag = 0 if leaf_hash is None else 1
+    msg += bytes([ext_flag * 2 + (annex is not None)])
+    tx_in = tx.tx_ins[index]
+    if anyone_can_pay:
+        spent = spent_outputs[index]
+        msg += _outpoint(tx_in) + spent.amount.to_bytes(8, 'little') + spent.script_pubkey.serialize()
+        msg += tx_in.sequence.to_bytes(4, 'little')
+    else:
+        msg += index.to_bytes(4, 'little')
+    if annex is not None:
+        msg += sha256(encode_varint(len(annex)) + annex)
+    if base_type == SIGHASH_SINGLE:
+        msg += sha256(tx.tx_outs[index].serialize())
+    if ext_flag:
+        msg += leaf_hash + bytes([key_version]) + codesep_pos.to_bytes(4, 'little')
+    return tagged_hash("TapSighash", msg)
+
+
+class SighashTest(TestCase):
+    # native P2WPKH example of BIP143
+    unsigned_tx = "0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000"
+
+    # keyPathSpending of the BIP341 wallet test vectors
+    bip341_tx = "02000000097de20cbff686da83a54981d2b9bab3586f4ca7e48f57f5b55963115f3b334e9c010000000000000000d7b7cab57b1393ace2d064f4d4a2cb8af6def61273e127517d44759b6dafdd990000000000fffffffff8e1f583384333689228c5d28eac13366be082dc57441760d957275419a418420000000000fffffffff0689180aa63b30cb162a73c6d2a38b7eeda2a83ece74310fda0843ad604853b0100000000feffffffaa5202bdf6d8ccd2ee0f0202afbbb7461d9264a25e5bfd3c5a52ee1239e0ba6c0000000000feffffff956149bdc66faa968eb2be2d2faa29718acbfe3941215893a2a3446d32acd050000000000000000000e664b9773b88c09c32cb70a2a3e4da0ced63b7ba3b22f848531bbb1d5d5f4c94010000000000000000e9aa6b8e6c9de67619e6a3924ae25696bb7b694bb677a632a74ef7eadfd4eabf0000000000ffffffffa778eb6a263dc090464cd125c466b5a99667720b1c110468831d058aa1b82af10100000000ffffffff0200ca9a3b000000001976a91406afd46bcdfd22ef94ac122aa11f241244a37ecc88ac807840cb0000000020ac9a87f5594be208f8532db38cff670c450ed2fea8fcdefcc9a663f78bab962b0065cd1d"
+    bip341_spent = [
+        (420000000, "512053a1f6e454df1aa2776a2814a721372d6258050de330b3c6d10ee8f4e0dda343"),
+        (462000000, "5120147c9c57132f6e7ecddba9800bb0c4449251c92a1e60371ee77557b6620f3ea3"),
+        (294000000, "76a914751e76e8199196d454941c45d1b3a323f1433bd688ac"),
+        (504000000, "5120e4d810fd50586274face62b8a807eb9719cef49c04177cc6b76a9a4251d5450e"),
+        (630000000, "512091b64d5324723a985170e4dc5a0f84c041804f2cd12660fa5dec09fc21783605"),
+        (378000000, "00147dd65592d0ab2fe0d0257d571abf032cd9db93dc"),
+        (672000000, "512075169f4001aa68f15bbed28b218df1d0a62cbbcf1188c6665110c293c907b831"),
+        (546000000, "5120712447206d7a5238acc7ff53fbe94a3b64539ad291c7cdbc490b7577e4b17df5"),
+        (588000000, "512077e30a5522dd9f894c3f8b8bd4c4b2cf82ca7da8a3ea6a239655c39c050ab220"),
+    ]
+    # (input index, hash type, sigHash)
+    bip341_sighashes = [
+        (0, 3, "2514a6272f85cfa0f45eb907fcb0d121b808ed37c6ea160a5a9046ed5526d555"),
+        (1, 131, "325a644af47e8a5a2591cda0ab0723978537318f10e6a63d4eed783b96a71a4d"),
+        (3, 1, "bf013ea93474aa67815b1b6cc441d23b64fa310911d991e713cd34c7f5d46669"),
+        (4, 0, "4f900a0bae3f1446fd48490c2958b5a023228f01661cda3496a11da502a7f7ef"),
+        (6, 2, "15f25c298eb5cdc7eb1d638dd2d45c97c4c59dcaec6679cfc16ad84f30876b85"),
+        (7, 130, "cd292de50313804dabe4685e83f923d2969577191a3e1d2882220dca88cbeb10"),
+        (8, 129, "cccb739eca6c13a8a89e6e5cd317ffe55669bbda23f2fd37b0f18755e008edd2"),
+    ]
+
+    def test_bip143_vector(self):
+        tx = Transaction.parse_from_hex(SighashTest.unsigned_tx)
+        hash_prevouts, hash_sequence, hash_outputs = bip143_hashes(tx)
+        self.assertEqual(hash_prevouts.hex(), "96b827c8483d4e9b96712b6713a7b68d6e8003a781feba36c31143470b4efd37")
+        self.assertEqual(hash_sequence.hex(), "52b0a642eea2fb7ae638c36f6252b6750293dbe574a806984b8e4d8548339a3b")
+        self.assertEqual(hash_outputs.hex(), "863ef3e1a92afbfdb97f31ad0fc7683ee943e9abcf2501590ff8f6551f47e5e5")
+
+        script_code = bytes.fromhex("76a9141d0f172a0ecb48aee1be1f2687d2963ae33f71a188ac")
+        sighash = bip143_sighash(tx, 1, script_code, 600000000, SIGHASH_ALL)
+        self.assertEqual(sighash.hex(), "c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670")
+
+    def test_precomputed_parts_follow_transaction_changes(self):
+        tx = Transaction.parse_from_hex(SighashTest.unsigned_tx)
+        script_code = bytes.fromhex("76a9141d0f172a0ecb48aee1be1f2687d2963ae33f71a188ac")
+        before = bip143_sighash(tx, 1, script_code, 600000000, SIGHASH_ALL)
+        legacy_before = legacy_sighash(tx, 1, script_code, SIGHASH_ALL)
+        tx.tx_outs[0].amount -= 1
+        self.assertNotEqual(bip143_sighash(tx, 1, script_code, 600000000, SIGHASH_ALL), before)
+        self.assertNotEqual(legacy_sighash(tx, 1, script_code, SIGHASH_ALL), legacy_before)
+
+        # attaching a signature keeps the parts but not the hashes of the transaction
+        before = bip143_sighash(tx, 1, script_code, 600000000, SIGHASH_ALL)
+        parts, wtx_id = bip143_hashes(tx), tx.wtx_id
+        tx.tx_ins[0].witness = [b"\x01" * 72, b"\x02" * 33]
+        tx.tx_ins[1].script_sig = Script([b"\x01" * 72])
+        self.assertIs(bip143_hashes(tx)[0], parts[0])
+        self.assertEqual(bip143_sighash(tx, 1, script_code, 600000000, SIGHASH_ALL), before)
+        self.assertNotEqual(tx.wtx_id, wtx_id)
+        tx.tx_ins[1].sequence -= 1
+        self.assertNotEqual(bip143_hashes(tx)[1], parts[1])
+        self.assertNotEqual(bip143_sighash(tx, 1, script_code, 600000000, SIGHASH_ALL), before)
+
+    def test_bip341_sighash(self):
+        tx = Transaction.parse_from_hex(SighashTest.unsigned_tx)
+        spent = [TxOut(625000000, Script(raw=bytes.fromhex("5120" + "11" * 32))),
+                 TxOut(600000000, Script(raw=bytes.fromhex("5120" + "22" * 32)))]
+        default = bip341_sighash(tx, 0, spent)
+        self.assertEqual(len(default), 32)
+        self.assertNotEqual(default, bip341_sighash(tx, 0, spent, SIGHASH_ALL))  # hash type is committed
+        self.assertNotEqual(default, bip341_sighash(tx, 1, spent))
+
+        # ANYONECANPAY commits only to its own input
+        one = bip341_sighash(tx, 0, spent, SIGHASH_ALL | SIGHASH_ANYONECANPAY)
+        spent_changed = [spent[0], TxOut(1, spent[1].script_pubkey)]
+        self.assertEqual(one, bip341_sighash(tx, 0, spent_changed, SIGHASH_ALL | SIGHASH_ANYONECANPAY))
+        self.assertNotEqual(default, bip341_sighash(tx, 0, spent_changed))
+
+        with self.assertRaises(Exception):
+            bip341_sighash(tx, 0, spent, 0x04)
+
+    def test_bip341_vectors(self):
+        tx = Transaction.parse_from_hex(SighashTest.bip341_tx)
+        spent = [TxOut(amount, Script(raw=bytes.fromhex(script))) for amount, script in SighashTest.bip341_spent]
+        sha_prevouts, sha_amounts, sha_scriptpubkeys, sha_sequences, sha_outputs = bip341_hashes(tx, spent)
+        self.assertEqual(sha_prevouts.hex(), "e3b33bb4ef3a52ad1fffb555c0d82828eb22737036eaeb02a235d82b909c4c3f")
+        self.assertEqual(sha_amounts.hex(), "58a6964a4f5f8f0b642ded0a8a553be7622a719da71d1f5befcefcdee8e0fde6")
+        self.assertEqual(sha_scriptpubkeys.hex(), "23ad0f61ad2bca5ba6a7693f50fce988e17c3780bf2b1e720cfbb38fbdd52e21")
+        self.assertEqual(sha_sequences.hex(), "18959c7221ab5ce9e26c3cd67b22c24f8baa54bac281d8e6b05e400e6c3a957e")
+        self.assertEqual(sha_outputs.hex(), "a2e6dab7c1f0dcd297c8d61647fd17d821541ea69c3cc37dcbad7f90d4eb4bc5")
+        for index, hash_type, expected in SighashTest.bip341_sighashes:
+            self.assertEqual(bip341_sighash(tx, index, spent, hash_type).hex(), expected)
+
+        # the hashes follow in-place changes of the same list
+        spent[0] = TxOut(spent[0].amount + 1, spent[0].script_pubkey)
+        self.assertNotEqual(bip341_hashes(tx, spent)[1].hex(), "58a6964a4f5f8f0b642ded0a8a553be7622a719da71d1f5befcefcdee8e0fde6")
+
+    def test_tagged_hash(self):
+        tag_hash = hashlib.sha256(b"TapSighash").digest()
+        expected = hashlib.sha256(tag_hash + tag_hash + b"msg").digest()
+        self.assertEqual(tagged_hash("TapSighash", b"msg"), expected)
+        self.assertEqual(tagged_hash("TapSighash", b"msg"), expected)
@@ -1,20 +1,108 @@
-from bitcoinpy.utils.varint import read_varint, encode_varint
+from bitcoinpy.utils.varint import read_varint, varint_size, write_varint_into
 from bitcoinpy.base.script import Script
 from io import BytesIO
 from typing import Union
 import os
+import struct
 import json
+import copy
 import hashlib
 
 from unittest import TestCase
 
 
+class _TxElementList(list):
+    """
+    list of TxIn/TxOut which drops the cached hashes of its transaction whenever it is modified.
+    An element belongs to the first transaction it is added to; adding it to another one adds a (shallow) copy
+    """
+    def __init__(self, owner, elements):
+        super().__init__()
+        self._owner = owner
+        super().extend(self._adopt(elements))
+
+    def _adopt(self, elements) -> list:
+        """ set the owner of the elements being added, copying those of another transaction """
+        owner = self.__dict__.get("_owner")
+        if owner is None:
+            return list(elements)  # being unpickled; elements keep their restored owner
+        adopted = list()
+        for element in elements:
+            current = element.__dict__.get("_owner")
+            if current is not None and current is not owner:
+                element = copy.copy(element)
+            object.__setattr__(element, "_owner", owner)
+            adopted.append(element)
+        return adopted
+
+    def _changed(self):
+        owner = self.__dict__.get("_owner")
+        if owner is not None:
+            owner.invalidate_cache()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, self._adopt(value) if isinstance(key, slice) else self._adopt([value])[0])
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __iadd__(self, other):
+        result = super().__iadd__(self._adopt(other))
+        self._changed()
+        return result
+
+    def append(self, element):
+        super().append(self._adopt([element])[0])
+        self._changed()
+
+    def extend(self, elements):
+        super().extend(self._adopt(elements))
+        self._changed()
+
+    def insert(self, index, element):
+        super().insert(index, self._adopt([element])[0])
+        self._changed()
+
+    def pop(self, index=-1):
+        element = super().pop(index)
+        self._changed()
+        return element
+
+    def remove(self, element):
+        super().remove(element)
+        self._changed()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
+
+
 class Transaction:
     def __init__(self, tx_ins: list, tx_outs: list, version: int = 0, lock_time: int = 0):
-        self.version = version
-        self.tx_ins = tx_ins
-        self.tx_outs = tx_outs
-        self.lock_time = lock_time
+        # set without __setattr__: there is nothing cached to invalidate yet
+        object.__setattr__(self, "_cache", dict())
+        object.__setattr__(self, "_parts", dict())
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "tx_ins", _TxElementList(self, tx_ins))
+        object.__setattr__(self, "tx_outs", _TxElementList(self, tx_outs))
+        object.__setattr__(self, "lock_time", lock_time)
+
+    def __setattr__(self, name, value):
+        if name in ("tx_ins", "tx_outs"):
+            value = _TxElementList(self, value)
+        object.__setattr__(self, name, value)
+        if name not in ("_cache", "_parts"):
+            self.invalidate_cache()
 
     def __repr__(self):
         tx_ins = ''
@@ -74,25 +162,121 @@ class Transaction:
                         items.append(0)
                     else:
                         items.append(s.read(len))
-                tx_in.witness = items
+                object.__setattr__(tx_in, "witness", items)
         lock_time: int = int.from_bytes(s.read(4), 'little')
         return cls(inputs, outputs, version, lock_time)
 
-    def serialize_legacy(self) -> bytes:
-        result = self.version.to_bytes(4, 'little')
-        result += encode_varint(len(self.tx_ins))
+    def serialized_size(self, include_witness: bool = True) -> int:
+        """ size of the serialization; witnesses are counted only if include_witness and any input has one """
+        size = 8 + varint_size(len(self.tx_ins)) + varint_size(len(self.tx_outs))  # version, lock time and counts
         for tx_in in self.tx_ins:
-            result += tx_in.serialize()
-        result += encode_varint(len(self.tx_outs))
+            size += tx_in.serialized_size()
         for tx_out in self.tx_outs:
-            result += tx_out.serialize()
-        result += self.lock_time.to_bytes(4, 'little')
-        return result
+            size += tx_out.serialized_size()
+        if include_witness and self.has_witness():
+            size += 2  # marker and flag
+            for tx_in in self.tx_ins:
+                size += tx_in.witness_size()
+        return size
+
+    def serialize_into(self, buf: bytearray, offset: int = 0, include_witness: bool = True) -> int:
+        """ write the transaction into a pre-sized buffer and return the next offset """
+        include_witness = include_witness and self.has_witness()
+        struct.pack_into('<I', buf, offset, self.version)
+        offset += 4
+        if include_witness:
+            buf[offset:offset + 2] = b"\x00\x01"
+            offset += 2
+        offset = write_varint_into(buf, offset, len(self.tx_ins))
+        for tx_in in self.tx_ins:
+            offset = tx_in.serialize_into(buf, offset)
+        offset = write_varint_into(buf, offset, len(self.tx_outs))
+        for tx_out in self.tx_outs:
+            offset = tx_out.serialize_into(buf, offset)
+        if include_witness:
+            for tx_in in self.tx_ins:
+                offset = tx_in.serialize_witness_into(buf, offset)
+        struct.pack_into('<I', buf, offset, self.lock_time)
+        return offset + 4
+
+    def _serialize(self, include_witness: bool) -> bytes:
+        result = bytearray(self.serialized_size(include_witness))
+        self.serialize_into(result, 0, include_witness)
+        return bytes(result)
+
+    def serialize_legacy(self) -> bytes:
+        """ serialization without witness (used for tx id) """
+        return self._serialize(False)
+
+    def serialize(self) -> bytes:
+        """ BIP144 serialization (marker, flag and witnesses) if any input has witness, legacy one otherwise """
+        return self._serialize(True)
+
+    def has_witness(self) -> bool:
+        for tx_in in self.tx_ins:
+            if len(tx_in.witness) > 0:
+                return True
+        return False
+
+    def invalidate_cache(self, signatures_only: bool = False):
+        """
+        drop cached hashes and sizes; called automatically when inputs/outputs or their attributes are set,
+        but not on in-place edits of a witness or script, which need an explicit call.
+        signatures_only: only a scriptSig or witness changed; values of cached() are kept
+        """
+        self._cache.clear()
+        if not signatures_only:
+            self._parts.clear()
+
+    def _cached_serialization(self):
+        # serialize once and fill every derived value
+        legacy = self.serialize_legacy()
+        self._cache["tx_id"] = hashlib.sha256(hashlib.sha256(legacy).digest()).digest()[::-1]
+        self._cache["base_size"] = len(legacy)
+        if self.has_witness():
+            full = self.serialize()
+            self._cache["wtx_id"] = hashlib.sha256(hashlib.sha256(full).digest()).digest()[::-1]
+            self._cache["size"] = len(full)
+        else:
+            self._cache["wtx_id"] = self._cache["tx_id"]
+            self._cache["size"] = len(legacy)
+
+    def cached(self, key: str, compute):
+        """
+        return value cached under key, computing it with compute() once.
+        compute must not depend on scriptSig or witness: the value is kept when only those are set
+        """
+        if key not in self._parts:
+            self._parts[key] = compute()
+        return self._parts[key]
+
+    def _get_cached(self, key: str):
+        if key not in self._cache:
+            self._cached_serialization()
+        return self._cache[key]
+
+    @property
+    def tx_id(self) -> bytes:
+        """ hash of the serialization without witness (big endian) """
+        return self._get_cached("tx_id")
+
+    @property
+    def wtx_id(self) -> bytes:
+        """ hash of the BIP144 serialization (big endian); equals tx_id for non-witness transactions """
+        return self._get_cached("wtx_id")
+
+    @property
+    def size(self) -> int:
+        """ size of the serialization including witness """
+        return self._get_cached("size")
 
     @property
-    def tx_id(self):
-        result = self.serialize_legacy()
-        return hashlib.sha256(hashlib.sha256(result).digest()).digest()[::-1]
+    def weight(self) -> int:
+        return self._get_cached("base_size") * 3 + self._get_cached("size")
+
+    @property
+    def vsize(self) -> int:
+        return (self.weight + 3) // 4
 
     @property
     def height(self) -> Union[int, None]:
@@ -103,13 +287,19 @@ class Transaction:
 
 
 class TxIn:
-    def __init__(self, prev_tx: bytes, prev_index: int, script_sig: Script = None, sequence=0xffffffff):
-        self.prev_tx = prev_tx
-        self.prev_index = prev_index
-        self.script_sig = script_sig
-        if script_sig is None:
-            self.script_sig = Script()
-        self.sequence = sequence
+    def __init__(self, prev_tx: bytes, prev_index: int, script_sig: Script = None, sequence=0xffffffff, witness: list = None):
+        # set without __setattr__: a new input has no owner to invalidate
+        object.__setattr__(self, "prev_tx", prev_tx)
+        object.__setattr__(self, "prev_index", prev_index)
+        object.__setattr__(self, "script_sig", Script() if script_sig is None else script_sig)
+        object.__setattr__(self, "sequence", sequence)
+        object.__setattr__(self, "witness", list() if witness is None else witness)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        owner = self.__dict__.get("_owner")
+        if owner is not None and name != "_owner":
+            owner.invalidate_cache(signatures_only=name in ("script_sig", "witness"))
 
     def __repr__(self):
         return '{}:{}'.format(
@@ -128,12 +318,42 @@ class TxIn:
         sequence = int.from_bytes(s.read(4), 'little')  # sequence
         return cls(prev_tx, prev_index, script_sig, sequence)
 
+    def serialized_size(self) -> int:
+        return 40 + self.script_sig.serialized_size()  # outpoint, sequence and script
+
+    def serialize_into(self, buf: bytearray, offset: int) -> int:
+        buf[offset:offset + 32] = self.prev_tx[::-1]
+        struct.pack_into('<I', buf, offset + 32, self.prev_index)
+        offset = self.script_sig.serialize_into(buf, offset + 36)
+        struct.pack_into('<I', buf, offset, self.sequence)
+        return offset + 4
+
     def serialize(self):
-        result = self.prev_tx[::-1]
-        result += self.prev_index.to_bytes(4, 'little')
-        result += self.script_sig.serialize()
-        result += self.sequence.to_bytes(4, 'little')
-        return result
+        result = bytearray(self.serialized_size())
+        self.serialize_into(result, 0)
+        return bytes(result)
+
+    def witness_size(self) -> int:
+        size = varint_size(len(self.witness))
+        for item in self.witness:
+            length = 0 if item == 0 else len(item)
+            size += varint_size(length) + length
+        return size
+
+    def serialize_witness_into(self, buf: bytearray, offset: int) -> int:
+        offset = write_varint_into(buf, offset, len(self.witness))
+        for item in self.witness:
+            if item == 0:
+                item = b''  # empty item is parsed as 0
+            offset = write_varint_into(buf, offset, len(item))
+            buf[offset:offset + len(item)] = item
+            offset += len(item)
+        return offset
+
+    def serialize_witness(self) -> bytes:
+        result = bytearray(self.witness_size())
+        self.serialize_witness_into(result, 0)
+        return bytes(result)
 
     def is_coinbase(self) -> bool:
         # TxIn().prev_tx
@@ -154,8 +374,15 @@ class TxIn:
 
 class TxOut:
     def __init__(self, amount: int, script_pubkey: Script):
-        self.amount: int = amount
-        self.script_pubkey = script_pubkey
+        # set without __setattr__: a new output has no owner to invalidate
+        object.__setattr__(self, "amount", amount)
+        object.__setattr__(self, "script_pubkey", script_pubkey)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        owner = self.__dict__.get("_owner")
+        if owner is not None and name != "_owner":
+            owner.invalidate_cache()
 
     def __repr__(self):
         return '{}:{}'.format(self.amount, self.script_pubkey)
@@ -166,10 +393,17 @@ class TxOut:
         script_pubkey = Script.parse(s)  # scriptPubkey
         return cls(amount, script_pubkey)
 
+    def serialized_size(self) -> int:
+        return 8 + self.script_pubkey.serialized_size()
+
+    def serialize_into(self, buf: bytearray, offset: int) -> int:
+        struct.pack_into('<Q', buf, offset, self.amount)
+        return self.script_pubkey.serialize_into(buf, offset + 8)
+
     def serialize(self):
-        result = self.amount.to_bytes(8, 'little')
-        result += self.script_pubkey.serialize()
-        return result
+        result = bytearray(self.serialized_size())
+        self.serialize_into(result, 0)
+        return bytes(result)
 
 
 class BTCTransaction(TestCase):
@@ -221,4 +455,75 @@ class BTCTransaction(TestCase):
 
             legacy_serialized: bytes = tx_obj.serialize_legacy()
             actual_tx_id = hashlib.sha256(hashlib.sha256(legacy_serialized).digest()).digest()[::-1]
-            self.assertEqual(expected_data["txid"], actual_tx_id.hex())
\ No newline at end of file
+            self.assertEqual(expected_data["txid"], actual_tx_id.hex())
+
+
+class TransactionSerializationTest(TestCase):
+    # signed native P2WPKH example of BIP143
+    segwit_tx_hex = "01000000000102fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f00000000494830450221008b9d1dc26ba6a9cb62127b02742fa9d754cd3bebf337f7a55d114c8e5cdd30be022040529b194ba3f9281a99f2b1c0a19c0489bc22ede944ccf4ecbab4cc618ef3ed01eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac000247304402203609e17b84f6a7d30c80bfa610b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c4518331561406f90300e8f3358f51928d43c212a8caed02de67eebee0121025476c2e83188368da1ff3e292e7acafcdb3566bb0ad253f62fc70f07aeee635711000000"
+
+    def test_segwit_serialization(self):
+        tx_obj = Transaction.parse_from_hex(TransactionSerializationTest.segwit_tx_hex)
+        self.assertEqual(tx_obj.serialize().hex(), TransactionSerializationTest.segwit_tx_hex)
+        self.assertTrue(tx_obj.has_witness())
+        self.assertEqual(tx_obj.size, 343)
+        self.assertEqual(tx_obj.weight, 1042)
+        self.assertEqual(tx_obj.vsize, 261)
+        self.assertNotEqual(tx_obj.tx_id, tx_obj.wtx_id)
+
+        legacy = tx_obj.serialize_legacy()
+        self.assertEqual(tx_obj.tx_id, hashlib.sha256(hashlib.sha256(legacy).digest()).digest()[::-1])
+        full = tx_obj.serialize()
+        self.assertEqual(tx_obj.wtx_id, hashlib.sha256(hashlib.sha256(full).digest()).digest()[::-1])
+
+    def test_cache_invalidation(self):
+        tx_obj = Transaction.parse_from_hex(TransactionSerializationTest.segwit_tx_hex)
+        tx_id, wtx_id, size = tx_obj.tx_id, tx_obj.wtx_id, tx_obj.size
+
+        # witness change: wtx_id only
+        tx_obj.tx_ins[1].witness = [b"\x01" * 72, b"\x02" * 33]
+        self.assertEqual(tx_obj.tx_id, tx_id)
+        self.assertNotEqual(tx_obj.wtx_id, wtx_id)
+
+        # output change
+        tx_obj.tx_outs[0].amount += 1
+        self.assertNotEqual(tx_obj.tx_id, tx_id)
+
+        # new output
+        tx_id = tx_obj.tx_id
+        tx_obj.tx_outs.append(TxOut(1000, Script([0x00, b"\x00" * 20])))
+        self.assertNotEqual(tx_obj.tx_id, tx_id)
+        self.assertEqual(tx_obj.size, size + 1 + 8 + 1 + 22)
+
+        tx_obj.lock_time = 0
+        self.assertEqual(tx_obj.serialize()[-4:], b"\x00" * 4)
+
+        # in-place edits need an explicit invalidation
+        wtx_id = tx_obj.wtx_id
+        tx_obj.tx_ins[1].witness[0] = b"\x03" * 72
+        tx_obj.invalidate_cache()
+        self.assertNotEqual(tx_obj.wtx_id, wtx_id)
+
+    def test_append_and_shared_elements(self):
+        import time
+        tx_obj = Transaction([TxIn(b"\x01" * 32, 0)], [], 2)
+        start = time.perf_counter()
+        for i in range(20000):
+            tx_obj.tx_outs.append(TxOut(i, Script([0x00, b"\x00" * 20])))
+        # appending touches only the new element, not the whole list (minutes when quadratic)
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertTrue(all(tx_out._owner is tx_obj for tx_out in tx_obj.tx_outs))
+
+        # an element of another transaction is added as a copy, so editing it leaves no stale hash behind
+        template = Transaction([TxIn(b"\x02" * 32, 0)], [TxOut(1000, Script([0x00, b"\x00" * 20]))], 2)
+        other = Transaction(template.tx_ins, [], 2)
+        other.tx_outs += template.tx_outs
+        self.assertIsNot(other.tx_ins[0], template.tx_ins[0])
+        self.assertIsNot(other.tx_outs[0], template.tx_outs[0])
+        tx_id, other_id = template.tx_id, other.tx_id
+        template.tx_outs[0].amount = 2000
+        self.assertNotEqual(template.tx_id, tx_id)
+        self.assertEqual(other.tx_id, other_id)
+        other.tx_ins[0].sequence = 0
+        self.assertNotEqual(other.tx_id, other_id)
+        self.assertEqual(Transaction(template.tx_ins, template.tx_outs, 2).tx_id, template.tx_id)
@@ -0,0 +1,203 @@
+from decimal import Decimal
+from typing import Union
+
+from bitcoinpy.base.amount import BTCAmount
+from bitcoinpy.base.script import Script
+from bitcoinpy.base.script_type import ScriptType, script_pubkey_from_address
+from bitcoinpy.base.transaction import Transaction, TxIn, TxOut
+from bitcoinpy.utils.varint import varint_size
+
+# import for test below
+from unittest import TestCase
+
+
+# (scriptSig size, witness size) of a signed input spending the script type; signatures counted as 72 bytes (worst case)
+INPUT_SIZE_ESTIMATES = {
+    ScriptType.P2PKH: (1 + 72 + 1 + 33, 0),
+    ScriptType.P2PK: (1 + 72, 0),
+    ScriptType.P2WPKH: (0, 1 + 1 + 72 + 1 + 33),
+    ScriptType.P2TR: (0, 1 + 1 + 64),  # key path, SIGHASH_DEFAULT
+}
+
+DUST_RELAY_FEE = 3  # sat/vB
+
+
+def dust_threshold(script_pubkey: Script, dust_relay_fee: int = DUST_RELAY_FEE) -> BTCAmount:
+    """ smallest relayable output value: cost of creating and later spending the output (bitcoind GetDustThreshold) """
+    raw = script_pubkey.raw_serialize()
+    if raw and raw[0] == 0x6a:
+        return BTCAmount(0)  # OP_RETURN is never spent
+    output_size = 8 + varint_size(len(raw)) + len(raw)
+    is_witness = len(raw) >= 4 and (raw[0] == 0x00 or 0x51 <= raw[0] <= 0x60) and raw[1] == len(raw) - 2
+    spend_size = 32 + 4 + 1 + (107 // 4 if is_witness else 107) + 4
+    return BTCAmount((output_size + spend_size) * dust_relay_fee)
+
+
+def _sat(amount: Union[BTCAmount, int]) -> int:
+    return amount.to_sat if isinstance(amount, BTCAmount) else amount
+
+
+class TransactionBuilder:
+    """
+    Collect inputs and outputs of an unsigned transaction while keeping its signed size as running sums,
+    so that weight, fee and change queries are O(1) and the transaction is serialized only once, by build().
+    Sizes of unsigned inputs come from INPUT_SIZE_ESTIMATES or are given explicitly.
+    """
+    def __init__(self, version: int = 2, lock_time: int = 0):
+        self.version = version
+        self.lock_time = lock_time
+        self.tx_ins = list()
+        self.tx_outs = list()
+        self.total_in = 0
+        self.total_out = 0
+        self._input_bytes = 0
+        self._output_bytes = 0
+        self._witness_bytes = 0
+        self._witness_inputs = 0
+
+    def add_input(self, prev_tx: bytes, prev_index: int, amount: Union[BTCAmount, int], script_type: ScriptType = ScriptType.P2WPKH,
+                  sequence: int = 0xffffffff, script_sig_size: int = None, witness_size: int = None):
+        """ prev_tx in big endian; sizes are required for script types without estimate (e.g. P2WSH, multisig) """
+        if script_sig_size is None or witness_size is None:
+            if script_type not in INPUT_SIZE_ESTIMATES:
+                raise Exception("No size estimate for input type: {}".format(script_type))
+            estimate = INPUT_SIZE_ESTIMATES[script_type]
+            script_sig_size = estimate[0] if script_sig_size is None else script_sig_size
+            witness_size = estimate[1] if witness_size is None else witness_size
+
+        self.tx_ins.append(TxIn(prev_tx, prev_index, sequence=sequence))
+        self.total_in += _sat(amount)
+        self._input_bytes += 36 + varint_size(script_sig_size) + script_sig_size + 4
+        if witness_size:
+            self._witness_bytes += witness_size
+            self._witness_inputs += 1
+        return self
+
+    def add_output(self, script_pubkey: Union[Script, bytes, str], amount: Union[BTCAmount, int]):
+        """ script_pubkey is Script, raw script bytes or an address """
+        if isinstance(script_pubkey, str):
+            script_pubkey = script_pubkey_from_address(script_pubkey)
+        if isinstance(script_pubkey, bytes):
+            script_pubkey = Script(raw=script_pubkey)
+        tx_out = TxOut(_sat(amount), script_pubkey)
+        self.tx_outs.append(tx_out)
+        self.total_out += tx_out.amount
+        self._output_bytes += tx_out.serialized_size()
+        return self
+
+    def _weight(self, extra_outputs: int = 0, extra_output_bytes: int = 0) -> int:
+        num_outputs = len(self.tx_outs) + extra_outputs
+        base = 4 + varint_size(len(self.tx_ins)) + self._input_bytes
+        base += varint_size(num_outputs) + self._output_bytes + extra_output_bytes + 4
+        weight = base * 4
+        if self._witness_inputs:
+            # marker, flag and an empty stack (1 byte) for every non-witness input
+            weight += 2 + self._witness_bytes + len(self.tx_ins) - self._witness_inputs
+        return weight
+
+    @property
+    def weight(self) -> int:
+        return self._weight()
+
+    @property
+    def vsize(self) -> int:
+        return (self._weight() + 3) // 4
+
+    @staticmethod
+    def _fee_for(weight: int, fee_rate: float) -> int:
+        """ fee_rate in sat/vB, rounded up to whole satoshi; exact for the decimal value of fee_rate (110 * 1.1 is 121) """
+        vsize = (weight + 3) // 4
+        numerator, denominator = Decimal(str(fee_rate)).as_integer_ratio()
+        return -(-vsize * numerator // denominator)
+
+    def fee(self, fee_rate: float) -> BTCAmount:
+        """ fee required by the current inputs and outputs """
+        return BTCAmount(self._fee_for(self._weight(), fee_rate))
+
+    @property
+    def fee_paid(self) -> BTCAmount:
+        return BTCAmount(self.total_in - self.total_out)
+
+    def change(self, fee_rate: float, change_script: Script) -> Union[BTCAmount, None]:
+        """ value of a change output paying to change_script at fee_rate; None if it would be dust (or negative) """
+        output_size = TxOut(0, change_script).serialized_size()
+        fee = self._fee_for(self._weight(1, output_size), fee_rate)
+        change = self.total_in - self.total_out - fee
+        if change < dust_threshold(change_script).to_sat:
+            return None
+        return BTCAmount(change)
+
+    def add_change(self, fee_rate: float, change_script: Union[Script, bytes, str]) -> Union[BTCAmount, None]:
+        """ add change output if it is not dust; the remainder is left as fee otherwise """
+        if isinstance(change_script, str):
+            change_script = script_pubkey_from_address(change_script)
+        if isinstance(change_script, bytes):
+            change_script = Script(raw=change_script)
+        change = self.change(fee_rate, change_script)
+        if change is not None:
+            self.add_output(change_script, change)
+        return change
+
+    def build(self) -> Transaction:
+        """ unsigned transaction; inputs and outputs are copied so that the builder can be reused """
+        tx_ins = [TxIn(tx_in.prev_tx, tx_in.prev_index, sequence=tx_in.sequence) for tx_in in self.tx_ins]
+        tx_outs = [TxOut(tx_out.amount, tx_out.script_pubkey) for tx_out in self.tx_outs]
+        return Transaction(tx_ins, tx_outs, self.version, self.lock_time)
+
+    def serialize(self) -> bytes:
+        return self.build().serialize()
+
+
+class TransactionBuilderTest(TestCase):
+    change_address = "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"
+
+    @staticmethod
+    def _sign_with_dummies(tx: Transaction, script_types: list) -> Transaction:
+        """ put worst-case sized signatures in place of real ones """
+        for tx_in, script_type in zip(tx.tx_ins, script_types):
+            if script_type == ScriptType.P2WPKH:
+                tx_in.witness = [b'\x30' * 72, b'\x02' * 33]
+            elif script_type == ScriptType.P2TR:
+                tx_in.witness = [b'\x01' * 64]
+            elif script_type == ScriptType.P2PKH:
+                tx_in.script_sig = Script([b'\x30' * 72, b'\x02' * 33])
+        return tx
+
+    def test_estimate_matches_signed_size(self):
+        script_types = [ScriptType.P2WPKH, ScriptType.P2PKH, ScriptType.P2TR]
+        builder = TransactionBuilder()
+        for i, script_type in enumerate(script_types):
+            builder.add_input(bytes([i]) * 32, i, 100000, script_type)
+
+        # output count crosses the one byte varint boundary
+        for i in range(300):
+            builder.add_output(bytes.fromhex("0014") + i.to_bytes(20, 'big'), 500)
+            tx = self._sign_with_dummies(builder.build(), script_types)
+            if i in (0, 251, 252, 253, 299):
+                self.assertEqual(builder.weight, tx.weight)
+                self.assertEqual(builder.vsize, tx.vsize)
+
+    def test_fee_and_change(self):
+        builder = TransactionBuilder()
+        builder.add_input(b'\x11' * 32, 0, BTCAmount("0.001"))
+        builder.add_output(TransactionBuilderTest.change_address, BTCAmount(50000))
+        self.assertEqual(builder.vsize, 110)
+        self.assertEqual(builder.fee(2).to_sat, 220)
+        self.assertEqual(builder.fee(1.5).to_sat, 165)
+        # 110 * 1.1 is 121.00000000000001 in floats
+        self.assertEqual(builder.fee(1.1).to_sat, 121)
+        self.assertEqual(builder.fee(1.101).to_sat, 122)
+
+        change = builder.add_change(2, TransactionBuilderTest.change_address)
+        self.assertEqual(builder.fee_paid, builder.fee(2))
+        self.assertEqual(change.to_sat, 100000 - 50000 - builder.fee(2).to_sat)
+        self.assertEqual(len(builder.build().tx_outs), 2)
+
+        # change below dust is left to the miner
+        small = TransactionBuilder().add_input(b'\x11' * 32, 0, 50300).add_output(TransactionBuilderTest.change_address, 50000)
+        self.assertIsNone(small.add_change(1, TransactionBuilderTest.change_address))
+        self.assertEqual(dust_threshold(Script(raw=bytes.fromhex("0014" + "00" * 20))).to_sat, 294)
+        self.assertEqual(dust_threshold(Script(raw=bytes.fromhex("76a914" + "00" * 20 + "88ac"))).to_sat, 546)
+
+        with self.assertRaises(Exception):
+            builder.add_input(b'\x11' * 32, 1, 1000, ScriptType.MULTISIG)
@@ -0,0 +1,339 @@
+import sqlite3
+import struct
+import time
+from collections import namedtuple
+from io import BytesIO
+from typing import Iterator, Union
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.header import Header
+from bitcoinpy.base.transaction import Transaction
+
+# import for test below
+from unittest import TestCase
+
+
+UtxoEntry = namedtuple("UtxoEntry", ["amount", "script_pubkey", "height", "is_coinbase"])
+
+# record: (height << 1 | coinbase) and amount, followed by the raw scriptPubKey
+RECORD_HEADER = struct.Struct("<Iq")
+# rough python overhead of a cached entry (dict slot and two bytes objects)
+ENTRY_OVERHEAD = 150
+
+# the genesis block is never connected: its coinbase output is not in the UTXO set (same on every network)
+GENESIS_COINBASE_TXID = bytes.fromhex("4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b")
+
+
+def outpoint_key(tx_id: bytes, vout: int) -> bytes:
+    """ 36-byte key: tx_id (big endian) and little endian vout """
+    return tx_id + vout.to_bytes(4, "little")
+
+
+def pack_record(amount: int, script_pubkey: bytes, height: int, is_coinbase: bool) -> bytes:
+    return RECORD_HEADER.pack(height << 1 | is_coinbase, amount) + script_pubkey
+
+
+def unpack_record(record: bytes) -> UtxoEntry:
+    code, amount = RECORD_HEADER.unpack_from(record)
+    return UtxoEntry(amount, record[RECORD_HEADER.size:], code >> 1, bool(code & 1))
+
+
+class MissingUtxo(Exception):
+    pass
+
+
+class UtxoSet:
+    """
+    UTXO set built by applying transactions in block order.
+    Changes are kept in a write-back cache and spilled to sqlite when the cache exceeds memory_budget bytes.
+    Outputs created and spent between two flushes never reach the database.
+    Spills and checkpoint() store the set with the best block atomically; reopening the same path resumes from it.
+    """
+    def __init__(self, path: str = ":memory:", memory_budget: int = 64 * 2 ** 20, strict: bool = True):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS utxo (outpoint BLOB PRIMARY KEY, record BLOB NOT NULL) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+        self.memory_budget = memory_budget
+        # missing prevouts raise MissingUtxo if strict, otherwise they are counted
+        self.strict = strict
+
+        # outpoint -> record, or None for a spent outpoint which may exist in the database
+        self._cache = dict()
+        # outpoints created after the last flush (not in the database)
+        self._fresh = set()
+        self._cache_bytes = 0
+
+        meta = dict(self.db.execute("SELECT key, value FROM meta").fetchall())
+        self.height: int = meta.get("height", -1)
+        self.best_hash: bytes = meta.get("best_hash")
+        self.count: int = meta.get("count", 0)
+        self.total_amount: int = meta.get("total_amount", 0)
+
+        self.missing = 0
+        self.flushes = 0
+        self.tx_count = 0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def tx_per_sec(self) -> float:
+        """ throughput of the apply calls of this session """
+        return self.tx_count / self.elapsed if self.elapsed else 0.0
+
+    def _load(self, key: bytes) -> Union[bytes, None]:
+        if key in self._cache:
+            return self._cache[key]
+        row = self.db.execute("SELECT record FROM utxo WHERE outpoint = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, tx_id: bytes, vout: int) -> Union[UtxoEntry, None]:
+        record = self._load(outpoint_key(tx_id, vout))
+        return None if record is None else unpack_record(record)
+
+    def add(self, key: bytes, record: bytes):
+        """
+        an unspent output of the same key is replaced, as bitcoind did with the duplicate coinbases before BIP30
+        (blocks 91842 and 91880); only coinbase outputs can repeat a tx id, so only they are looked up in the database
+        """
+        if key in self._cache:
+            previous = self._cache[key]
+            self._cache_bytes += len(record) - (0 if previous is None else len(previous))
+        else:
+            previous = self._load(key) if RECORD_HEADER.unpack_from(record)[0] & 1 else None
+            if previous is None:
+                self._fresh.add(key)
+            self._cache_bytes += ENTRY_OVERHEAD + len(record)
+        self._cache[key] = record
+        if previous is None:
+            self.count += 1
+        else:
+            self.total_amount -= RECORD_HEADER.unpack_from(previous)[1]
+        self.total_amount += RECORD_HEADER.unpack_from(record)[1]
+
+    def spend(self, key: bytes) -> Union[bytes, None]:
+        record = self._load(key)
+        if record is None:
+            self.missing += 1
+            if self.strict:
+                raise MissingUtxo("Missing utxo: {}:{}".format(key[:32].hex(), int.from_bytes(key[32:], "little")))
+            return None
+        if key in self._fresh:
+            # never written: forget it entirely
+            self._fresh.discard(key)
+            del self._cache[key]
+            self._cache_bytes -= ENTRY_OVERHEAD + len(record)
+        else:
+            if key not in self._cache:
+                self._cache_bytes += ENTRY_OVERHEAD
+            self._cache[key] = None
+        self.count -= 1
+        self.total_amount -= RECORD_HEADER.unpack_from(record)[1]
+        return record
+
+    def apply_transaction(self, tx: Transaction, height: int):
+        is_coinbase = tx.is_coinbase()
+        if not is_coinbase:
+            for tx_in in tx.tx_ins:
+                self.spend(outpoint_key(tx_in.prev_tx, tx_in.prev_index))
+        tx_id = tx.tx_id
+        if tx_id == GENESIS_COINBASE_TXID:
+            return
+        for vout, tx_out in enumerate(tx.tx_outs):
+            script = tx_out.script_pubkey.raw_serialize()
+            if script[:1] == b"\x6a":
+                continue  # OP_RETURN outputs are provably unspendable
+            self.add(outpoint_key(tx_id, vout), pack_record(tx_out.amount, script, height, is_coinbase))
+
+    def apply_transactions(self, transactions: Iterator[Transaction], height: int, block_hash: bytes = None, prev_hash: bytes = None):
+        """ block_hash/prev_hash in big endian; prev_hash is checked against the best block if both are known """
+        if prev_hash is not None and self.best_hash is not None and prev_hash != self.best_hash:
+            raise Exception("Block {} does not extend best block {}".format(height, self.best_hash.hex()))
+        start = time.perf_counter()
+        for tx in transactions:
+            self.apply_transaction(tx, height)
+            self.tx_count += 1
+        self.height = height
+        self.best_hash = block_hash
+        if self._cache_bytes > self.memory_budget:
+            self.flush()
+        self.elapsed += time.perf_counter() - start
+
+    def apply_block(self, block: Block):
+        self.apply_transactions(block.transactions, block.height, block.hash.bytes_as_be, block.prev_hash.bytes_as_be)
+
+    def apply_raw_block(self, raw_block: bytes, height: int):
+        """ transactions are parsed one at a time without building a Block """
+        header = Header.parse_from_bytes_io(BytesIO(raw_block[:80]))
+        self.apply_transactions(Block.iter_raw_transactions(raw_block), height, header.hash.bytes_as_be, header.prev_hash.bytes_as_be)
+
+    def apply_raw_blocks(self, raw_blocks: Iterator[bytes], start_height: int = 0, checkpoint_interval: int = 1000):
+        """ apply blocks from start_height on, skipping the ones at or below the resumed height """
+        height = start_height - 1
+        for height, raw_block in enumerate(raw_blocks, start_height):
+            if height <= self.height:
+                continue
+            self.apply_raw_block(raw_block, height)
+            if checkpoint_interval and height % checkpoint_interval == 0:
+                self.checkpoint()
+        if height == self.height:
+            self.checkpoint()
+
+    def _write(self):
+        puts = list()
+        deletes = list()
+        for key, record in self._cache.items():
+            if record is None:
+                deletes.append((key,))
+            else:
+                puts.append((key, record))
+        self.db.executemany("DELETE FROM utxo WHERE outpoint = ?", deletes)
+        self.db.executemany("INSERT OR REPLACE INTO utxo (outpoint, record) VALUES (?, ?)", puts)
+        # the best block goes with the outputs, so that the database is never ahead of its recorded height
+        meta = [("height", self.height), ("best_hash", self.best_hash), ("count", self.count), ("total_amount", self.total_amount)]
+        self.db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta)
+        self._cache.clear()
+        self._fresh.clear()
+        self._cache_bytes = 0
+        self.flushes += 1
+
+    def flush(self):
+        """ spill the cache to the database with the best block; called between blocks, it is a resumable state """
+        with self.db:
+            self._write()
+
+    def checkpoint(self):
+        """ write the cache and the best block in one database transaction """
+        self.flush()
+
+    def iter_entries(self) -> Iterator[tuple]:
+        """ yield (tx_id, vout, UtxoEntry) of the checkpointed or flushed set merged with the cache """
+        for key, record in self._cache.items():
+            if record is not None:
+                yield key[:32], int.from_bytes(key[32:], "little"), unpack_record(record)
+        for key, record in self.db.execute("SELECT outpoint, record FROM utxo"):
+            if key not in self._cache:
+                yield key[:32], int.from_bytes(key[32:], "little"), unpack_record(record)
+
+
+class UtxoSetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from bitcoinpy.base.transaction import TxIn, TxOut
+        from bitcoinpy.test_data.synthetic import build_raw_block, coinbase_tx, p2wpkh_script
+        from bitcoinpy.crypto.hashes import hash256
+
+        def pay(prev: Transaction, vout: int, amounts: list, tag: int) -> Transaction:
+            outs = [TxOut(amount, p2wpkh_script(bytes([tag, i]) * 10)) for i, amount in enumerate(amounts)]
+            return Transaction([TxIn(prev.tx_id, vout)], outs, 2, 0)
+
+        # block 1 spends the coinbase of block 0, block 2 spends within the block
+        cb0, cb1, cb2 = coinbase_tx(0), coinbase_tx(1), coinbase_tx(2)
+        tx1 = pay(cb0, 0, [30 * 10 ** 8, 20 * 10 ** 8], 1)
+        tx2 = pay(tx1, 1, [10 * 10 ** 8, 10 * 10 ** 8], 2)
+        tx3 = pay(tx2, 0, [10 ** 9], 3)
+        cls.cb0_id, cls.tx1_id = cb0.tx_id, tx1.tx_id
+        cls.final = {(cb1.tx_id, 0), (cb2.tx_id, 0), (tx1.tx_id, 0), (tx2.tx_id, 1), (tx3.tx_id, 0)}
+
+        cls.raw_blocks = list()
+        prev_hash = b"\x00" * 32
+        for txs in [[cb0], [cb1, tx1], [cb2, tx2, tx3]]:
+            raw = build_raw_block(txs, prev_hash)
+            cls.raw_blocks.append(raw)
+            prev_hash = hash256(raw[:80])[::-1]
+
+    def test_apply_and_spill(self):
+        for budget in [2 ** 20, 0]:  # no spill, spill after every block
+            with UtxoSet(memory_budget=budget) as utxo_set:
+                utxo_set.apply_raw_blocks(self.raw_blocks)
+                self.assertEqual({(tx_id, vout) for tx_id, vout, _ in utxo_set.iter_entries()}, self.final)
+                self.assertEqual(len(utxo_set), len(self.final))
+                self.assertEqual(utxo_set.total_amount, 150 * 10 ** 8)
+                self.assertEqual(utxo_set.height, 2)
+                self.assertGreater(utxo_set.tx_per_sec, 0)
+                if budget == 0:
+                    self.assertGreaterEqual(utxo_set.flushes, 3)
+
+        with UtxoSet() as utxo_set:
+            with self.assertRaises(MissingUtxo):
+                utxo_set.apply_raw_block(self.raw_blocks[1], 1)
+
+    def test_checkpoint_and_resume(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "utxo.sqlite")
+            with UtxoSet(path) as utxo_set:
+                utxo_set.apply_raw_blocks(self.raw_blocks[:2])
+                utxo_set.apply_raw_block(self.raw_blocks[2], 2)  # not checkpointed
+
+            with UtxoSet(path) as utxo_set:
+                self.assertEqual(utxo_set.height, 1)
+                self.assertEqual(len(utxo_set), 3)
+                self.assertEqual(utxo_set.get(self.tx1_id, 0), UtxoEntry(30 * 10 ** 8, bytes.fromhex("0014") + b"\x01\x00" * 10, 1, False))
+                self.assertIsNone(utxo_set.get(self.cb0_id, 0))
+                # blocks at or below the checkpoint are skipped
+                utxo_set.apply_raw_blocks(self.raw_blocks)
+                self.assertEqual({(tx_id, vout) for tx_id, vout, _ in utxo_set.iter_entries()}, self.final)
+
+            with UtxoSet(path) as utxo_set:
+                self.assertEqual(utxo_set.height, 2)
+                with self.assertRaises(Exception):
+                    utxo_set.apply_raw_block(self.raw_blocks[1], 3)
+
+    def test_resume_after_spill(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "utxo.sqlite")
+            with UtxoSet(path) as utxo_set:
+                utxo_set.apply_raw_blocks(self.raw_blocks[:1])
+            with UtxoSet(path, memory_budget=0) as utxo_set:
+                utxo_set.apply_raw_block(self.raw_blocks[1], 1)  # spilled, not checkpointed
+                self.assertEqual(utxo_set.flushes, 1)
+
+            # the spill recorded its block: resuming does not replay block 1
+            with UtxoSet(path) as utxo_set:
+                self.assertEqual(utxo_set.height, 1)
+                self.assertEqual(len(utxo_set), 3)
+                utxo_set.apply_raw_blocks(self.raw_blocks)
+                self.assertEqual({(tx_id, vout) for tx_id, vout, _ in utxo_set.iter_entries()}, self.final)
+
+    def test_duplicate_coinbase_and_genesis(self):
+        from bitcoinpy.test_data.synthetic import coinbase_tx
+        for budget in [2 ** 20, 0]:  # the first coinbase cached or spilled
+            with UtxoSet(memory_budget=budget) as utxo_set:
+                utxo_set.apply_transactions([coinbase_tx(7)], 7)
+                # same tx id again, e.g. blocks 91812 and 91842: the later output replaces the earlier one
+                utxo_set.apply_transactions([coinbase_tx(7)], 8)
+                self.assertEqual(len(utxo_set), 1)
+                self.assertEqual(utxo_set.total_amount, 50 * 10 ** 8)
+                entries = list(utxo_set.iter_entries())
+                self.assertEqual([(entry.amount, entry.height) for _, _, entry in entries], [(50 * 10 ** 8, 8)])
+
+                utxo_set.spend(outpoint_key(entries[0][0], 0))
+                utxo_set.flush()
+                self.assertEqual((len(utxo_set), utxo_set.total_amount), (0, 0))
+                self.assertEqual(list(utxo_set.iter_entries()), [])
+
+        genesis = Transaction.parse_from_hex(
+            "01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d65"
+            "732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062"
+            "616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4c"
+            "ef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000")
+        with UtxoSet() as utxo_set:
+            utxo_set.apply_transactions([genesis], 0)
+            self.assertEqual(len(utxo_set), 0)
+            self.assertIsNone(utxo_set.get(GENESIS_COINBASE_TXID, 0))
@@ -0,0 +1,251 @@
+import glob
+import mmap
+import os
+import struct
+from io import BytesIO
+from typing import Iterator, Union
+
+from bitcoinpy.base.account import NetType
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.header import Header
+from bitcoinpy.crypto.hashes import hash256
+
+# import for test below
+import shutil
+import tempfile
+from unittest import TestCase
+
+
+NETWORK_MAGIC = {
+    NetType.MAIN_NET: bytes.fromhex("f9beb4d9"),
+    NetType.TEST_NET: bytes.fromhex("0b110907"),
+    NetType.REG_TEST: bytes.fromhex("fabfb5da"),
+}
+
+XOR_KEY_FILE = "xor.dat"
+INDEX_FILE_MAGIC = b"BPYBLKI1"
+# record: block hash (internal byte order), file number, payload offset, payload size
+INDEX_RECORD = struct.Struct("<32sIII")
+
+
+class BlkFileReader:
+    """
+    Read blocks straight from bitcoin-core "blocks/" directory (blk?????.dat files).
+    Each file is memory-mapped; blocks are framed as <network magic><4-byte le size><block>
+    and may be obfuscated by the 8-byte key stored in "xor.dat".
+    """
+    def __init__(self, blocks_dir: str, network_type: NetType = NetType.MAIN_NET, index_path: str = None):
+        if network_type not in NETWORK_MAGIC:
+            raise Exception("Not supported network: {}".format(network_type))
+        self.blocks_dir = blocks_dir
+        self.magic: bytes = NETWORK_MAGIC[network_type]
+        self.xor_key: bytes = self._load_xor_key()
+
+        # block hash (internal byte order) -> (file number, payload offset, payload size)
+        self.index_path = index_path
+        self._index: dict = dict()
+        # file number -> end offset of the last indexed block
+        self._indexed_end: dict = dict()
+        self._maps: dict = dict()
+        if index_path is not None and os.path.exists(index_path):
+            self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        for fd, mm in self._maps.values():
+            mm.close()
+            fd.close()
+        self._maps = dict()
+
+    def _load_xor_key(self) -> bytes:
+        path = os.path.join(self.blocks_dir, XOR_KEY_FILE)
+        if not os.path.exists(path):
+            return b"\x00" * 8
+        with open(path, "rb") as f:
+            key = f.read()
+        if len(key) != 8:
+            raise Exception("Invalid xor key length: {}".format(len(key)))
+        return key
+
+    def blk_files(self) -> list:
+        """ return sorted list of (file number, path) """
+        files = list()
+        for path in glob.glob(os.path.join(self.blocks_dir, "blk*.dat")):
+            name = os.path.basename(path)
+            files.append((int(name[3:-4]), path))
+        files.sort()
+        return files
+
+    def _map(self, file_no: int) -> Union[mmap.mmap, None]:
+        if file_no not in self._maps:
+            path = os.path.join(self.blocks_dir, "blk{:05d}.dat".format(file_no))
+            fd = open(path, "rb")
+            if os.fstat(fd.fileno()).st_size == 0:
+                fd.close()
+                return None
+            self._maps[file_no] = (fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[file_no][1]
+
+    def _read(self, file_no: int, offset: int, length: int) -> bytes:
+        data = self._map(file_no)[offset:offset + length]
+        if self.xor_key == b"\x00" * 8 or len(data) == 0:
+            return data
+        # the key is applied by absolute file position
+        shift = offset % 8
+        key = self.xor_key[shift:] + self.xor_key[:shift]
+        key_stream = key * (len(data) // 8 + 1)
+        xored = int.from_bytes(data, "little") ^ int.from_bytes(key_stream[:len(data)], "little")
+        return xored.to_bytes(len(data), "little")
+
+    def _scan_file(self, file_no: int, start: int = 0) -> Iterator[tuple]:
+        """ yield (payload offset, payload size, raw header) of each block framed in the file """
+        mm = self._map(file_no)
+        if mm is None:
+            return
+        file_size = len(mm)
+        pos = start
+        while pos + 8 <= file_size:
+            frame = self._read(file_no, pos, 8)
+            if frame[:4] == b"\x00" * 4:
+                break  # pre-allocated tail of the file
+            if frame[:4] != self.magic:
+                raise Exception("Invalid network magic at blk{:05d}.dat:{}: {}".format(file_no, pos, frame[:4].hex()))
+            size = int.from_bytes(frame[4:], "little")
+            if pos + 8 + size > file_size:
+                break  # block is being written
+            yield pos + 8, size, self._read(file_no, pos + 8, 80)
+            pos += 8 + size
+
+    def build_index(self) -> int:
+        """ index every block not indexed yet and return number of newly indexed blocks """
+        new_records = list()
+        for file_no, _ in self.blk_files():
+            start = self._indexed_end.get(file_no, 0)
+            for offset, size, raw_header in self._scan_file(file_no, start):
+                block_hash = hash256(raw_header)
+                self._index[block_hash] = (file_no, offset, size)
+                self._indexed_end[file_no] = offset + size
+                new_records.append(INDEX_RECORD.pack(block_hash, file_no, offset, size))
+
+        if self.index_path is not None and len(new_records) > 0:
+            self._save_index(new_records)
+        return len(new_records)
+
+    def _load_index(self):
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        if data[:len(INDEX_FILE_MAGIC)] != INDEX_FILE_MAGIC:
+            raise Exception("Invalid index file: {}".format(self.index_path))
+        for block_hash, file_no, offset, size in INDEX_RECORD.iter_unpack(data[len(INDEX_FILE_MAGIC):]):
+            self._index[block_hash] = (file_no, offset, size)
+            self._indexed_end[file_no] = max(self._indexed_end.get(file_no, 0), offset + size)
+
+    def _save_index(self, records: list):
+        is_new = not os.path.exists(self.index_path)
+        with open(self.index_path, "ab") as f:
+            if is_new:
+                f.write(INDEX_FILE_MAGIC)
+            f.write(b"".join(records))
+
+    def location(self, block_hash: str) -> tuple:
+        """ return (file number, payload offset, payload size) of the block (big endian hex hash) """
+        if block_hash.startswith("0x"):
+            block_hash = block_hash[2:]
+        key = bytes.fromhex(block_hash)[::-1]
+        if key not in self._index:
+            raise Exception("Block not indexed: {}".format(block_hash))
+        return self._index[key]
+
+    def get_raw_block(self, block_hash: str) -> bytes:
+        file_no, offset, size = self.location(block_hash)
+        return self._read(file_no, offset, size)
+
+    def get_block(self, block_hash: str) -> Block:
+        return Block.from_raw(self.get_raw_block(block_hash))
+
+    def get_header(self, block_hash: str) -> Header:
+        file_no, offset, _ = self.location(block_hash)
+        return Header.parse_from_bytes_io(BytesIO(self._read(file_no, offset, 80)))
+
+    def iter_headers(self) -> Iterator[Header]:
+        """ yield headers in file order (not necessarily height order) """
+        for file_no, _ in self.blk_files():
+            for _, _, raw_header in self._scan_file(file_no):
+                yield Header.parse_from_bytes_io(BytesIO(raw_header))
+
+    def iter_raw_blocks(self) -> Iterator[bytes]:
+        for file_no, _ in self.blk_files():
+            for offset, size, _ in self._scan_file(file_no):
+                yield self._read(file_no, offset, size)
+
+    def iter_blocks(self) -> Iterator[Block]:
+        """ yield blocks in file order; each block is parsed only when requested """
+        for raw_block in self.iter_raw_blocks():
+            yield Block.from_raw(raw_block)
+
+
+class BlkFileReaderTest(TestCase):
+    genesis_raw = bytes.fromhex("0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c0101000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000")
+
+    def setUp(self):
+        self.blocks_dir = tempfile.mkdtemp()
+        # synthetic blocks: genesis with different nonces (merkle root stays valid)
+        self.raw_blocks = list()
+        for nonce in range(3):
+            raw = bytearray(BlkFileReaderTest.genesis_raw)
+            raw[76:80] = nonce.to_bytes(4, "little")
+            self.raw_blocks.append(bytes(raw))
+        self.hashes = [hash256(raw[:80])[::-1].hex() for raw in self.raw_blocks]
+
+    def tearDown(self):
+        shutil.rmtree(self.blocks_dir)
+
+    def write_blk_file(self, file_no: int, raw_blocks: list, xor_key: bytes = b"\x00" * 8):
+        magic = NETWORK_MAGIC[NetType.MAIN_NET]
+        data = b"".join(magic + len(raw).to_bytes(4, "little") + raw for raw in raw_blocks)
+        data += b"\x00" * 16  # pre-allocated space
+        data = bytes(b ^ xor_key[i % 8] for i, b in enumerate(data))
+        with open(os.path.join(self.blocks_dir, "blk{:05d}.dat".format(file_no)), "wb") as f:
+            f.write(data)
+
+    def test_iter_blocks(self):
+        self.write_blk_file(0, self.raw_blocks[:2])
+        self.write_blk_file(1, self.raw_blocks[2:])
+        with BlkFileReader(self.blocks_dir) as reader:
+            actual = [header.hash.hex_as_be[2:] for header in reader.iter_headers()]
+            self.assertEqual(actual, self.hashes)
+            blocks = list(reader.iter_blocks())
+            self.assertEqual(len(blocks[2].transactions), 1)
+
+    def test_xor_obfuscation(self):
+        key = bytes.fromhex("0123456789abcdef")
+        with open(os.path.join(self.blocks_dir, XOR_KEY_FILE), "wb") as f:
+            f.write(key)
+        self.write_blk_file(0, self.raw_blocks, key)
+        with BlkFileReader(self.blocks_dir) as reader:
+            self.assertEqual(reader.build_index(), 3)
+            self.assertEqual(reader.get_raw_block(self.hashes[1]), self.raw_blocks[1])
+            self.assertEqual(reader.get_header(self.hashes[2]).nonce, 2)
+
+    def test_persistent_index(self):
+        index_path = os.path.join(self.blocks_dir, "index.bin")
+        self.write_blk_file(0, self.raw_blocks[:2])
+        with BlkFileReader(self.blocks_dir, index_path=index_path) as reader:
+            self.assertEqual(reader.build_index(), 2)
+
+        # another file appended: only the new block is indexed
+        self.write_blk_file(1, self.raw_blocks[2:])
+        with BlkFileReader(self.blocks_dir, index_path=index_path) as reader:
+            self.assertEqual(len(reader), 2)
+            self.assertEqual(reader.build_index(), 1)
+            self.assertEqual(reader.location(self.hashes[2]), (1, 8, len(self.raw_blocks[2])))
+            block = reader.get_block("0x" + self.hashes[0])
+            self.assertEqual(block.hash.hex_as_be[2:], self.hashes[0])
@@ -1,18 +1,85 @@
+import base64
+import json
+import threading
+import time
 import requests
-import toml
-from requests.auth import HTTPBasicAuth
-from typing import Union
+from requests.adapters import HTTPAdapter
+from typing import Iterable, Union
 from unittest import TestCase
 
+from bitcoinpy.exceptions import RpcError
+from bitcoinpy.instrumentation import Instrumentation
+from bitcoinpy.rpc_cache import MISS, RpcCache, strip_mutable
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP connections shared by clients (and threads).
+    Every thread gets its own requests.Session since Session is not thread-safe,
+    but all sessions use one HTTPAdapter whose urllib3 pool is.
+    """
+    def __init__(self, pool_size: int = 10, pool_block: bool = False, max_retries: int = 0):
+        """ pool_block: wait for a free connection instead of opening one beyond pool_size """
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=pool_block, max_retries=max_retries)
+        self._local = threading.local()
+        self._sessions = list()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+        self.adapter.close()
+
 
 class BasicClient:
-    def __init__(self, url: str, rpc_id: str, rpc_pw: str, wallet_name: str = None):
+    def __init__(self, url: str, rpc_id: str, rpc_pw: str, wallet_name: str = None,
+                 pool: ConnectionPool = None, timeout: Union[float, tuple] = (5, 60), instrumentation: Instrumentation = None):
+        """
+        pool: shared ConnectionPool; a private one is created if not given
+        timeout: seconds or (connect, read) seconds
+        instrumentation: records every request if given
+        """
         self.basic_url = url
         self.multi_wallet_url = url + "/wallet/"
-        # basic auth setting
-        self._rpc_auth = HTTPBasicAuth(rpc_id, rpc_pw)
+        # basic auth header is built once
+        token = base64.b64encode("{}:{}".format(rpc_id, rpc_pw).encode()).decode()
+        self._headers = {"Authorization": "Basic " + token, "Content-Type": "application/json"}
         # used by wallet-specific-requests
         self.wallet_name = wallet_name
+        self._own_pool = pool is None
+        self.pool = ConnectionPool() if pool is None else pool
+        self.timeout = timeout
+        self.instrumentation = instrumentation
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ close the pool unless it is shared """
+        if self._own_pool:
+            self.pool.close()
 
     def basic_request(self, method_name: str, params: list) -> Union[dict, str, list]:
         """ Send rpc request to bitcoin-core without sending-wallet option. """
@@ -27,6 +94,69 @@ class BasicClient:
         url = self.multi_wallet_url + self.wallet_name
         return self._request(url, method_name, params)
 
+    def batch_request(self, calls: list, chunk_size: int = 500, raise_on_error: bool = True, wallet: bool = False) -> list:
+        """
+        Send (method_name, params) calls as JSON-RPC batches of at most chunk_size calls.
+        return results in the order of calls; a failed call gives its RpcError in place (raised if raise_on_error)
+        """
+        url = self.multi_wallet_url + self.wallet_name if wallet else self.basic_url
+        results = list()
+        for start in range(0, len(calls), chunk_size):
+            chunk = calls[start:start + chunk_size]
+            payload = [{"jsonrpc": "1.0", "id": i, "method": method, "params": params} for i, (method, params) in enumerate(chunk)]
+            resp = self._post(url, payload, "batch")
+            chunk_results = [None] * len(chunk)
+            answered = [False] * len(chunk)
+            # error of a response without a usable id, e.g. "id": null for a batch item bitcoind could not parse
+            unmatched = {"code": -32603, "message": "No response to the call in the batch"}
+            # responses are matched by id; their order is not guaranteed
+            for item in resp.json():
+                i = item.get("id")
+                if type(i) != int or not 0 <= i < len(chunk):
+                    unmatched = item.get("error") or {"code": -32603, "message": "Response without the id of a call"}
+                    continue
+                answered[i] = True
+                error = item.get("error")
+                if error is None:
+                    chunk_results[i] = item["result"]
+                else:
+                    chunk_results[i] = RpcError(error["code"], error["message"], chunk[i][0])
+            for i in range(len(chunk)):
+                if not answered[i]:
+                    chunk_results[i] = RpcError(unmatched["code"], unmatched["message"], chunk[i][0])
+            results += chunk_results
+
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, RpcError):
+                    raise result
+        return results
+
+    def _post(self, url: str, payload: Union[dict, list], method_name: str) -> requests.Response:
+        """ send payload through a pooled connection; non-200 responses raise RpcError """
+        body = json.dumps(payload).encode()
+        if self.instrumentation is None:
+            return self._send(url, body, method_name)
+        start = time.perf_counter()
+        try:
+            resp = self._send(url, body, method_name)
+        except Exception as e:
+            self.instrumentation.record(method_name, (time.perf_counter() - start) * 1000, len(body), 0, e)
+            raise
+        self.instrumentation.record(method_name, (time.perf_counter() - start) * 1000, len(body), len(resp.content))
+        return resp
+
+    def _send(self, url: str, body: bytes, method_name: str) -> requests.Response:
+        resp = self.pool.session().post(url, data=body, headers=self._headers, timeout=self.timeout)
+        if resp.status_code == 200:
+            return resp
+        try:
+            error = resp.json()["error"]
+        except (ValueError, TypeError, KeyError):
+            # e.g. 401 has no body
+            raise RpcError(resp.status_code, resp.reason, method_name)
+        raise RpcError(error["code"], error["message"], method_name)
+
     def _request(self, url: str, method_name: str, params: list) -> Union[dict, str, list]:
         """ Build and send a rpc request to bitcoin core """
         # build rpc request message
@@ -35,18 +165,46 @@ class BasicClient:
         payload["method"] = method_name
         payload["params"] = params
 
-        # send rpc response
-        resp = requests.post(url, json=payload, auth=self._rpc_auth)
-        resp_json = resp.json()
-        if resp.status_code == 200:
-            return resp_json["result"]
-        else:
-            raise Exception("rpc fails: {}".format(resp_json["error"]))
+        return self._post(url, payload, method_name).json()["result"]
 
 
 class BitcoinClient(BasicClient):
-    def __init__(self, url: str, rpc_id: str, rpc_pw: str, wallet_name: str = None):
-        super().__init__(url, rpc_id, rpc_pw, wallet_name)
+    def __init__(self, url: str, rpc_id: str, rpc_pw: str, wallet_name: str = None,
+                 pool: ConnectionPool = None, timeout: Union[float, tuple] = (5, 60), cache: RpcCache = None,
+                 instrumentation: Instrumentation = None):
+        """
+        cache: serves blocks and headers by hash, and hashes of heights buried by cache.reorg_depth;
+        verbose results then come without their mutable fields (rpc_cache.MUTABLE_FIELDS)
+        """
+        super().__init__(url, rpc_id, rpc_pw, wallet_name, pool, timeout, instrumentation)
+        self.cache = cache
+
+    def _cached(self, key: Union[str, None], fetch) -> Union[dict, str]:
+        """ key None: not cacheable """
+        if self.cache is None or key is None:
+            return fetch()
+        result = self.cache.get(key, MISS)
+        if result is MISS:
+            result = strip_mutable(fetch())
+            self.cache.put(key, result)
+        return result
+
+    def _cached_batch(self, calls: list, keys: list, chunk_size: int) -> list:
+        """ batch_request of the calls missing in the cache """
+        if self.cache is None:
+            return self.batch_request(calls, chunk_size)
+        results = [MISS if key is None else self.cache.get(key, MISS) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is MISS]
+        for i, result in zip(missing, self.batch_request([calls[i] for i in missing], chunk_size)):
+            results[i] = strip_mutable(result)
+        self.cache.put_many([(keys[i], results[i]) for i in missing if keys[i] is not None])
+        return results
+
+    def _hash_key(self, height: int) -> Union[str, None]:
+        """ hashes near the tip may change by a reorg """
+        if self.cache.confirmed(height, lambda: self.basic_request("getblockcount", list())):
+            return "getblockhash:{}".format(height)
+        return None
 
     # get block hash
     def get_latest_block_hash(self) -> str:
@@ -54,15 +212,18 @@ class BitcoinClient(BasicClient):
 
     # get block hash
     def get_block_hash_by_height(self, height: int) -> str:
-        return self.basic_request("getblockhash", [height])
+        key = None if self.cache is None else self._hash_key(height)
+        return self._cached(key, lambda: self.basic_request("getblockhash", [height]))
 
     # get block
     def get_block_by_hash(self, block_hash: str, verbose: int = 1) -> dict:
-        return self.basic_request("getblock", [block_hash, verbose])
+        key = "getblock:{}:{}".format(block_hash, int(verbose))
+        return self._cached(key, lambda: self.basic_request("getblock", [block_hash, verbose]))
 
     # get block header
     def get_block_header_by_hash(self, block_hash: str, verbose: bool = False) -> dict:
-        return self.basic_request("getblockheader", [block_hash, verbose])
+        key = "getblockheader:{}:{}".format(block_hash, int(verbose))
+        return self._cached(key, lambda: self.basic_request("getblockheader", [block_hash, verbose]))
 
     def get_latest_height(self) -> int:
         block_hash = self.get_latest_block_hash()
@@ -79,13 +240,147 @@ class BitcoinClient(BasicClient):
         block_hash = self.get_block_hash_by_height(height)
         return self.get_block_header_by_hash(block_hash, verbose)
 
+    # range fetches: one batch round trip per chunk and step instead of one per call
+    def get_block_hashes(self, heights: Iterable[int], chunk_size: int = 500) -> list:
+        heights = list(heights)
+        keys = [None] * len(heights) if self.cache is None else [self._hash_key(height) for height in heights]
+        return self._cached_batch([("getblockhash", [height]) for height in heights], keys, chunk_size)
 
-class BtcClientTest(TestCase):
-    def setUp(self):
-        config = toml.load("./rpc_config.toml")
-        self.cli = BitcoinClient(config["url"], config["id"], config["pwd"], config["wallet_name"])
+    def get_headers(self, heights: Iterable[int], verbose: bool = False, chunk_size: int = 500) -> list:
+        block_hashes = self.get_block_hashes(heights, chunk_size)
+        calls = [("getblockheader", [block_hash, verbose]) for block_hash in block_hashes]
+        keys = ["getblockheader:{}:{}".format(block_hash, int(verbose)) for block_hash in block_hashes]
+        return self._cached_batch(calls, keys, chunk_size)
 
+    def get_blocks(self, heights: Iterable[int], verbose: int = 1, chunk_size: int = 50) -> list:
+        """ blocks can be large; chunk_size bounds the size of a response """
+        block_hashes = self.get_block_hashes(heights)
+        calls = [("getblock", [block_hash, verbose]) for block_hash in block_hashes]
+        keys = ["getblock:{}:{}".format(block_hash, int(verbose)) for block_hash in block_hashes]
+        return self._cached_batch(calls, keys, chunk_size)
+
+
+class BtcClientTest(TestCase):
     def test_get_header(self):
-        actual_header = self.cli.get_block_header_by_height(100)
+        from bitcoinpy.crypto.hashes import hash256
+        from bitcoinpy.test_data.fake_bitcoind import ChainData, FakeBitcoind
         expected_header = "0100000095194b8567fe2e8bbda931afd01a7acd399b9325cb54683e64129bcd00000000660802c98f18fd34fd16d61c63cf447568370124ac5f3be626c2e1c3c9f0052d19a76949ffff001d33f3c25d"
+        # mainnet block 100
+        chain = ChainData(start_height=100)
+        chain.append(hash256(bytes.fromhex(expected_header))[::-1].hex(), header=bytes.fromhex(expected_header))
+        with FakeBitcoind(chain) as server, BitcoinClient(server.url, "admin", "0000") as cli:
+            actual_header = cli.get_block_header_by_height(100)
         self.assertEqual(actual_header, expected_header)
+
+
+class ConnectionPoolTest(TestCase):
+    def test_keep_alive(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        with RpcStubServer() as server, BitcoinClient(server.url, "admin", "0000") as cli:
+            for height in range(50):
+                self.assertEqual(cli.get_block_hash_by_height(height), stub_block_hash(height))
+            self.assertEqual(server.connections, 1)
+
+            with self.assertRaises(RpcError) as context:
+                cli.basic_request("getnothing", [])
+            self.assertEqual(context.exception.code, -32601)
+            with self.assertRaises(RpcError) as context:
+                BitcoinClient(server.url, "admin", "wrong", pool=cli.pool).get_latest_block_hash()
+            self.assertEqual(context.exception.code, 401)
+
+    def test_shared_pool_across_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        with RpcStubServer() as server, ConnectionPool(pool_size=4, pool_block=True) as pool:
+            clients = [BitcoinClient(server.url, "admin", "0000", pool=pool) for _ in range(3)]
+            with ThreadPoolExecutor(8) as executor:
+                hashes = list(executor.map(lambda h: clients[h % 3].get_block_hash_by_height(h), range(400)))
+            self.assertEqual(hashes, [stub_block_hash(h) for h in range(400)])
+            self.assertLessEqual(server.connections, 4)
+            self.assertEqual(server.requests, 400)
+
+
+class BatchRequestTest(TestCase):
+    def test_batch(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        with RpcStubServer(tip=300) as server, BitcoinClient(server.url, "admin", "0000") as cli:
+            hashes = cli.get_block_hashes(range(250), chunk_size=100)
+            self.assertEqual(hashes, [stub_block_hash(h) for h in range(250)])
+            self.assertEqual(server.requests, 3)
+
+            headers = cli.get_headers(range(10, 20), verbose=True)
+            self.assertEqual([header["height"] for header in headers], list(range(10, 20)))
+            blocks = cli.get_blocks(range(5))
+            self.assertEqual([block["hash"] for block in blocks], hashes[:5])
+
+            results = cli.batch_request([("getblockcount", []), ("getnothing", []), ("getblockhash", [1])], raise_on_error=False)
+            self.assertEqual(results[0], 300)
+            self.assertIsInstance(results[1], RpcError)
+            self.assertEqual(results[1].method, "getnothing")
+            self.assertEqual(results[2], stub_block_hash(1))
+            with self.assertRaises(RpcError):
+                cli.get_block_hashes([1, 301])
+
+    def test_response_without_id(self):
+        class Response:
+            def json(self):
+                return [{"result": 300, "error": None, "id": 0},
+                        {"result": None, "error": {"code": -32600, "message": "Invalid Request object"}, "id": None}]
+
+        with BitcoinClient("http://127.0.0.1:1", "admin", "0000") as cli:
+            cli._post = lambda url, payload, method_name: Response()
+            results = cli.batch_request([("getblockcount", []), ("getblockhash", [1])], raise_on_error=False)
+            self.assertEqual(results[0], 300)
+            self.assertEqual((results[1].code, results[1].method), (-32600, "getblockhash"))
+            with self.assertRaises(RpcError):
+                cli.batch_request([("getblockcount", []), ("getblockhash", [1])])
+
+
+class CachedClientTest(TestCase):
+    def test_cache(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer, stub_block_hash
+        with RpcStubServer(tip=100) as server, RpcCache(reorg_depth=6) as cache, BitcoinClient(server.url, "admin", "0000", cache=cache) as cli:
+            headers = cli.get_headers(range(90, 100), verbose=True)
+            requests = server.requests
+            self.assertEqual(cli.get_headers(range(90, 100), verbose=True), headers)
+            # hashes of 95 and above are asked again; headers by hash are not
+            self.assertEqual(server.requests, requests + 1)
+            self.assertEqual(cache.stats.memory_hits, 5 + 10)
+
+            self.assertEqual(cli.get_block_hash_by_height(94), stub_block_hash(94))
+            self.assertEqual(cli.get_block_by_height(10, verbose=1), cli.get_block_by_height(10, verbose=1))
+            requests = server.requests
+            for _ in range(3):
+                cli.get_block_by_height(10, verbose=1)
+                cli.get_block_header_by_hash(stub_block_hash(99), True)
+            self.assertEqual(server.requests, requests)
+            self.assertGreater(cache.stats.bytes_served, 0)
+
+            # a null result is cached like any other
+            fetches = list()
+            for _ in range(3):
+                self.assertIsNone(cli._cached("null", lambda: fetches.append(1)))
+            self.assertEqual(len(fetches), 1)
+
+
+class InstrumentedClientTest(TestCase):
+    def test_instrumentation(self):
+        from bitcoinpy.instrumentation import SnapshotExporter
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer
+        exporter = SnapshotExporter()
+        instrumentation = Instrumentation([exporter])
+        with RpcStubServer(tip=100) as server, BitcoinClient(server.url, "admin", "0000", instrumentation=instrumentation) as cli:
+            for height in range(10):
+                cli.get_block_by_height(height)
+            cli.get_block_hashes(range(20))
+            with self.assertRaises(RpcError):
+                cli.get_block_hash_by_height(101)
+            instrumentation.export()
+
+        stats = exporter.last
+        self.assertEqual(stats["getblockhash"]["calls"], 11)
+        self.assertEqual(stats["getblockhash"]["error_kinds"], {"RpcError(-8)": 1})
+        self.assertEqual(stats["getblock"]["calls"], 10)
+        self.assertEqual(stats["batch"]["calls"], 1)
+        self.assertGreater(stats["batch"]["response_bytes"], 20 * 64)
+        self.assertGreater(stats["getblock"]["p99_ms"], 0)
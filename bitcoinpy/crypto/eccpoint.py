@@ -1,4 +1,4 @@
-from field_element import FieldElement
+from bitcoinpy.crypto.field_element import FieldElement
 
 
 class ECCPoint:
@@ -17,3 +17,18 @@ def sha256(s: bytes) -> bytes:
     if not isinstance(s, bytes):
         raise Exception("input must be bytes type")
     return hashlib.sha256(s).digest()
+
+
+_TAG_MIDSTATES = dict()
+
+
+def tagged_hash(tag: str, s: bytes) -> bytes:
+    """ BIP340 sha256(sha256(tag) || sha256(tag) || s); the state after the tag prefix is computed once per tag """
+    midstate = _TAG_MIDSTATES.get(tag)
+    if midstate is None:
+        tag_hash = hashlib.sha256(tag.encode()).digest()
+        midstate = hashlib.sha256(tag_hash + tag_hash)
+        _TAG_MIDSTATES[tag] = midstate
+    h = midstate.copy()
+    h.update(s)
+    return h.digest()
@@ -1,7 +1,9 @@
-from field_element import FieldElement
-from eccpoint import ECCPoint
-from hashes import hash160
-# from backend.btc_module.base.util.base58 import encode_base58_checksum
+from bitcoinpy.crypto.field_element import FieldElement
+from bitcoinpy.crypto.eccpoint import ECCPoint
+from bitcoinpy.crypto.hashes import hash160
+from bitcoinpy.utils.base58 import encode_base58_checksum
+import hashlib
+import hmac
 
 A = 0
 B = 7
@@ -62,6 +64,18 @@ class BitcoinPoint(ECCPoint):
         else:
             return cls(x, odd_beta)
 
+    def verify(self, z: int, sig) -> bool:
+        """ verify ECDSA signature of the message hash z """
+        if not (1 <= sig.r < N and 1 <= sig.s < N):
+            return False
+        s_inv = pow(sig.s, N - 2, N)
+        u = z * s_inv % N
+        v = sig.r * s_inv % N
+        total = u * G + v * self
+        if total.x is None:
+            return False
+        return total.x.num == sig.r
+
     def sec(self, compressed=True):
         '''returns the binary version of the SEC format'''
         if compressed:
@@ -89,3 +103,74 @@ class BitcoinPoint(ECCPoint):
 G = BitcoinPoint(
     0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798,
     0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8)
+
+
+class Signature:
+    def __init__(self, r: int, s: int):
+        self.r = r
+        self.s = s
+
+    def __repr__(self):
+        return 'Signature({:x},{:x})'.format(self.r, self.s)
+
+    def der(self) -> bytes:
+        result = b''
+        for num in (self.r, self.s):
+            num_bytes = num.to_bytes(32, 'big').lstrip(b'\x00')
+            if num_bytes[0] & 0x80:
+                num_bytes = b'\x00' + num_bytes
+            result += bytes([2, len(num_bytes)]) + num_bytes
+        return bytes([0x30, len(result)]) + result
+
+    @classmethod
+    def parse(cls, der: bytes):
+        """ parse DER encoded signature (strictness is not checked) """
+        if len(der) < 8 or der[0] != 0x30 or der[1] + 2 != len(der):
+            raise SyntaxError("Bad signature")
+        if der[2] != 0x02:
+            raise SyntaxError("Bad signature")
+        r_len = der[3]
+        r = int.from_bytes(der[4:4 + r_len], 'big')
+        pos = 4 + r_len
+        if pos + 2 > len(der) or der[pos] != 0x02:
+            raise SyntaxError("Bad signature")
+        s_len = der[pos + 1]
+        s = int.from_bytes(der[pos + 2:pos + 2 + s_len], 'big')
+        if pos + 2 + s_len != len(der):
+            raise SyntaxError("Signature too long")
+        return cls(r, s)
+
+
+class PrivateKey:
+    def __init__(self, secret: int):
+        self.secret = secret
+        self.point = secret * G
+
+    def sign(self, z: int) -> Signature:
+        """ ECDSA with RFC6979 deterministic nonce and low-s """
+        k = self.deterministic_k(z)
+        r = (k * G).x.num
+        k_inv = pow(k, N - 2, N)
+        s = (z + r * self.secret) * k_inv % N
+        if s > N // 2:
+            s = N - s
+        return Signature(r, s)
+
+    def deterministic_k(self, z: int) -> int:
+        k = b'\x00' * 32
+        v = b'\x01' * 32
+        if z > N:
+            z -= N
+        z_bytes = z.to_bytes(32, 'big')
+        secret_bytes = self.secret.to_bytes(32, 'big')
+        k = hmac.new(k, v + b'\x00' + secret_bytes + z_bytes, hashlib.sha256).digest()
+        v = hmac.new(k, v, hashlib.sha256).digest()
+        k = hmac.new(k, v + b'\x01' + secret_bytes + z_bytes, hashlib.sha256).digest()
+        v = hmac.new(k, v, hashlib.sha256).digest()
+        while True:
+            v = hmac.new(k, v, hashlib.sha256).digest()
+            candidate = int.from_bytes(v, 'big')
+            if 1 <= candidate < N:
+                return candidate
+            k = hmac.new(k, v + b'\x00', hashlib.sha256).digest()
+            v = hmac.new(k, v, hashlib.sha256).digest()
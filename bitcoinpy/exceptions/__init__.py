@@ -0,0 +1,7 @@
+class RpcError(Exception):
+    """ error object of a bitcoind JSON-RPC response (or HTTP failure without one) """
+    def __init__(self, code: int, message: str, method: str = None):
+        super().__init__("rpc fails: {} (code: {}, method: {})".format(message, code, method))
+        self.code = code
+        self.message = message
+        self.method = method
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+# import for test below
+from unittest import TestCase
+
+
+# upper bounds (ms) of the latency buckets: 0.01 ms to ~100 s, 25% apart
+BUCKET_BOUNDS = [0.01 * 1.25 ** i for i in range(73)]
+
+
+class LatencyHistogram:
+    """ fixed log-scale buckets: constant memory, percentiles accurate to a bucket (25%) """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms: float):
+        self.counts[bisect_left(BUCKET_BOUNDS, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, p: float) -> float:
+        """ upper bound of the bucket of the p-quantile, capped by the maximum seen """
+        if self.count == 0:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKET_BOUNDS[i], self.max_ms) if i < len(BUCKET_BOUNDS) else self.max_ms
+        return self.max_ms
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency = LatencyHistogram()
+        # error class name or RPC error code -> count
+        self.error_kinds = dict()
+
+    def snapshot(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors, "request_bytes": self.request_bytes, "response_bytes": self.response_bytes,
+                "mean_ms": self.latency.total_ms / self.calls if self.calls else 0.0, "p50_ms": self.latency.percentile(0.5),
+                "p95_ms": self.latency.percentile(0.95), "p99_ms": self.latency.percentile(0.99), "max_ms": self.latency.max_ms,
+                "error_kinds": dict(self.error_kinds)}
+
+
+class SnapshotExporter:
+    """ keeps the latest exported snapshot in memory """
+    def __init__(self):
+        self.last = dict()
+
+    def __call__(self, snapshot: dict):
+        self.last = snapshot
+
+
+class CallbackExporter:
+    def __init__(self, callback: Callable):
+        self.callback = callback
+
+    def __call__(self, snapshot: dict):
+        self.callback(snapshot)
+
+
+class LoggingExporter:
+    """ one log line per method """
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logging.getLogger("bitcoinpy.rpc") if logger is None else logger
+        self.level = level
+
+    def __call__(self, snapshot: dict):
+        for method, stats in sorted(snapshot.items()):
+            self.logger.log(self.level, "rpc %s calls=%d errors=%d p50=%.2fms p95=%.2fms p99=%.2fms req=%dB resp=%dB",
+                            method, stats["calls"], stats["errors"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"],
+                            stats["request_bytes"], stats["response_bytes"])
+
+
+class Instrumentation:
+    """
+    Per-method call counts, latency histograms, payload bytes and errors of RPC requests.
+    Exporters are callables taking snapshot(); export() runs them, and so does record() every export_interval seconds.
+    """
+    def __init__(self, exporters: list = None, export_interval: float = None):
+        self.exporters = list() if exporters is None else exporters
+        self.export_interval = export_interval
+        self.methods = dict()
+        self._lock = threading.Lock()
+        self._last_export = time.monotonic()
+
+    def record(self, method: str, elapsed_ms: float, request_bytes: int, response_bytes: int, error: Exception = None):
+        with self._lock:
+            stats = self.methods.get(method)
+            if stats is None:
+                stats = self.methods[method] = MethodStats()
+            stats.calls += 1
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.latency.add(elapsed_ms)
+            if error is not None:
+                stats.errors += 1
+                kind = getattr(error, "code", None)
+                kind = type(error).__name__ if kind is None else "{}({})".format(type(error).__name__, kind)
+                stats.error_kinds[kind] = stats.error_kinds.get(kind, 0) + 1
+            due = self.export_interval is not None and time.monotonic() - self._last_export >= self.export_interval
+        if due:
+            self.export()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {method: stats.snapshot() for method, stats in self.methods.items()}
+
+    def export(self):
+        self._last_export = time.monotonic()
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            exporter(snapshot)
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+
+
+class InstrumentationTest(TestCase):
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 101):
+            histogram.add(float(i))
+        # within a bucket (25%) of the exact values
+        self.assertLessEqual(abs(histogram.percentile(0.5) - 50) / 50, 0.25)
+        self.assertLessEqual(abs(histogram.percentile(0.95) - 95) / 95, 0.25)
+        self.assertEqual(histogram.percentile(1.0), 100.0)
+        self.assertEqual(LatencyHistogram().percentile(0.5), 0.0)
+
+    def test_record_and_export(self):
+        from bitcoinpy.exceptions import RpcError
+        snapshots, memory = list(), SnapshotExporter()
+        instrumentation = Instrumentation([memory, CallbackExporter(snapshots.append)])
+        instrumentation.record("getblock", 2.0, 100, 1000)
+        instrumentation.record("getblock", 4.0, 100, 3000)
+        instrumentation.record("getblockhash", 1.0, 50, 0, RpcError(-8, "Block height out of range"))
+        instrumentation.export()
+        self.assertEqual(memory.last, snapshots[0])
+        self.assertEqual(memory.last["getblock"]["calls"], 2)
+        self.assertEqual(memory.last["getblock"]["response_bytes"], 4000)
+        self.assertEqual(memory.last["getblockhash"]["error_kinds"], {"RpcError(-8)": 1})
+
+        with self.assertLogs("bitcoinpy.rpc") as logs:
+            LoggingExporter()(instrumentation.snapshot())
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("rpc getblock calls=2 errors=0", logs.output[0])
@@ -0,0 +1,187 @@
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from queue import Queue
+from typing import Callable, Iterator
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.client import BitcoinClient
+
+# import for test below
+from unittest import TestCase
+
+
+def parse_block(raw_block: bytes, height: int) -> Block:
+    return Block.from_raw(raw_block, height)
+
+
+def _parse_batch(transform: Callable, raw_blocks: list, start_height: int) -> tuple:
+    """ runs in a worker process: return (results, seconds spent) """
+    start = time.perf_counter()
+    results = [transform(raw_block, height) for height, raw_block in enumerate(raw_blocks, start_height)]
+    return results, time.perf_counter() - start
+
+
+class PipelineStats:
+    """ seconds summed over the workers of each stage; wait is the time the consumer was blocked on the pipeline """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blocks = 0
+        self.bytes = 0
+        self.fetch = 0.0
+        self.parse = 0.0
+        self.wait = 0.0
+        self.consume = 0.0
+        self.elapsed = 0.0
+
+    def add(self, **seconds):
+        with self.lock:
+            for stage, value in seconds.items():
+                setattr(self, stage, getattr(self, stage) + value)
+
+    @property
+    def blocks_per_sec(self) -> float:
+        return self.blocks / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return "PipelineStats(blocks={}, bytes={}, fetch={:.3f}s, parse={:.3f}s, wait={:.3f}s, consume={:.3f}s, elapsed={:.3f}s)".format(
+            self.blocks, self.bytes, self.fetch, self.parse, self.wait, self.consume, self.elapsed)
+
+
+class BlockPipeline:
+    """
+    Prefetching block iterator: fetch threads download raw blocks in batches (getblock verbosity 0),
+    a process pool parses them, and blocks are yielded in height order while the next batches are in flight.
+    At most max_pending batches are fetched or parsed ahead of the consumer, which bounds memory.
+    transform(raw_block, height) runs in the workers and must be picklable (a module-level function);
+    its results are pickled back, so a transform returning less than a Block pays less.
+    """
+    def __init__(self, client: BitcoinClient, batch_size: int = 16, fetch_workers: int = 2, parse_workers: int = None,
+                 max_pending: int = 8, transform: Callable = parse_block):
+        """ parse_workers: process count (os.cpu_count() if None); 0 parses in the fetch threads """
+        self.client = client
+        self.batch_size = batch_size
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.max_pending = max_pending
+        self.transform = transform
+        self.stats = PipelineStats()
+
+    def _fetch(self, claim: Callable, window: threading.Semaphore, stop: threading.Event, results: Queue, executor):
+        while not stop.is_set():
+            # backpressure: wait for the consumer to take a batch
+            if not window.acquire(timeout=0.1):
+                continue
+            batch_start, batch_end = claim()
+            if batch_start is None:
+                window.release()
+                return
+            future = Future()
+            try:
+                start = time.perf_counter()
+                raw_blocks = [bytes.fromhex(raw) for raw in self.client.get_blocks(range(batch_start, batch_end), verbose=0)]
+                self.stats.add(fetch=time.perf_counter() - start, bytes=sum(len(raw) for raw in raw_blocks))
+                if executor is None:
+                    future.set_result(_parse_batch(self.transform, raw_blocks, batch_start))
+                else:
+                    future = executor.submit(_parse_batch, self.transform, raw_blocks, batch_start)
+            except Exception as e:
+                future.set_exception(e)
+            results.put((batch_start, future))
+
+    def iter_blocks(self, start: int, end: int) -> Iterator:
+        """ yield transform results (Blocks by default) of heights [start, end) in order """
+        self.stats = PipelineStats()
+        begin = time.perf_counter()
+        executor = None if self.parse_workers == 0 else ProcessPoolExecutor(self.parse_workers)
+        window = threading.Semaphore(self.max_pending)
+        stop = threading.Event()
+        results = Queue()
+        claim_lock = threading.Lock()
+        next_claim = [start]
+
+        def claim() -> tuple:
+            with claim_lock:
+                batch_start = next_claim[0]
+                if batch_start >= end:
+                    return None, None
+                next_claim[0] = min(batch_start + self.batch_size, end)
+                return batch_start, next_claim[0]
+
+        threads = [threading.Thread(target=self._fetch, args=(claim, window, stop, results, executor), daemon=True)
+                   for _ in range(self.fetch_workers)]
+        for thread in threads:
+            thread.start()
+
+        # batches complete out of order; they are held here until their turn
+        ready = dict()
+        try:
+            for batch_start in range(start, end, self.batch_size):
+                waited = time.perf_counter()
+                while batch_start not in ready:
+                    finished_start, future = results.get()
+                    ready[finished_start] = future
+                batch, parse_seconds = ready.pop(batch_start).result()
+                window.release()
+                self.stats.add(wait=time.perf_counter() - waited, parse=parse_seconds)
+
+                for result in batch:
+                    consumed = time.perf_counter()
+                    yield result
+                    self.stats.add(consume=time.perf_counter() - consumed, blocks=1)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            self.stats.elapsed = time.perf_counter() - begin
+
+
+def iter_blocks(client: BitcoinClient, start: int, end: int, **kwargs) -> Iterator:
+    """ shortcut of BlockPipeline(client, **kwargs).iter_blocks(start, end) """
+    return BlockPipeline(client, **kwargs).iter_blocks(start, end)
+
+
+def _tx_count(raw_block: bytes, height: int) -> tuple:
+    return height, len(Block.from_raw(raw_block, height).transactions)
+
+
+class BlockPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from bitcoinpy.test_data.synthetic import build_chain
+        cls.raw_blocks = build_chain(30, 5)
+
+    def test_ordered_blocks(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer
+        with RpcStubServer(raw_blocks=self.raw_blocks) as server, BitcoinClient(server.url, "admin", "0000") as cli:
+            for parse_workers in [0, 2]:
+                pipeline = BlockPipeline(cli, batch_size=4, fetch_workers=3, parse_workers=parse_workers, max_pending=2)
+                blocks = list(pipeline.iter_blocks(3, 29))
+                self.assertEqual([block.height for block in blocks], list(range(3, 29)))
+                self.assertEqual([block.hash.bytes_as_be.hex() for block in blocks], server.chain.hashes[3:29])
+                self.assertEqual(pipeline.stats.blocks, 26)
+                self.assertEqual(pipeline.stats.bytes, sum(len(raw) for raw in self.raw_blocks[3:29]))
+                self.assertGreater(pipeline.stats.fetch, 0)
+
+            counts = list(iter_blocks(cli, 0, 30, batch_size=7, parse_workers=2, transform=_tx_count))
+            self.assertEqual(counts, [(height, 5) for height in range(30)])
+
+    def test_early_exit_and_error(self):
+        from bitcoinpy.exceptions import RpcError
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer
+        with RpcStubServer(raw_blocks=self.raw_blocks) as server, BitcoinClient(server.url, "admin", "0000") as cli:
+            pipeline = BlockPipeline(cli, batch_size=2, parse_workers=0, max_pending=3)
+            iterator = pipeline.iter_blocks(0, 30)
+            self.assertEqual(next(iterator).height, 0)
+            iterator.close()
+            # fetching stops at the window: the batch being consumed plus max_pending ahead
+            self.assertLessEqual(pipeline.stats.bytes, sum(len(raw) for raw in self.raw_blocks[:8]))
+
+            # heights beyond the tip fail in order, after the blocks before them
+            heights = list()
+            with self.assertRaises(RpcError):
+                for block in BlockPipeline(cli, batch_size=4, parse_workers=0).iter_blocks(20, 40):
+                    heights.append(block.height)
+            self.assertEqual(heights, list(range(20, 28)))
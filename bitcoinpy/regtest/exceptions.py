@@ -39,4 +39,28 @@ class InvalidParameterType(Exception):
 
 
 class NoCoinbase(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+# bitcoind RPC error codes (rpc/protocol.h)
+RPC_ERROR_TYPES = {
+    -3: InvalidParameterType,   # RPC_TYPE_ERROR
+    -8: InvalidParameter,       # RPC_INVALID_PARAMETER
+    -18: WalletNotFounded,      # RPC_WALLET_NOT_FOUND
+    -19: WalletNotLoaded,       # RPC_WALLET_NOT_SPECIFIED
+    -28: RegtestNodeNotRunning,  # RPC_IN_WARMUP
+    -35: WalletAlreadyLoaded,   # RPC_WALLET_ALREADY_LOADED
+}
+
+
+def rpc_exception(code: int, message: str) -> Exception:
+    """ typed exception of a bitcoind error; code and message are kept as attributes """
+    if code == -4 and "already exists" in message:
+        # RPC_WALLET_ERROR of createwallet
+        exception_type = WalletAlreadyExist
+    else:
+        exception_type = RPC_ERROR_TYPES.get(code, UnknownException)
+    exception = exception_type("{} (code: {})".format(message, code))
+    exception.code = code
+    exception.message = message
+    return exception
@@ -2,13 +2,49 @@ import json
 import subprocess
 import time
 from typing import Union
-from decimal import Decimal, getcontext
 
+import requests
+
+from bitcoinpy.base.amount import BTCAmount
+from bitcoinpy.base.coin_selection import UtxoTable, select_coins
+from bitcoinpy.client import BasicClient, ConnectionPool
+from bitcoinpy.exceptions import RpcError
 from .exceptions import *
 
+# import for test below
+from unittest import TestCase
+
+
+def _cli_arg(param) -> str:
+    """ bitcoin-cli takes strings as they are and json for the others """
+    return param if isinstance(param, str) else json.dumps(param)
+
+
+def parse_cli_output(output: str):
+    """ result of bitcoin-cli output: json, or a plain string (addresses, hashes); errors raise typed exceptions """
+    if output.startswith("error code:"):
+        # error code: <code>\nerror message:\n<message>
+        lines = output.split("\n")
+        code = int(lines[0][len("error code:"):])
+        message = "\n".join(lines[2:]) if len(lines) > 2 else ""
+        raise rpc_exception(code, message)
+    if output.startswith("error"):
+        if "connect" in output or "timeout on transient error" in output:
+            raise RegtestNodeNotRunning(output)
+        raise UnknownException(output)
+    try:
+        return json.loads(output)
+    except ValueError:
+        return output
+
 
 class TestBase:
-    def __init__(self, src_path: str, rpc_port: int = 18443, rpc_user: str = "admin", rpc_password: str = "0000"):
+    def __init__(self, src_path: str, rpc_port: int = 18443, rpc_user: str = "admin", rpc_password: str = "0000",
+                 use_cli: bool = False, pool: ConnectionPool = None):
+        """
+        requests go over JSON-RPC through a pooled connection (BasicClient);
+        use_cli: fork bitcoin-cli for every request instead, as before
+        """
         # remove last "/"
         src_path = src_path if src_path.endswith("/") else src_path + "/"
         self.bitcoind_path = src_path + "bitcoind"
@@ -18,6 +54,19 @@ class TestBase:
         self.rpc_user = rpc_user
         self.rpc_pwd = rpc_password
 
+        self.use_cli = use_cli
+        self.client = BasicClient("http://127.0.0.1:{}".format(rpc_port), rpc_user, rpc_password, pool=pool, timeout=(1, 300))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ close the connection pool unless it was passed in (shared) """
+        self.client.close()
+
     @property
     def basic_cmd(self) -> list:
         cmd = list()
@@ -27,7 +76,20 @@ class TestBase:
         cmd.append("-regtest")
         return cmd
 
+    def request(self, method: str, params: list = None):
+        """ send a request and return its result; bitcoind errors raise the types of regtest/exceptions.py """
+        params = list() if params is None else params
+        if self.use_cli:
+            return parse_cli_output(self.build_and_request(method, [_cli_arg(param) for param in params]))
+        try:
+            return self.client.basic_request(method, params)
+        except RpcError as e:
+            raise rpc_exception(e.code, e.message) from e
+        except requests.ConnectionError as e:
+            raise RegtestNodeNotRunning(str(e)) from e
+
     def build_and_request(self, method: str, params: list = None) -> str:
+        """ bitcoin-cli path: params as cli arguments; return the output """
         cmd = list()
         cmd.append(self.cli_path)
         cmd += self.basic_cmd
@@ -55,6 +117,7 @@ class TestBase:
 
         fd_err.close()
         fd_stdout.close()
+        pipe.wait()
 
         # return non-empty message
         if err == b'':
@@ -63,42 +126,29 @@ class TestBase:
             return err.decode('utf-8')
 
     def generate_block(self, blocks: int, address: str):
-        resp = self.build_and_request("generatetoaddress", [str(blocks), address])
         # block hashes
-        return json.loads(resp)
+        return self.request("generatetoaddress", [blocks, address])
 
     """ create wallet and generate "coinbase" address of the wallet """
     def create_wallet(self, wallet_name):
-        # request "createwallet"
-        resp = self.build_and_request("createwallet", [wallet_name])
-
-        # check that the request was successed
-        success = False
         try:
-            resp_dict = json.loads(resp)
-            if "name" in resp_dict and "warning" in resp_dict:
-                success = True
-        except json.JSONDecodeError as e:
-            if resp.startswith("error code: -4"):
-                success = True
-            else:
-                success = False
-
-        if success:
-            return self.setup_coinbase()
-        else:
-            return None
+            self.request("createwallet", [wallet_name])
+        except WalletAlreadyExist:
+            pass
+        return self.setup_coinbase()
 
     def unload_wallet(self, wallet_name: str):
-        resp = self.build_and_request("unloadwallet", [wallet_name])
-        if resp.startswith("error code: -18"):
+        try:
+            self.request("unloadwallet", [wallet_name])
+        except WalletNotFounded:
             return False  # the wallet is not loaded
         return True
 
     def load_wallet(self, wallet_name: str):
-        resp = self.build_and_request("loadwallet", [wallet_name])
-        if resp.startswith("error code: -18"):
-            raise WalletNotFounded
+        try:
+            self.request("loadwallet", [wallet_name])
+        except WalletAlreadyLoaded:
+            pass
 
         # unload all wallet except to target wallet
         loaded_wallets = self.loaded_wallet_list()
@@ -110,15 +160,10 @@ class TestBase:
         return self.setup_coinbase()
 
     def loaded_wallet_list(self):
-        resp = self.build_and_request("listwallets")
-
-        resp_list = json.loads(resp)
-        return resp_list
+        return self.request("listwallets")
 
     def list_wallet_dir(self):
-        resp = self.build_and_request("listwalletdir")
-
-        resp_dict = json.loads(resp)
+        resp_dict = self.request("listwalletdir")
         wallet_list = [wallets["name"] for wallets in resp_dict["wallets"]]
         return wallet_list
 
@@ -126,101 +171,77 @@ class TestBase:
         if address_type not in ["legacy", "p2sh-segwit", "bech32"]:
             raise InvalidAddressType
 
-        return self.build_and_request("getnewaddress", [label, address_type])  # new address
+        return self.request("getnewaddress", [label, address_type])  # new address
 
     def get_address_by_label(self, label: str):
-        resp = self.build_and_request("getaddressesbylabel", [label])
-
-        if resp.startswith("error code: -11"):
-            return list()
-        else:
-            return json.loads(resp)
+        try:
+            return self.request("getaddressesbylabel", [label])
+        except UnknownException as e:
+            if getattr(e, "code", None) == -11:  # RPC_WALLET_INVALID_LABEL_NAME: no such label
+                return dict()
+            raise
 
     def address_list(self):
-        resp = self.build_and_request("listaddressgroupings")
-        return json.loads(resp)
+        return self.request("listaddressgroupings")
 
     def get_balances_each(self):
-        resp = self.build_and_request("getbalances")
-        return json.loads(resp)
+        return self.request("getbalances")
 
     def get_balance(self):
-        resp = self.build_and_request("getbalance")
-        return json.loads(resp)
+        return self.request("getbalance")
 
     def get_utxo(self, minconf: int = 6, min_amount: float = 1.0):
         if minconf < 1:
             raise InvalidParameter
 
-        opt_str = json.dumps({
-            "minimumAmount": str(min_amount)
-        })
-
-        resp = self.build_and_request("listunspent", [str(minconf), str(9999999), str([]), "false", opt_str])
-        # resp = self.build_and_request("listunspent", [str(minconf), str(9999999)])
-        return json.loads(resp)
+        return self.request("listunspent", [minconf, 9999999, [], False, {"minimumAmount": str(min_amount)}])
 
     def get_address_info(self, address: str):
-        resp = self.build_and_request("getaddressinfo", [address])
-        # TODO error handling?
-        return json.loads(resp)
+        return self.request("getaddressinfo", [address])
 
     def send_to(self, _to: str, amount: Union[float, int]):
-        getcontext().prec = 8
-        if isinstance(amount, float):
-            btc = Decimal(amount) * Decimal(1)
-        elif isinstance(amount, int):
-            btc = Decimal(amount) * Decimal(0.00000001)
-        else:
+        # float: btc, int: satoshi
+        if not isinstance(amount, (float, int)):
             raise InvalidParameterType
 
         params = list()
         params.append(_to)
-        params.append(str(btc))
+        params.append(str(BTCAmount(amount)))
 
         # tx_id
-        return self.build_and_request("sendtoaddress", params)
+        return self.request("sendtoaddress", params)
 
     def get_transaction_with_txid_and_blockhash(self, tx_id: str, block_hash: str) -> dict:
-        resp = self.build_and_request("getrawtransaction", [tx_id, "true", block_hash])
-        return json.loads(resp)
+        return self.request("getrawtransaction", [tx_id, True, block_hash])
 
     def test_mempool_accept(self, rawtx: str, maxfeerate: int = 1000):
-        param = json.dumps([rawtx])
-        resp = self.build_and_request("testmempoolaccept", [param, str(maxfeerate)])
-
-        resp_list = json.loads(resp)
+        resp_list = self.request("testmempoolaccept", [[rawtx], maxfeerate])
         return resp_list[0]
 
+    def get_raw_change_address(self, address_type: str = "bech32"):
+        return self.request("getrawchangeaddress", [address_type])
+
     def decode_raw_transaction(self, serialized_raw_tx: str):
-        resp = self.build_and_request("decoderawtransaction", [serialized_raw_tx])
-        return json.loads(resp)
+        return self.request("decoderawtransaction", [serialized_raw_tx])
 
     def signrawtransactionwithwallet(self, hexstring: str):
-        resp = self.build_and_request("signrawtransactionwithwallet", [hexstring])
-        return json.loads(resp)
+        return self.request("signrawtransactionwithwallet", [hexstring])
 
     def get_block_count(self):
-        resp = self.build_and_request("getblockcount")
-        return json.loads(resp)
+        return self.request("getblockcount")
 
     def create_raw_transaction(self, inputs: list, outputs: list):
-        input_str = json.dumps(inputs)
-        out_str = json.dumps(outputs)
-
-        return self.build_and_request("createrawtransaction", [input_str, out_str])
+        return self.request("createrawtransaction", [inputs, outputs])
 
     def sign_raw_transaction_with_wallet(self, tx_hex: str):
-        resp = self.build_and_request("signrawtransactionwithwallet", [tx_hex])
-
-        resp_json = json.loads(resp)
+        resp_json = self.request("signrawtransactionwithwallet", [tx_hex])
         assert resp_json["complete"]
         assert "errors" not in resp_json
 
         return resp_json
 
     def send_raw_transaction(self, tx_hex: str):
-        return self.build_and_request("sendrawtransaction", [tx_hex, "0"])
+        return self.request("sendrawtransaction", [tx_hex, 0])
 
 
 class TestNode(TestBase):
@@ -228,16 +249,9 @@ class TestNode(TestBase):
     @ MUST enter directory path including binaries, bitcoind and bitcoin-cli.
     @ the others are optional
     """
-    def __init__(self, src_path: str, rpc_port: int = 18443, rpc_user: str = "admin", rpc_password: str = "0000"):
-        # remove last "/"
-        src_path = src_path if src_path.endswith("/") else src_path + "/"
-        self.bitcoind_path = src_path + "bitcoind"
-        self.cli_path = src_path + "bitcoin-cli"
-
-        self.rpc_port = rpc_port
-        self.rpc_user = rpc_user
-        self.rpc_pwd = rpc_password
-
+    def __init__(self, src_path: str, rpc_port: int = 18443, rpc_user: str = "admin", rpc_password: str = "0000",
+                 use_cli: bool = False, pool: ConnectionPool = None):
+        super().__init__(src_path, rpc_port, rpc_user, rpc_password, use_cli, pool)
         self.coinbase_addr = None
 
     def up(self, reload: bool = False, retry: int = 3, retry_sleep: float = 0.5) -> str:
@@ -248,21 +262,32 @@ class TestNode(TestBase):
         cmd.append("-daemon")
 
         msg = TestNode._execute(cmd)
-        time.sleep(1)
         if msg.startswith("Error"):
             if reload:
                 self.shutdown(retry, retry_sleep)
-                self.up(reload)
+                return self.up(reload)
             else:
                 raise RegtestAlreadyRunning
 
+        self.wait_ready()
         return self.setup_wallet("default")
 
+    def wait_ready(self, timeout: float = 10.0, poll: float = 0.1):
+        """ wait until the node answers (not starting nor warming up) """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.get_block_count()
+            except RegtestNodeNotRunning:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(poll)
+
     def shutdown(self, retry: int, retry_sleep: float) -> bool:
         success = False
         for i in range(retry):
             try:
-                resp = self.build_and_request("stop")
+                resp = self.request("stop")
             except RegtestNodeNotRunning:
                 time.sleep(retry_sleep)
                 continue
@@ -307,24 +332,75 @@ class TestNode(TestBase):
         return result
 
     # do not use. it is not tested
-    def custuomized_send_to(self, _to: str, amount: Union[float, int]):
-        getcontext().prec = 8
-        if isinstance(amount, float):
-            btc = Decimal(amount) * Decimal(1)
-        elif isinstance(amount, int):
-            btc = Decimal(amount) * Decimal(0.00000001)
-        else:
+    def custuomized_send_to(self, _to: str, amount: Union[float, int], fee_rate: float = 1):
+        """ amount in btc (float) or satoshi (int); fee_rate in sat/vB """
+        if not isinstance(amount, (float, int)):
             raise InvalidParameterType
+        target = BTCAmount(amount)
 
-        resp = self.get_utxo(1, min_amount=10.0)
+        resp = self.get_utxo(1, min_amount=0)
         if len(resp) == 0:
             raise Exception("There is no utxo")
 
-        utxo = resp[-1]
-
-        unspent_input = {
-            "txid": utxo["txid"],
-            "vout": utxo["vout"],
-        }
-
-        return self.send_new_transaction([unspent_input], [{_to: str(btc)}])
+        table = UtxoTable.from_listunspent(resp)
+        selection = select_coins(table, target, fee_rate)
+        if selection is None:
+            raise Exception("Insufficient funds: {} for {}".format(table.total, target))
+
+        inputs = [{"txid": txid, "vout": vout} for txid, vout in table.outpoints(selection.indices)]
+        outputs = [{_to: str(target)}]
+        if selection.change is not None:
+            outputs.append({self.get_raw_change_address(): str(selection.change)})
+        return self.send_new_transaction(inputs, outputs)
+
+
+class TestNodeRpcTest(TestCase):
+    def test_direct_rpc(self):
+        from bitcoinpy.test_data.fake_bitcoind import ChainData, FakeBitcoind
+        with FakeBitcoind(ChainData.made_up(10)) as server, TestNode("/nonexistent", server.server_address[1]) as node:
+            self.assertEqual(node.get_block_count(), 10)
+            self.assertEqual(node.wait_ready(), 10)
+            # one keep-alive connection instead of a process per call
+            self.assertEqual(server.connections, 1)
+            with self.assertRaises(InvalidParameter) as context:
+                node.request("getblockhash", [11])
+            self.assertEqual(context.exception.code, -8)
+            with self.assertRaises(UnknownException):
+                node.request("getnothing")
+
+        import socket
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with self.assertRaises(RegtestNodeNotRunning):
+            with TestNode("/nonexistent", port) as node:
+                node.get_block_count()
+
+    def test_close(self):
+        from bitcoinpy.client import ConnectionPool
+        from bitcoinpy.test_data.fake_bitcoind import ChainData, FakeBitcoind
+        with FakeBitcoind(ChainData.made_up(10)) as server:
+            with TestNode("/nonexistent", server.server_address[1]) as node:
+                node.get_block_count()
+                self.assertEqual(len(node.client.pool._sessions), 1)
+            self.assertEqual(node.client.pool._sessions, [])
+
+            # a shared pool stays open for its other users
+            with ConnectionPool() as pool:
+                with TestNode("/nonexistent", server.server_address[1], pool=pool) as node:
+                    node.get_block_count()
+                self.assertEqual(len(pool._sessions), 1)
+                self.assertEqual(TestNode("/nonexistent", server.server_address[1], pool=pool).get_block_count(), 10)
+
+    def test_cli_output(self):
+        self.assertEqual(parse_cli_output("101"), 101)
+        self.assertEqual(parse_cli_output("bcrt1qsn9rrqturgndtprum52j40qjqq2rjtex8quamf"), "bcrt1qsn9rrqturgndtprum52j40qjqq2rjtex8quamf")
+        self.assertEqual(parse_cli_output('{\n  "name": "default"\n}'), {"name": "default"})
+        with self.assertRaises(WalletNotFounded) as context:
+            parse_cli_output("error code: -18\nerror message:\nRequested wallet does not exist or is not loaded")
+        self.assertEqual(context.exception.message, "Requested wallet does not exist or is not loaded")
+        with self.assertRaises(WalletAlreadyExist):
+            parse_cli_output("error code: -4\nerror message:\nWallet file verification failed. Database already exists.")
+        with self.assertRaises(RegtestNodeNotRunning):
+            parse_cli_output("error: Could not connect to the server 127.0.0.1:18443")
+        self.assertEqual([_cli_arg(param) for param in ["a", 5, True, [{"txid": "00"}]]], ["a", "5", "true", '[{"txid": "00"}]'])
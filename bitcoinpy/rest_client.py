@@ -0,0 +1,159 @@
+from collections import namedtuple
+from io import BytesIO
+from typing import Iterator, Union
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.header import Header
+from bitcoinpy.base.transaction import Transaction, TxOut
+from bitcoinpy.client import ConnectionPool
+from bitcoinpy.exceptions import RpcError
+from bitcoinpy.utils.varint import read_varint
+
+# import for test below
+from unittest import TestCase
+
+
+# bitcoind rejects getutxos requests of more outpoints
+MAX_GETUTXOS_OUTPOINTS = 15
+
+# coins: per requested outpoint, (height, TxOut) if unspent or None
+UtxosResult = namedtuple("UtxosResult", ["chain_height", "tip_hash", "coins"])
+
+
+def parse_getutxos(data: bytes, count: int) -> UtxosResult:
+    """
+    binary getutxos response of count outpoints: int32 chain height, 32-byte tip hash (little endian),
+    bitmap of the unspent outpoints (varint length), then the CCoins of the set bits:
+    uint32 (unused tx version), uint32 height and the TxOut
+    """
+    s = BytesIO(data)
+    chain_height = int.from_bytes(s.read(4), "little", signed=True)
+    tip_hash = s.read(32)[::-1].hex()
+    bitmap = s.read(read_varint(s))
+    coin_count = read_varint(s)
+    coins = list()
+    for i in range(count):
+        if bitmap[i // 8] >> (i % 8) & 1:
+            s.read(4)
+            height = int.from_bytes(s.read(4), "little")
+            coins.append((height, TxOut.parse(s)))
+        else:
+            coins.append(None)
+    if coin_count != sum(coin is not None for coin in coins):
+        raise Exception("Expected {} coins in the bitmap, but {}".format(coin_count, sum(coin is not None for coin in coins)))
+    return UtxosResult(chain_height, tip_hash, coins)
+
+
+class RestClient:
+    """
+    Binary endpoints of bitcoind's REST interface (-rest): raw bytes instead of hex in JSON, no authentication.
+    Responses are parsed from the bytes directly (Header.parse_from_bytes_io, Transaction.parse_from_bytes_io).
+    """
+    def __init__(self, url: str, pool: ConnectionPool = None, timeout: Union[float, tuple] = (5, 60)):
+        self.rest_url = url + "/rest/"
+        self._own_pool = pool is None
+        self.pool = ConnectionPool() if pool is None else pool
+        self.timeout = timeout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._own_pool:
+            self.pool.close()
+
+    def _get(self, path: str) -> bytes:
+        """ non-200 responses raise RpcError with the HTTP status as code """
+        resp = self.pool.session().get(self.rest_url + path, timeout=self.timeout)
+        if resp.status_code != 200:
+            raise RpcError(resp.status_code, resp.text.strip() or resp.reason, "rest/" + path.split("/")[0])
+        return resp.content
+
+    def get_raw_block(self, block_hash: str) -> bytes:
+        return self._get("block/{}.bin".format(block_hash))
+
+    def get_block(self, block_hash: str, height: int = 0) -> Block:
+        return Block.from_raw(self.get_raw_block(block_hash), height)
+
+    def iter_block_transactions(self, block_hash: str) -> Iterator[Transaction]:
+        return Block.iter_raw_transactions(self.get_raw_block(block_hash))
+
+    def get_raw_headers(self, block_hash: str, count: int) -> bytes:
+        """ up to count serialized headers from block_hash on, along the active chain """
+        return self._get("headers/{}/{}.bin".format(count, block_hash))
+
+    def get_headers(self, block_hash: str, count: int, start_height: int = 0) -> list:
+        """ start_height: height of block_hash, if known """
+        raw = self.get_raw_headers(block_hash, count)
+        s = BytesIO(raw)
+        return [Header.parse_from_bytes_io(s, height) for height in range(start_height, start_height + len(raw) // 80)]
+
+    def get_block_hash_by_height(self, height: int) -> str:
+        return self._get("blockhashbyheight/{}.bin".format(height))[::-1].hex()
+
+    def get_block_by_height(self, height: int) -> Block:
+        return self.get_block(self.get_block_hash_by_height(height), height)
+
+    def get_utxos(self, outpoints: list, check_mempool: bool = False) -> UtxosResult:
+        """ outpoints: (tx_id hex, vout); more than MAX_GETUTXOS_OUTPOINTS are sent in several requests """
+        prefix = "getutxos/checkmempool/" if check_mempool else "getutxos/"
+        result = None
+        for start in range(0, len(outpoints), MAX_GETUTXOS_OUTPOINTS):
+            chunk = outpoints[start:start + MAX_GETUTXOS_OUTPOINTS]
+            path = prefix + "/".join("{}-{}".format(tx_id, vout) for tx_id, vout in chunk) + ".bin"
+            chunk_result = parse_getutxos(self._get(path), len(chunk))
+            if result is None:
+                result = chunk_result
+            else:
+                # the tip of the latest request
+                result = UtxosResult(chunk_result.chain_height, chunk_result.tip_hash, result.coins + chunk_result.coins)
+        return result if result is not None else UtxosResult(None, None, [])
+
+
+class RestClientTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from bitcoinpy.base.transaction import TxIn
+        from bitcoinpy.test_data.synthetic import build_chain, build_raw_block, coinbase_tx, p2wpkh_script
+        cls.raw_blocks = build_chain(10, 5)
+        # block 10 spends the coinbase of block 0
+        cls.cb0 = next(Block.iter_raw_transactions(cls.raw_blocks[0]))
+        cls.spend = Transaction([TxIn(cls.cb0.tx_id, 0)], [TxOut(10 ** 8, p2wpkh_script(b"\x01" * 20)), TxOut(2, p2wpkh_script(b"\x02" * 20))], 2, 0)
+        prev_hash = Header.parse_from_bytes_io(BytesIO(cls.raw_blocks[-1][:80])).hash.bytes_as_be
+        cls.raw_blocks.append(build_raw_block([coinbase_tx(10), cls.spend], prev_hash))
+
+    def test_blocks_and_headers(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer
+        with RpcStubServer(raw_blocks=self.raw_blocks) as server, RestClient(server.url) as rest:
+            block_hash = rest.get_block_hash_by_height(3)
+            self.assertEqual(block_hash, server.chain.hashes[3])
+            block = rest.get_block_by_height(3)
+            self.assertEqual(block.height, 3)
+            self.assertEqual(len(block.transactions), 5)
+            self.assertEqual([tx.tx_id for tx in rest.iter_block_transactions(block_hash)], [tx.tx_id for tx in block.transactions])
+
+            headers = rest.get_headers(block_hash, 20, start_height=3)
+            self.assertEqual([header.height for header in headers], list(range(3, 11)))
+            self.assertEqual([header.hash.bytes_as_be.hex() for header in headers], server.chain.hashes[3:])
+
+            with self.assertRaises(RpcError) as context:
+                rest.get_raw_block("00" * 32)
+            self.assertEqual(context.exception.code, 404)
+
+    def test_get_utxos(self):
+        from bitcoinpy.test_data.rpc_stub import RpcStubServer
+        with RpcStubServer(raw_blocks=self.raw_blocks) as server, RestClient(server.url) as rest:
+            spend_id = self.spend.tx_id.hex()
+            outpoints = [(self.cb0.tx_id.hex(), 0), (spend_id, 1), (spend_id, 2)] + [(spend_id, 0)] * 15
+            result = rest.get_utxos(outpoints)
+            self.assertEqual(result.chain_height, 10)
+            self.assertEqual(result.tip_hash, server.chain.hashes[10])
+            self.assertEqual(len(result.coins), 18)
+            self.assertEqual(result.coins[:3:2], [None, None])
+            height, tx_out = result.coins[1]
+            self.assertEqual((height, tx_out.serialize()), (10, self.spend.tx_outs[1].serialize()))
+            self.assertTrue(all(coin[1].amount == 10 ** 8 for coin in result.coins[3:]))
+            self.assertEqual(server.requests, 2)
@@ -0,0 +1,186 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Union
+
+# import for test below
+from unittest import TestCase
+
+
+# fields of verbose block/header results which change as the chain grows; they are not cached
+MUTABLE_FIELDS = ("confirmations", "nextblockhash")
+
+# default of RpcCache.get() telling a miss from a cached null result
+MISS = object()
+
+
+def strip_mutable(result: Union[dict, str]) -> Union[dict, str]:
+    if isinstance(result, dict):
+        return {key: value for key, value in result.items() if key not in MUTABLE_FIELDS}
+    return result
+
+
+class CacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # json bytes served from the cache instead of the node
+        self.bytes_served = 0
+        # json bytes held in memory, compressed bytes written to disk
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def snapshot(self) -> dict:
+        result = dict(vars(self))
+        result["hit_ratio"] = self.hit_ratio
+        return result
+
+
+class RpcCache:
+    """
+    Two-tier cache of immutable RPC results: an LRU of json-encoded values bounded by memory_bytes,
+    backed by an optional sqlite store of zlib-compressed values that survives restarts.
+    Values are keyed by strings such as "getblock:<hash>:<verbosity>".
+    Height to hash lookups are only cached below the tip by reorg_depth blocks (see confirmed()).
+    """
+    def __init__(self, path: str = None, memory_bytes: int = 64 * 2 ** 20, reorg_depth: int = 6,
+                 tip_ttl: float = 10.0, compress_level: int = 1):
+        """ path: sqlite file of the disk tier (memory only if None); tip_ttl: seconds a known tip height is trusted """
+        self.memory_bytes = memory_bytes
+        self.reorg_depth = reorg_depth
+        self.tip_ttl = tip_ttl
+        self.compress_level = compress_level
+        self.stats = CacheStats()
+        self._lru = OrderedDict()
+        # clients may be shared between threads
+        self._lock = threading.Lock()
+        self._tip = -1
+        self._tip_time = 0.0
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._lru)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+
+    def _remember(self, key: str, encoded: bytes):
+        """ insert into the LRU and evict the least recently used values beyond memory_bytes """
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self.stats.memory_bytes -= len(old)
+        self._lru[key] = encoded
+        self.stats.memory_bytes += len(encoded)
+        while self.stats.memory_bytes > self.memory_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self.stats.memory_bytes -= len(evicted)
+
+    def get(self, key: str, default=None):
+        """ return the cached value, or default on a miss (pass MISS when null results are cached) """
+        with self._lock:
+            encoded = self._lru.get(key)
+            if encoded is not None:
+                self._lru.move_to_end(key)
+                self.stats.memory_hits += 1
+            elif self.db is not None:
+                row = self.db.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    encoded = zlib.decompress(row[0])
+                    self._remember(key, encoded)
+                    self.stats.disk_hits += 1
+            if encoded is None:
+                self.stats.misses += 1
+                return default
+            self.stats.bytes_served += len(encoded)
+        return json.loads(encoded)
+
+    def put(self, key: str, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items: list):
+        """ items: (key, value); the disk tier writes them in one transaction """
+        encoded = [(key, json.dumps(value, separators=(",", ":")).encode()) for key, value in items]
+        rows = None if self.db is None else [(key, zlib.compress(value, self.compress_level)) for key, value in encoded]
+        with self._lock:
+            for key, value in encoded:
+                self._remember(key, value)
+            if rows is not None:
+                with self.db:
+                    self.db.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", rows)
+                self.stats.disk_bytes += sum(len(compressed) for _, compressed in rows)
+
+    def confirmed(self, height: int, fetch_tip: Callable) -> bool:
+        """
+        whether a block at height is buried by reorg_depth blocks, so that its hash can be cached.
+        fetch_tip() (e.g. getblockcount) is only called when the known tip is too low and older than tip_ttl
+        """
+        if height <= self._tip - self.reorg_depth:
+            return True
+        if time.monotonic() - self._tip_time > self.tip_ttl:
+            self._tip = fetch_tip()
+            self._tip_time = time.monotonic()
+        return height <= self._tip - self.reorg_depth
+
+
+class RpcCacheTest(TestCase):
+    def test_lru_and_disk(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            with RpcCache(path, memory_bytes=90) as cache:
+                cache.put("a", "x" * 40)
+                cache.put("b", {"height": 1})
+                self.assertEqual(cache.get("a"), "x" * 40)
+                cache.put("c", "y" * 40)
+                # "b" was the least recently used one
+                self.assertEqual(len(cache), 2)
+                self.assertLessEqual(cache.stats.memory_bytes, 90)
+                self.assertEqual(cache.get("b"), {"height": 1})
+                self.assertEqual(cache.stats.disk_hits, 1)
+                self.assertIsNone(cache.get("d"))
+                self.assertEqual(cache.stats.snapshot()["hit_ratio"], 2 / 3)
+
+            with RpcCache(path) as cache:
+                self.assertEqual(cache.get("c"), "y" * 40)
+                self.assertEqual(cache.stats.disk_hits, 1)
+                cache.put_many([("e", [1, 2]), ("f", None)])
+
+            with RpcCache(path) as cache:
+                self.assertEqual(cache.get("e"), [1, 2])
+                self.assertEqual(cache.stats.disk_hits, 1)
+                # a cached null is a hit, told from a miss by the default
+                self.assertIsNone(cache.get("f", MISS))
+                self.assertIs(cache.get("g", MISS), MISS)
+                self.assertEqual((cache.stats.disk_hits, cache.stats.misses), (2, 1))
+
+    def test_confirmed(self):
+        tips = [100, 101]
+        cache = RpcCache(reorg_depth=6, tip_ttl=0)
+        self.assertTrue(cache.confirmed(94, lambda: tips.pop(0)))
+        self.assertFalse(cache.confirmed(96, lambda: tips.pop(0)))
+        # a known tip high enough is trusted without asking the node
+        self.assertTrue(cache.confirmed(95, lambda: self.fail("tip fetched")))
+        self.assertEqual(strip_mutable({"hash": "00", "confirmations": 3}), {"hash": "00"})
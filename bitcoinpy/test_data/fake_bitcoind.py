@@ -0,0 +1,472 @@
+"""
+Fake bitcoind for tests and reproducible benchmarks: JSON-RPC (single and batch) and binary REST over HTTP/1.1 keep-alive.
+Blocks come from the test_data/blocks fixtures, from raw blocks (e.g. test_data.synthetic) or from a made-up chain;
+other calls are replayed from a cassette recorded against a real node.
+latency delays every response and max_concurrency bounds the requests served at once, like bitcoind's rpcthreads.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bitcoinpy.base.block import Block
+from bitcoinpy.base.header import Header
+from bitcoinpy.crypto.hashes import hash256
+from bitcoinpy.utils.varint import encode_varint
+
+# import for test below
+from unittest import TestCase
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blocks")
+
+# bitcoind rejects getutxos requests of more outpoints
+MAX_GETUTXOS_OUTPOINTS = 15
+
+
+def stub_block_hash(height: int) -> str:
+    """ block hash of height in a made-up chain """
+    return hashlib.sha256(height.to_bytes(8, "little")).digest()[::-1].hex()
+
+
+class ChainData:
+    """
+    Blocks of consecutive heights from start_height; hashes[i] is the hash (big endian hex) of start_height + i.
+    Each block has any of: verbose getblock result, 80-byte header and raw block.
+    """
+    def __init__(self, start_height: int = 0):
+        self.start_height = start_height
+        self.hashes = list()
+        self.heights = dict()
+        self.verbose = dict()
+        self.headers = dict()
+        self.raw_blocks = dict()
+        self._utxos = None
+
+    @property
+    def tip(self) -> int:
+        return self.start_height + len(self.hashes) - 1
+
+    def append(self, block_hash: str, verbose: dict = None, header: bytes = None, raw_block: bytes = None):
+        height = self.start_height + len(self.hashes)
+        self.hashes.append(block_hash)
+        self.heights[block_hash] = height
+        if verbose is not None:
+            self.verbose[block_hash] = verbose
+        if header is not None:
+            self.headers[block_hash] = header
+        if raw_block is not None:
+            self.raw_blocks[block_hash] = raw_block
+        self._utxos = None
+
+    @classmethod
+    def made_up(cls, tip: int):
+        """ hashes from stub_block_hash(); headers hold the height and hash; verbose results only hash and height """
+        chain = cls()
+        for height in range(tip + 1):
+            block_hash = stub_block_hash(height)
+            header = height.to_bytes(4, "little") + bytes.fromhex(block_hash)[::-1] + b"\x00" * 44
+            chain.append(block_hash, {"hash": block_hash, "height": height}, header)
+        return chain
+
+    @classmethod
+    def from_raw_blocks(cls, raw_blocks: list, start_height: int = 0):
+        chain = cls(start_height)
+        for height, raw_block in enumerate(raw_blocks, start_height):
+            block_hash = hash256(raw_block[:80])[::-1].hex()
+            previous = raw_block[4:36][::-1].hex()
+            tx_ids = [tx.tx_id.hex() for tx in Block.iter_raw_transactions(raw_block)]
+            verbose = {"hash": block_hash, "height": height, "previousblockhash": previous, "nTx": len(tx_ids), "tx": tx_ids}
+            chain.append(block_hash, verbose, raw_block[:80], raw_block)
+        return chain
+
+    @classmethod
+    def from_fixtures(cls, directory: str = FIXTURE_DIR):
+        """ verbose getblock results saved as <network>_<height>.json; their heights must be consecutive """
+        blocks = list()
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name)) as f:
+                    blocks.append(json.load(f))
+        blocks.sort(key=lambda block: block["height"])
+        if not blocks:
+            raise Exception("Expected block fixtures in {}, but none".format(directory))
+        chain = cls(blocks[0]["height"])
+        for block in blocks:
+            if block["height"] != chain.tip + 1:
+                raise Exception("Expected fixture of height {}, but {}".format(chain.tip + 1, block["height"]))
+            chain.append(block["hash"], block, Header.from_dict(block).serialize())
+        return chain
+
+    def header_result(self, block_hash: str) -> dict:
+        """ getblockheader verbose result: the header fields of the verbose block """
+        block = self.verbose[block_hash]
+        return {key: value for key, value in block.items() if key not in ("tx", "size", "strippedsize", "weight")}
+
+    def utxos(self) -> dict:
+        """ (tx_id, vout) -> (height, serialized TxOut) after all raw blocks """
+        if self._utxos is None:
+            self._utxos = dict()
+            for block_hash in self.hashes:
+                raw_block = self.raw_blocks.get(block_hash)
+                if raw_block is None:
+                    continue
+                for tx in Block.iter_raw_transactions(raw_block):
+                    if not tx.is_coinbase():
+                        for tx_in in tx.tx_ins:
+                            self._utxos.pop((tx_in.prev_tx, tx_in.prev_index), None)
+                    for vout, tx_out in enumerate(tx.tx_outs):
+                        self._utxos[(tx.tx_id, vout)] = (self.heights[block_hash], tx_out.serialize())
+        return self._utxos
+
+
+class FakeNode:
+    """
+    JSON-RPC and REST dispatch shared by the thread and asyncio servers.
+    cassette: JSON lines of {"method", "params", "result", "error"}; recorded calls are answered first.
+    With upstream (a BasicClient), every call is forwarded to it and recorded into the cassette instead.
+    """
+    def __init__(self, chain: ChainData, rpc_user: str = "admin", rpc_password: str = "0000",
+                 cassette: str = None, upstream=None):
+        self.chain = chain
+        self.auth = "Basic " + base64.b64encode("{}:{}".format(rpc_user, rpc_password).encode()).decode()
+        self.cassette = cassette
+        self.upstream = upstream
+        self.recorded = dict()
+        self._lock = threading.Lock()
+        if cassette is not None and upstream is None and os.path.exists(cassette):
+            with open(cassette) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recorded[self._key(entry["method"], entry["params"])] = (entry["result"], entry["error"])
+
+    @staticmethod
+    def _key(method: str, params: list) -> str:
+        return json.dumps([method, params], separators=(",", ":"))
+
+    def _record(self, method: str, params: list) -> tuple:
+        from bitcoinpy.exceptions import RpcError
+        try:
+            result, error = self.upstream.basic_request(method, params), None
+        except RpcError as e:
+            result, error = None, {"code": e.code, "message": e.message}
+        with self._lock:
+            self.recorded[self._key(method, params)] = (result, error)
+            with open(self.cassette, "a") as f:
+                f.write(json.dumps({"method": method, "params": params, "result": result, "error": error}) + "\n")
+        return result, error
+
+    def _block_call(self, method: str, params: list) -> tuple:
+        chain = self.chain
+        if method == "getblockhash":
+            if chain.start_height <= params[0] <= chain.tip:
+                return chain.hashes[params[0] - chain.start_height], None
+            return None, {"code": -8, "message": "Block height out of range"}
+        if method == "getbestblockhash":
+            return chain.hashes[-1], None
+        if method == "getblockcount":
+            return chain.tip, None
+
+        block_hash = params[0]
+        if block_hash not in chain.heights:
+            return None, {"code": -5, "message": "Block not found"}
+        # both default to verbose output
+        verbose = params[1] if len(params) > 1 else True
+        if method == "getblockheader":
+            if verbose and block_hash in chain.verbose:
+                return chain.header_result(block_hash), None
+            if not verbose and block_hash in chain.headers:
+                return chain.headers[block_hash].hex(), None
+        elif verbose == 0 and block_hash in chain.raw_blocks:
+            return chain.raw_blocks[block_hash].hex(), None
+        elif verbose == 1 and block_hash in chain.verbose:
+            return chain.verbose[block_hash], None
+        return None, {"code": -1, "message": "Block data not available in this fake node"}
+
+    def call(self, request: dict) -> dict:
+        method, params = request["method"], request.get("params", [])
+        if self.upstream is not None:
+            result, error = self._record(method, params)
+        elif self._key(method, params) in self.recorded:
+            result, error = self.recorded[self._key(method, params)]
+        elif method in ("getblockhash", "getbestblockhash", "getblockcount", "getblockheader", "getblock"):
+            result, error = self._block_call(method, params)
+        else:
+            result, error = None, {"code": -32601, "message": "Method not found"}
+        return {"result": result, "error": error, "id": request.get("id")}
+
+    def handle(self, body: bytes, authorization: str) -> tuple:
+        """ JSON-RPC POST; return (HTTP status, response body) """
+        if authorization != self.auth:
+            # bitcoind answers 401 without body
+            return 401, b""
+        request = json.loads(body)
+        if isinstance(request, list):
+            # batch: always 200 with an error per item
+            return 200, json.dumps([self.call(item) for item in request]).encode()
+        response = self.call(request)
+        if response["error"] is None:
+            status = 200
+        else:
+            status = 404 if response["error"]["code"] == -32601 else 500
+        return status, json.dumps(response).encode()
+
+    def rest(self, path: str) -> tuple:
+        """ binary REST GET (block, headers, blockhashbyheight, getutxos); return (HTTP status, body) """
+        chain = self.chain
+        parts = path.split("?")[0].split("/")[2:]
+        if not parts or not parts[-1].endswith(".bin"):
+            return 400, b"Output format not supported"
+        parts[-1] = parts[-1][:-4]
+        if parts[0] == "block" and len(parts) == 2:
+            raw_block = chain.raw_blocks.get(parts[1])
+            return (404, b"Block not found") if raw_block is None else (200, raw_block)
+        if parts[0] == "headers" and len(parts) == 3:
+            if parts[2] not in chain.headers:
+                return 404, b"Block not found"
+            start = chain.heights[parts[2]] - chain.start_height
+            return 200, b"".join(chain.headers[block_hash] for block_hash in chain.hashes[start:start + int(parts[1])])
+        if parts[0] == "blockhashbyheight" and len(parts) == 2:
+            height = int(parts[1])
+            if not chain.start_height <= height <= chain.tip:
+                return 404, b"Block height out of range"
+            return 200, bytes.fromhex(chain.hashes[height - chain.start_height])[::-1]
+        if parts[0] == "getutxos":
+            outpoints = [part.split("-") for part in parts[1:] if part != "checkmempool"]
+            if not outpoints:
+                return 400, b"Error: empty request"
+            if len(outpoints) > MAX_GETUTXOS_OUTPOINTS:
+                return 400, "Error: max outpoints exceeded (max: {}, tried: {})".format(MAX_GETUTXOS_OUTPOINTS, len(outpoints)).encode()
+            coins, bitmap = list(), bytearray((len(outpoints) + 7) // 8)
+            for i, (tx_id, vout) in enumerate(outpoints):
+                coin = chain.utxos().get((bytes.fromhex(tx_id), int(vout)))
+                if coin is not None:
+                    bitmap[i // 8] |= 1 << (i % 8)
+                    coins.append((0).to_bytes(4, "little") + coin[0].to_bytes(4, "little") + coin[1])
+            result = chain.tip.to_bytes(4, "little") + bytes.fromhex(chain.hashes[-1])[::-1]
+            result += encode_varint(len(bitmap)) + bytes(bitmap) + encode_varint(len(coins)) + b"".join(coins)
+            return 200, result
+        return 400, b"Invalid URI format"
+
+
+def http_response(status: int, data: bytes, content_type: str = "application/json") -> bytes:
+    reason = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}[status]
+    head = "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n".format(status, reason, content_type, len(data))
+    return head.encode() + data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _serve(self, respond):
+        with self.server.lock:
+            self.server.requests += 1
+        with self.server.workers:
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            try:
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                response = respond()
+            finally:
+                with self.server.lock:
+                    self.server.in_flight -= 1
+        # headers and body in one segment
+        self.wfile.write(response)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self._serve(lambda: http_response(*self.server.node.handle(body, self.headers.get("Authorization"))))
+
+    def do_GET(self):
+        def respond() -> bytes:
+            status, data = self.server.node.rest(self.path)
+            return http_response(status, data, "application/octet-stream" if status == 200 else "text/plain")
+        self._serve(respond)
+
+
+class FakeBitcoind(ThreadingHTTPServer):
+    """ thread per connection; counts connections, requests and the peak of requests in flight """
+    daemon_threads = True
+
+    def __init__(self, chain: ChainData = None, rpc_user: str = "admin", rpc_password: str = "0000",
+                 latency: float = 0.0, max_concurrency: int = None, cassette: str = None, upstream=None):
+        """ chain: the fixtures if None; max_concurrency: requests served at once, others wait (None: unbounded) """
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.node = FakeNode(ChainData.from_fixtures() if chain is None else chain, rpc_user, rpc_password, cassette, upstream)
+        self.latency = latency
+        self.workers = threading.BoundedSemaphore(max_concurrency) if max_concurrency else nullcontext()
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def chain(self) -> ChainData:
+        return self.node.chain
+
+    @property
+    def heights(self) -> dict:
+        return self.node.chain.heights
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+
+class AsyncFakeBitcoind:
+    """ asyncio version of FakeBitcoind (JSON-RPC only) """
+    def __init__(self, chain: ChainData = None, rpc_user: str = "admin", rpc_password: str = "0000",
+                 latency: float = 0.0, max_concurrency: int = None, cassette: str = None):
+        self.node = FakeNode(ChainData.from_fixtures() if chain is None else chain, rpc_user, rpc_password, cassette)
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.connections = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server = None
+        self._workers = None
+        self._tasks = set()
+
+    @property
+    def chain(self) -> ChainData:
+        return self.node.chain
+
+    @property
+    def heights(self) -> dict:
+        return self.node.chain.heights
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self._server.sockets[0].getsockname()[1])
+
+    async def __aenter__(self):
+        self._workers = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._server.close()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _respond(self, body: bytes, authorization: str) -> bytes:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return http_response(*self.node.handle(body, authorization))
+        finally:
+            self.in_flight -= 1
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                self.requests += 1
+                if self._workers is None:
+                    response = await self._respond(body, headers.get("authorization"))
+                else:
+                    async with self._workers:
+                        response = await self._respond(body, headers.get("authorization"))
+                writer.write(response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._tasks.discard(task)
+            writer.close()
+
+
+class FakeBitcoindTest(TestCase):
+    def test_fixtures(self):
+        from bitcoinpy.client import BitcoinClient
+        from bitcoinpy.rest_client import RestClient
+        with FakeBitcoind() as server, BitcoinClient(server.url, "admin", "0000") as cli, RestClient(server.url) as rest:
+            self.assertEqual(cli.get_latest_height(), 684034)
+            block = cli.get_block_by_height(684033)
+            self.assertEqual(block["nTx"], len(block["tx"]))
+            header = Header.from_raw_str(cli.get_block_header_by_height(684033))
+            self.assertEqual(header.hash.bytes_as_be.hex(), block["hash"])
+            self.assertEqual(cli.get_block_header_by_hash(block["hash"], True)["merkleroot"], block["merkleroot"])
+            self.assertEqual([h.hash.bytes_as_be.hex() for h in rest.get_headers(cli.get_block_hash_by_height(684032), 5)],
+                             server.chain.hashes)
+            # raw transactions are not part of the fixtures
+            from bitcoinpy.exceptions import RpcError
+            with self.assertRaises(RpcError) as context:
+                cli.get_block_by_hash(block["hash"], 0)
+            self.assertEqual(context.exception.code, -1)
+
+    def test_record_and_replay(self):
+        import tempfile
+        from bitcoinpy.client import BasicClient, BitcoinClient
+        with tempfile.TemporaryDirectory() as directory:
+            cassette = os.path.join(directory, "calls.jsonl")
+            with FakeBitcoind(ChainData.made_up(10)) as node, BasicClient(node.url, "admin", "0000") as upstream:
+                with FakeBitcoind(ChainData(), cassette=cassette, upstream=upstream) as recorder:
+                    with BitcoinClient(recorder.url, "admin", "0000") as cli:
+                        self.assertEqual(cli.get_block_hash_by_height(3), stub_block_hash(3))
+                        self.assertEqual(cli.batch_request([("getblockcount", []), ("getblockhash", [11])], raise_on_error=False)[0], 10)
+
+            with FakeBitcoind(ChainData(), cassette=cassette) as replayer, BitcoinClient(replayer.url, "admin", "0000") as cli:
+                self.assertEqual(cli.get_block_hash_by_height(3), stub_block_hash(3))
+                self.assertEqual(cli.basic_request("getblockcount", []), 10)
+                results = cli.batch_request([("getblockhash", [11]), ("getblockhash", [4])], raise_on_error=False)
+                self.assertEqual(results[0].code, -8)
+                self.assertEqual(results[1].code, -8)  # not recorded; the empty chain has no height 4
+
+    def test_concurrency_limit(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from bitcoinpy.client import BitcoinClient, ConnectionPool
+        with FakeBitcoind(ChainData.made_up(100), latency=0.01, max_concurrency=2) as server:
+            with ConnectionPool(pool_size=8) as pool:
+                cli = BitcoinClient(server.url, "admin", "0000", pool=pool)
+                with ThreadPoolExecutor(8) as executor:
+                    hashes = list(executor.map(cli.get_block_hash_by_height, range(40)))
+                self.assertEqual(hashes, [stub_block_hash(height) for height in range(40)])
+                self.assertEqual(server.max_in_flight, 2)
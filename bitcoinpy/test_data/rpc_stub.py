@@ -0,0 +1,17 @@
+""" stand-ins of the bitcoind endpoint used by the client tests and benchmarks: FakeBitcoind over a made-up chain or raw blocks """
+from bitcoinpy.test_data.fake_bitcoind import AsyncFakeBitcoind, ChainData, FakeBitcoind, stub_block_hash
+
+
+def _chain(tip: int, raw_blocks: list) -> ChainData:
+    return ChainData.made_up(tip) if raw_blocks is None else ChainData.from_raw_blocks(raw_blocks)
+
+
+class RpcStubServer(FakeBitcoind):
+    def __init__(self, rpc_user: str = "admin", rpc_password: str = "0000", tip: int = 1000, raw_blocks: list = None,
+                 latency: float = 0.0):
+        super().__init__(_chain(tip, raw_blocks), rpc_user, rpc_password, latency)
+
+
+class AsyncRpcStubServer(AsyncFakeBitcoind):
+    def __init__(self, rpc_user: str = "admin", rpc_password: str = "0000", tip: int = 1000, latency: float = 0.0):
+        super().__init__(_chain(tip, None), rpc_user, rpc_password, latency)
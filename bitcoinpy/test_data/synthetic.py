@@ -0,0 +1,66 @@
+""" builders of synthetic (structurally valid, not mined) transactions and blocks for tests and benchmarks """
+from bitcoinpy.base.merkle_tree import BTCMerkleTree
+from bitcoinpy.base.script import Script
+from bitcoinpy.base.transaction import Transaction, TxIn, TxOut
+from bitcoinpy.crypto.hashes import hash256
+from bitcoinpy.utils.varint import encode_varint
+
+
+def p2pkh_script(h160: bytes) -> Script:
+    return Script([0x76, 0xa9, h160, 0x88, 0xac])
+
+
+def p2wpkh_script(h160: bytes) -> Script:
+    return Script([0x00, h160])
+
+
+def coinbase_tx(height: int, amount: int = 50 * 10**8) -> Transaction:
+    height_bytes = height.to_bytes((height.bit_length() + 8) // 8, "little")
+    script_sig = Script([-1, encode_varint(len(height_bytes)) + height_bytes + b"bitcoinpy"])
+    tx_in = TxIn(b"\x00" * 32, 0xffffffff, script_sig)
+    tx_out = TxOut(amount, p2pkh_script(hash256(height_bytes)[:20]))
+    return Transaction([tx_in], [tx_out], 1, 0)
+
+
+def spend_tx(seed: int, num_inputs: int = 2, num_outputs: int = 2, segwit: bool = True) -> Transaction:
+    """ transaction spending made-up outpoints; witness carries a dummy signature and pubkey """
+    tx_ins = list()
+    for i in range(num_inputs):
+        prev_tx = hash256(seed.to_bytes(8, "little") + i.to_bytes(4, "little"))
+        if segwit:
+            tx_in = TxIn(prev_tx, i)
+            tx_in.witness = [b"\x30" * 71, b"\x02" + prev_tx]
+        else:
+            tx_in = TxIn(prev_tx, i, Script([b"\x30" * 71, b"\x02" + prev_tx]))
+        tx_ins.append(tx_in)
+    tx_outs = list()
+    for i in range(num_outputs):
+        h160 = hash256(seed.to_bytes(8, "little") + b"out" + i.to_bytes(4, "little"))[:20]
+        script = p2wpkh_script(h160) if segwit else p2pkh_script(h160)
+        tx_outs.append(TxOut(10000 + seed + i, script))
+    return Transaction(tx_ins, tx_outs, 2, 0)
+
+
+def build_raw_block(transactions: list, prev_hash: bytes = b"\x00" * 32, nonce: int = 0) -> bytes:
+    """ serialize header (with a valid merkle root) and transactions; prev_hash is in big endian """
+    tx_ids = [tx.tx_id.hex() for tx in transactions]
+    merkle_root = BTCMerkleTree.from_big_hex_list(tx_ids).root.bytes_as_le
+    header = (2).to_bytes(4, "little") + prev_hash[::-1] + merkle_root
+    header += (1600000000).to_bytes(4, "little") + bytes.fromhex("1d00ffff")[::-1] + nonce.to_bytes(4, "little")
+    result = header + encode_varint(len(transactions))
+    for tx in transactions:
+        result += tx.serialize()
+    return result
+
+
+def build_chain(num_blocks: int, txs_per_block: int = 10, segwit: bool = True) -> list:
+    """ return list of raw blocks linked by prev_hash """
+    raw_blocks = list()
+    prev_hash = b"\x00" * 32
+    for height in range(num_blocks):
+        txs = [coinbase_tx(height)]
+        txs += [spend_tx(height * txs_per_block + i, segwit=segwit) for i in range(txs_per_block - 1)]
+        raw = build_raw_block(txs, prev_hash, height)
+        raw_blocks.append(raw)
+        prev_hash = hash256(raw[:80])[::-1]
+    return raw_blocks
@@ -1,5 +1,4 @@
 from io import BytesIO
-from bitcoinpy.base.bytes import BTCBytes
 
 
 # TODO need to test
@@ -9,13 +8,13 @@ def read_varint(s: BytesIO) -> int:
     i = s.read(1)[0]
     if i == 0xfd:
         # 0xfd means the next two bytes are the number
-        return BTCBytes(s.read(2)).int
+        return int.from_bytes(s.read(2), 'little')
     elif i == 0xfe:
         # 0xfe means the next four bytes are the number
-        return BTCBytes(s.read(4)).int
+        return int.from_bytes(s.read(4), 'little')
     elif i == 0xff:
         # 0xff means the next eight bytes are the number
-        return BTCBytes(s.read(8)).int
+        return int.from_bytes(s.read(8), 'little')
     else:
         # anything else is just the integer
         return i
@@ -34,3 +33,39 @@ def encode_varint(i: int) -> bytes:
     else:
         raise ValueError('integer too large: {}'.format(i))
 
+
+def read_varint_at(data: bytes, pos: int) -> tuple:
+    '''read_varint_at reads a variable integer at the position of a buffer and returns (integer, next position)'''
+    i = data[pos]
+    if i == 0xfd:
+        return int.from_bytes(data[pos + 1:pos + 3], 'little'), pos + 3
+    elif i == 0xfe:
+        return int.from_bytes(data[pos + 1:pos + 5], 'little'), pos + 5
+    elif i == 0xff:
+        return int.from_bytes(data[pos + 1:pos + 9], 'little'), pos + 9
+    else:
+        return i, pos + 1
+
+
+def varint_size(i: int) -> int:
+    '''returns the number of bytes of the varint encoding of an integer'''
+    if i < 0xfd:
+        return 1
+    elif i < 0x10000:
+        return 3
+    elif i < 0x100000000:
+        return 5
+    elif i < 0x10000000000000000:
+        return 9
+    else:
+        raise ValueError('integer too large: {}'.format(i))
+
+
+def write_varint_into(buf: bytearray, offset: int, i: int) -> int:
+    '''writes the varint encoding of an integer into the buffer at the offset and returns the next offset'''
+    if i < 0xfd:
+        buf[offset] = i
+        return offset + 1
+    encoded = encode_varint(i)
+    buf[offset:offset + len(encoded)] = encoded
+    return offset + len(encoded)
@@ -4,5 +4,5 @@ setup(
     name="bitcoinpy",
     version="0.1",
     packages=find_packages(),
-    install_requires=["base58", "requests", "setuptools", "toml"]
+    install_requires=["base58", "numpy", "requests", "setuptools", "toml"]
 )